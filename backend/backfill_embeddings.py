@@ -0,0 +1,39 @@
+# Calcula en lotes los embeddings de los cuentos que no lo tienen
+# Uso (desde backend):  python backfill_embeddings.py [--batch-size N] [--concurrency N] [--limit N] [--restart]
+# Si se interrumpe, volver a ejecutarlo continúa desde el último checkpoint.
+# Con la API en marcha es preferible POST /api/jobs/embedding-backfill (mismo proceso).
+
+import argparse
+import asyncio
+
+from config import EMBEDDING_BACKFILL_BATCH_SIZE, EMBEDDING_BACKFILL_CONCURRENCY
+from models.database_sqlite import init_db
+from services.embedding_backfill import EmbeddingBackfill
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Backfill de embeddings de los cuentos pendientes")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BACKFILL_BATCH_SIZE,
+                        help="Textos por petición de embed_content (máx. 100)")
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_BACKFILL_CONCURRENCY,
+                        help="Peticiones batch simultáneas")
+    parser.add_argument("--limit", type=int, default=None, help="Parar tras N cuentos")
+    parser.add_argument("--restart", action="store_true", help="Ignorar el checkpoint y empezar de cero")
+    args = parser.parse_args()
+
+    init_db()
+    # El índice RAG de la API se actualiza solo al sincronizar por embedding_updated_at
+    backfill = EmbeddingBackfill(
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        add_to_index=lambda *a: None,
+    )
+    state = await backfill.run(restart=args.restart, limit=args.limit)
+    if not state["finished_at"]:
+        print(f"⏸️ Parado tras {state['processed']}/{state['total']} cuentos; vuelve a ejecutarlo para continuar")
+    if state["failed"]:
+        print(f"⚠️ {len(state['failed'])} cuentos fallaron; se reintentarán en la próxima ejecución completa")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
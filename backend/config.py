@@ -15,14 +15,109 @@ DATABASE_URL = os.getenv(
     "DATABASE_URL", "sqlite:///./cuentacuentos.db"
 )
 
+# Ruta del fichero SQLite (vacía si la BD no es SQLite o es en memoria)
+SQLITE_DB_PATH = DATABASE_URL.replace("sqlite:///", "") if DATABASE_URL.startswith("sqlite:///") else ""
+
+# PostgreSQL: pool de conexiones y búsqueda vectorial en la BD con pgvector
+# (halfvec + índice HNSW en story_vectors / story_chunk_vectors). VECTOR_BACKEND
+# "pgvector" por defecto con PostgreSQL; "memory" usa el índice NumPy en proceso.
+IS_POSTGRES = DATABASE_URL.startswith("postgresql")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pgvector" if IS_POSTGRES else "memory")
+PGVECTOR_DIM = int(os.getenv("PGVECTOR_DIM", "3072"))  # Dimensión de gemini-embedding-001
+PGVECTOR_HNSW_M = int(os.getenv("PGVECTOR_HNSW_M", "16"))
+PGVECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("PGVECTOR_HNSW_EF_CONSTRUCTION", "64"))
+PGVECTOR_EF_SEARCH = int(os.getenv("PGVECTOR_EF_SEARCH", "100"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
+# Perfil de SQLite: "production" (WAL, synchronous=NORMAL, mmap y cache, para
+# peticiones concurrentes y jobs en background) o "default" (ajustes de SQLite)
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # Espera ante "database is locked"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+SQLITE_CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", "64"))  # Por conexión
+
+# Migraciones de esquema (models/migrations.py): filas por transacción en las
+# migraciones de datos, para no bloquear la BD durante todo el arranque
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "500"))
+
 # Paths para archivos JSON
 STYLE_GUIDE_PATH = DATA_DIR / "style_guide.json"
 CHARACTERS_PATH = DATA_DIR / "characters.json"
 STYLE_PROFILE_PATH = DATA_DIR / "style_profile.json"
 LEARNING_HISTORY_PATH = DATA_DIR / "learning_history.json"
 
+# RAG - Índice vectorial
+# Por debajo de RAG_ANN_MIN_STORIES se usa búsqueda exacta (fuerza bruta);
+# por encima, un índice aproximado IVF-Flat persistido junto a la BD
+RAG_ANN_MIN_STORIES = int(os.getenv("RAG_ANN_MIN_STORIES", "5000"))
+RAG_IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))  # 0 = automático (≈ sqrt(N))
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+# RAG multi-vector: los cuentos se parten en fragmentos de párrafo con su propio
+# embedding (tabla story_chunks) y la similitud de un cuento agrega la de sus
+# fragmentos: "max" (mejor fragmento) o "mean_top" (media de los RAG_CHUNK_TOP_N mejores)
+STORY_CHUNK_MAX_CHARS = int(os.getenv("STORY_CHUNK_MAX_CHARS", "1200"))
+STORY_CHUNK_MIN_CHARS = int(os.getenv("STORY_CHUNK_MIN_CHARS", "300"))
+RAG_CHUNK_AGGREGATE = os.getenv("RAG_CHUNK_AGGREGATE", "max")
+RAG_CHUNK_TOP_N = int(os.getenv("RAG_CHUNK_TOP_N", "2"))
+# Búsqueda híbrida: ranking BM25 (FTS5) fusionado con el semántico por reciprocal
+# rank fusion; si el embedding del tema falla o tarda más del límite, solo léxica
+RAG_HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "true").lower() == "true"
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "5"))  # candidatos por ranking = top_k x N
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+RAG_EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("RAG_EMBEDDING_TIMEOUT_SECONDS", "5"))
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH") or (
+    str(Path(SQLITE_DB_PATH).with_suffix(".vectors.npz")) if SQLITE_DB_PATH else ""
+)
+# Formato binario de los embeddings guardados en la BD: float32 o float16 (mitad de tamaño)
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")
+GEMINI_EMBEDDING_MODEL = os.getenv("GEMINI_EMBEDDING_MODEL", "models/gemini-embedding-001")
+# Backfill de embeddings: cuentos por lote (una petición batch de embed_content) y lotes en paralelo
+EMBEDDING_BACKFILL_BATCH_SIZE = int(os.getenv("EMBEDDING_BACKFILL_BATCH_SIZE", "50"))
+EMBEDDING_BACKFILL_CONCURRENCY = int(os.getenv("EMBEDDING_BACKFILL_CONCURRENCY", "2"))
+
+# Cache de embeddings de temas: LRU en memoria + tabla theme_embeddings en la BD
+THEME_CACHE_MAX_ENTRIES = int(os.getenv("THEME_CACHE_MAX_ENTRIES", "1000"))
+THEME_CACHE_MAX_BYTES = int(os.getenv("THEME_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+THEME_CACHE_TTL_SECONDS = int(os.getenv("THEME_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))  # 0 = sin caducidad
+
+# Cola de jobs en background (tabla jobs en la BD)
+# JOBS_INPROCESS_WORKER=false si se ejecuta `python worker.py` como proceso aparte
+JOBS_INPROCESS_WORKER = os.getenv("JOBS_INPROCESS_WORKER", "true").lower() in ("1", "true", "yes")
+JOBS_MAX_CONCURRENCY = int(os.getenv("JOBS_MAX_CONCURRENCY", "2"))
+JOBS_LEASE_SECONDS = int(os.getenv("JOBS_LEASE_SECONDS", "120"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "2"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+JOBS_BACKOFF_BASE_SECONDS = float(os.getenv("JOBS_BACKOFF_BASE_SECONDS", "10"))
+JOBS_BACKOFF_MAX_SECONDS = float(os.getenv("JOBS_BACKOFF_MAX_SECONDS", "1800"))
+
+# Síntesis de lecciones: se agrupan las críticas nuevas que llegan dentro de la
+# ventana y solo se envían al modelo las que aún no se han sintetizado
+SYNTHESIS_MIN_CRITIQUES = int(os.getenv("SYNTHESIS_MIN_CRITIQUES", "2"))
+SYNTHESIS_DEBOUNCE_SECONDS = float(os.getenv("SYNTHESIS_DEBOUNCE_SECONDS", "60"))
+SYNTHESIS_MAX_BATCH = int(os.getenv("SYNTHESIS_MAX_BATCH", "10"))
+# POST /learning/synthesize espera a que termine el job hasta este tiempo (luego responde 202)
+SYNTHESIS_WAIT_SECONDS = float(os.getenv("SYNTHESIS_WAIT_SECONDS", "120"))
+
+# Lecciones y perfil de estilo (tablas lessons y style_profile_versions): cada
+# proceso los cachea en memoria y revisa si cambiaron en la BD como mucho cada
+# LEARNING_RELOAD_CHECK_SECONDS; se conservan las últimas STYLE_PROFILE_MAX_VERSIONS
+LEARNING_RELOAD_CHECK_SECONDS = float(os.getenv("LEARNING_RELOAD_CHECK_SECONDS", "2"))
+STYLE_PROFILE_MAX_VERSIONS = int(os.getenv("STYLE_PROFILE_MAX_VERSIONS", "50"))
+
 # API Keys
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Máximo de llamadas simultáneas a Gemini por proceso
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+# Cache de contexto de Gemini para el prefijo estable del prompt de cuentos
+# (guía de estilo + lecciones). Si la API la rechaza se envía el prompt completo.
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() == "true"
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Cache de respuestas deterministas (crítica y plantilla de ilustraciones) en la
+# tabla gemini_responses, acotado a GEMINI_RESPONSE_CACHE_MAX_BYTES
+GEMINI_RESPONSE_CACHE = os.getenv("GEMINI_RESPONSE_CACHE", "true").lower() == "true"
+GEMINI_RESPONSE_CACHE_MAX_BYTES = int(os.getenv("GEMINI_RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
 
 # ElevenLabs Configuration
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY", "")
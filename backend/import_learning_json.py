@@ -0,0 +1,29 @@
+# Importa learning_history.json y style_profile.json a la BD
+# Uso (desde backend):  python import_learning_json.py [--force] [--history RUTA] [--profile RUTA]
+# La API y el worker lo ejecutan al arrancar la primera vez; --force vuelve a
+# importar lecciones que falten aunque ya se hubiera hecho (sin duplicar).
+
+import argparse
+
+from config import LEARNING_HISTORY_PATH, STYLE_PROFILE_PATH
+from models.database_sqlite import init_db
+from services.learning_service import learning_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa las lecciones y el perfil de estilo desde JSON")
+    parser.add_argument("--history", default=str(LEARNING_HISTORY_PATH))
+    parser.add_argument("--profile", default=str(STYLE_PROFILE_PATH))
+    parser.add_argument("--force", action="store_true", help="Importar aunque ya se hubiera hecho")
+    args = parser.parse_args()
+
+    init_db()
+    result = learning_service.import_legacy_json(args.history, args.profile, force=args.force)
+    if result["skipped"]:
+        print("ℹ️ Los JSON ya se importaron antes (usa --force para repetir)")
+    else:
+        print(f"📥 Lecciones importadas: {result['lessons']} · perfil importado: {'sí' if result['profile'] else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 # Aplicación FastAPI principal - API REST pura para arquitectura frontend independiente
 import os
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from config import APP_TITLE, APP_DESCRIPTION, APP_VERSION
-from routers import stories, characters, critiques, learning, rag, audio, auth
+from config import APP_TITLE, APP_DESCRIPTION, APP_VERSION, JOBS_INPROCESS_WORKER
+from routers import stories, characters, critiques, learning, rag, audio, auth, jobs, cache
 from services.character_service import character_service
 from services.prompt_service import prompt_service
 from services.gemini_service import gemini_service
@@ -27,6 +28,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],  # Tiempos por paso de /stories/generate
 )
 
 # Incluir router de autenticación en la raíz
@@ -40,10 +42,16 @@ app.include_router(critiques.router, prefix=API_PREFIX)
 app.include_router(learning.router, prefix=API_PREFIX)
 app.include_router(rag.router, prefix=API_PREFIX)
 app.include_router(audio.router, prefix=API_PREFIX)
+app.include_router(jobs.router, prefix=API_PREFIX)
+app.include_router(cache.router, prefix=API_PREFIX)
+
+# Worker de jobs dentro del proceso de la API (si no se usa worker.py aparte)
+_job_worker_stop = asyncio.Event()
+_job_worker_task = None
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     """Inicialización de la aplicación"""
     # Pre-cargar datos en memoria para mejor rendimiento
     character_service.load_characters()
@@ -53,6 +61,43 @@ def on_startup():
     from models.database_sqlite import init_db
     init_db()
 
+    # Importar lecciones y perfil de estilo desde los JSON antiguos (solo la primera vez)
+    from services.learning_service import learning_service
+    learning_service.import_legacy_json()
+
+    # Marca de agua de la síntesis de lecciones (las críticas previas cuentan como sintetizadas)
+    from services.synthesis_scheduler import synthesis_scheduler
+    synthesis_scheduler.initialize()
+
+    # Construir el índice vectorial de RAG en memoria
+    from services.rag_service import rag_service
+    rag_service.build_index()
+
+    # Drenar la cola de jobs (críticas, embeddings, síntesis)
+    if JOBS_INPROCESS_WORKER:
+        global _job_worker_task
+        from services.jobs import create_worker
+        _job_worker_task = asyncio.create_task(create_worker().run(_job_worker_stop))
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Persistir estado en memoria antes de parar el proceso"""
+    if _job_worker_task is not None:
+        _job_worker_stop.set()
+        try:
+            # Los jobs que no terminen a tiempo se cancelan; su lease caduca y se reintentan
+            await asyncio.wait_for(_job_worker_task, timeout=10)
+        except asyncio.TimeoutError:
+            print("[JobWorker] ⏱️ Jobs en curso cancelados al parar; se reintentarán")
+
+    from services.rag_service import rag_service
+    rag_service.save_index()
+
+    # Cerrar las conexiones aiosqlite (cada una tiene su hilo)
+    from models.database_sqlite import async_engine
+    await async_engine.dispose()
+
 
 @app.get("/", tags=["Health"])
 def root():
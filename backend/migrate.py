@@ -0,0 +1,33 @@
+# Aplica las migraciones de esquema pendientes (las mismas que init_db al arrancar)
+# Uso (desde backend):  python migrate.py [--status] [--batch-size N]
+# Con una BD grande conviene ejecutarlo antes de desplegar para que la API
+# arranque sin migraciones de datos pendientes.
+
+import argparse
+
+from config import MIGRATION_BATCH_SIZE
+from models.database_sqlite import engine, init_db
+from models.migrations import MIGRATIONS, current_version, pending_migrations, run_migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migraciones versionadas del esquema")
+    parser.add_argument("--status", action="store_true", help="Solo mostrar la versión y las pendientes")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE,
+                        help="Filas por transacción en las migraciones de datos")
+    args = parser.parse_args()
+
+    pending = pending_migrations(engine)
+    print(f"📦 Esquema en versión {current_version(engine)} de {MIGRATIONS[-1].version}")
+    for migration in pending:
+        print(f"  ⏳ {migration.version} {migration.name}")
+    if args.status or not pending:
+        return
+
+    run_migrations(engine, batch_size=args.batch_size)
+    init_db()  # Tablas nuevas, FTS5 / pgvector
+    print(f"✅ Esquema en versión {current_version(engine)}")
+
+
+if __name__ == "__main__":
+    main()
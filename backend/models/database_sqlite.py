@@ -4,34 +4,121 @@
 import os
 import uuid
 from datetime import datetime
+from typing import Any, Callable, Dict, Optional, TypeVar, Union
 from dotenv import load_dotenv
 from sqlalchemy import (
     create_engine,
+    event,
+    text,
     Column,
     Integer,
     String,
     Text,
     Boolean,
     DateTime,
+    Float,
     ForeignKey,
+    Index,
     JSON,
+    LargeBinary,
 )
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, deferred, sessionmaker, undefer_group
+from config import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    PGVECTOR_DIM,
+    PGVECTOR_HNSW_EF_CONSTRUCTION,
+    PGVECTOR_HNSW_M,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_SIZE_MB,
+    SQLITE_MMAP_SIZE_MB,
+    SQLITE_PROFILE,
+    SQLITE_SYNCHRONOUS,
+)
 
 # Cargar variables de entorno PRIMERO
 load_dotenv()
 
+T = TypeVar("T")
+
 # --- Database Configuration ---
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cuentacuentos.db")
 
-# Configuración específica para SQLite
-connect_args = {}
-if DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+def sqlite_pragmas(profile: str = SQLITE_PROFILE) -> Dict[str, Any]:
+    """
+    PRAGMAs que se aplican a cada conexión SQLite del pool según el perfil:
+    "production" activa WAL (los lectores no esperan al escritor),
+    synchronous=NORMAL, busy_timeout, mmap y cache; "default" solo busy_timeout.
+    """
+    pragmas: Dict[str, Any] = {"busy_timeout": SQLITE_BUSY_TIMEOUT_MS}
+    if profile == "production":
+        pragmas.update({
+            "journal_mode": "WAL",
+            "synchronous": SQLITE_SYNCHRONOUS,
+            "mmap_size": SQLITE_MMAP_SIZE_MB * 1024 * 1024,
+            "cache_size": -SQLITE_CACHE_SIZE_MB * 1024,  # Negativo = KiB
+            "temp_store": "MEMORY",
+        })
+    return pragmas
+
+
+def _apply_sqlite_pragmas(sync_engine, profile: str):
+    pragmas = sqlite_pragmas(profile)
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+
+def _pool_options(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Pool para servidores de BD: conexiones reutilizadas y comprobadas antes de usarse."""
+    options = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_pre_ping": True}
+    options.update(kwargs)
+    return options
+
+
+def create_db_engine(url: str = DATABASE_URL, profile: str = SQLITE_PROFILE, **kwargs):
+    """Crea el engine; en SQLite aplica los PRAGMAs del perfil al abrir cada conexión."""
+    if not url.startswith("sqlite"):
+        return create_engine(url, **_pool_options(kwargs))
+
+    new_engine = create_engine(url, connect_args={"check_same_thread": False}, **kwargs)
+    _apply_sqlite_pragmas(new_engine, profile)
+    return new_engine
+
+
+def create_async_db_engine(url: str = DATABASE_URL, profile: str = SQLITE_PROFILE, **kwargs) -> AsyncEngine:
+    """
+    Engine async sobre la misma BD (sqlite:// → sqlite+aiosqlite://, con los
+    mismos PRAGMAs; postgresql:// → asyncpg): las esperas de disco no
+    bloquean el event loop.
+    """
+    if url.startswith("sqlite://"):
+        url = url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    else:
+        # postgresql:// o postgresql+psycopg2:// → driver async asyncpg
+        url = "postgresql+asyncpg://" + url.split("://", 1)[1] if url.startswith("postgresql") else url
+        kwargs = _pool_options(kwargs)
+    new_engine = create_async_engine(url, **kwargs)
+    if new_engine.dialect.name == "sqlite":
+        _apply_sqlite_pragmas(new_engine.sync_engine, profile)
+    return new_engine
+
+
+engine = create_db_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Sesiones async para las rutas async def (expire_on_commit=False: los objetos
+# siguen legibles tras el commit sin otra consulta)
+async_engine = create_async_db_engine(DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -42,17 +129,191 @@ class Story(Base):
     """Tabla Maestra de Cuentos"""
 
     __tablename__ = "stories"
+    # Orden de la biblioteca y paginación keyset (created_at, id), también
+    # filtrando por is_seed
+    __table_args__ = (
+        Index("ix_stories_created_at_id", "created_at", "id"),
+        Index("ix_stories_is_seed_created_at_id", "is_seed", "created_at", "id"),
+    )
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     title = Column(String(255))
     content = Column(Text, nullable=False)
     version = Column(Integer, default=1)
     is_seed = Column(Boolean, default=False)
-    # En SQLite guardamos el embedding como JSON en lugar de Vector
-    embedding_json = Column(JSON, nullable=True)
+    # Columnas pesadas diferidas: solo se leen si la consulta pide su grupo
+    # (load_story(db, id, "vectors") / "illustration") o se accede al atributo.
+    # Legacy: embedding como lista JSON (se migra a embedding_blob al arrancar)
+    embedding_json = deferred(Column(JSON, nullable=True), group="vectors")
+    # Embedding binario little-endian (float32 o float16) + dimensión
+    embedding_blob = deferred(Column(LargeBinary, nullable=True), group="vectors")
+    embedding_dim = Column(Integer, nullable=True)
+    embedding_dtype = Column(String(8), nullable=True)
+    # Momento en que se escribió el embedding (marca de sincronización del índice RAG)
+    embedding_updated_at = Column(DateTime, nullable=True)
     # Plantilla para generación de ilustraciones con IA
-    illustration_template = Column(JSON, nullable=True)
+    illustration_template = deferred(Column(JSON, nullable=True), group="illustration")
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+def load_story(db: Session, story_id: str, *groups: str) -> Optional[Story]:
+    """
+    Carga un cuento con las columnas ligeras y, además, los grupos diferidos
+    indicados ("vectors", "illustration") en la misma consulta.
+    """
+    query = db.query(Story).filter(Story.id == story_id)
+    for group in groups:
+        query = query.options(undefer_group(group))
+    return query.first()
+
+
+def story_exists(db: Session, story_id: str) -> bool:
+    """Comprueba si existe un cuento leyendo solo su id."""
+    return db.query(Story.id).filter(Story.id == story_id).first() is not None
+
+
+# Índice de texto completo (FTS5) sobre título y contenido de los cuentos.
+# Tabla FTS normal (no external content): los rowid de stories no son estables
+# tras un VACUUM porque su clave primaria es un UUID. Los triggers la mantienen.
+STORIES_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS stories_fts USING fts5("
+    "story_id UNINDEXED, title, content, tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS stories_fts_ai AFTER INSERT ON stories BEGIN "
+    "INSERT INTO stories_fts (story_id, title, content) VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS stories_fts_ad AFTER DELETE ON stories BEGIN "
+    "DELETE FROM stories_fts WHERE story_id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS stories_fts_au AFTER UPDATE OF title, content ON stories BEGIN "
+    "DELETE FROM stories_fts WHERE story_id = old.id; "
+    "INSERT INTO stories_fts (story_id, title, content) VALUES (new.id, new.title, new.content); END",
+]
+
+
+def create_stories_fts(connection) -> bool:
+    """
+    Crea la tabla FTS5 y sus triggers si faltan y la rellena con los cuentos
+    existentes. Retorna True si la tabla se acaba de crear.
+    """
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stories_fts'"
+    )).first() is not None
+    for statement in STORIES_FTS_DDL:
+        connection.execute(text(statement))
+    if not exists:
+        connection.execute(text(
+            "INSERT INTO stories_fts (story_id, title, content) SELECT id, title, content FROM stories"
+        ))
+    return not exists
+
+
+# Documento de texto completo de un cuento en PostgreSQL (mismo que el índice GIN)
+STORIES_TSVECTOR = "to_tsvector('spanish', coalesce(title, '') || ' ' || content)"
+
+
+# PostgreSQL: vectores de cuentos y fragmentos en columnas halfvec de pgvector
+# con índice HNSW (coseno), e índice GIN de texto completo en español. Las
+# tablas de vectores se rellenan desde embedding_blob (services/pgvector_index.py).
+def pgvector_ddl(dim: int = PGVECTOR_DIM) -> list:
+    hnsw = f"USING hnsw (embedding halfvec_cosine_ops) WITH (m = {PGVECTOR_HNSW_M}, " \
+           f"ef_construction = {PGVECTOR_HNSW_EF_CONSTRUCTION})"
+    return [
+        "CREATE EXTENSION IF NOT EXISTS vector",
+        "CREATE TABLE IF NOT EXISTS story_vectors ("
+        "story_id VARCHAR(36) PRIMARY KEY REFERENCES stories(id) ON DELETE CASCADE, "
+        f"embedding halfvec({dim}) NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS ix_story_vectors_hnsw ON story_vectors {hnsw}",
+        "CREATE TABLE IF NOT EXISTS story_chunk_vectors ("
+        "story_id VARCHAR(36) NOT NULL REFERENCES stories(id) ON DELETE CASCADE, "
+        f"chunk_index INTEGER NOT NULL, embedding halfvec({dim}) NOT NULL, "
+        "PRIMARY KEY (story_id, chunk_index))",
+        f"CREATE INDEX IF NOT EXISTS ix_story_chunk_vectors_hnsw ON story_chunk_vectors {hnsw}",
+        f"CREATE INDEX IF NOT EXISTS ix_stories_fts ON stories USING gin ({STORIES_TSVECTOR})",
+    ]
+
+
+def create_pgvector_tables(connection, dim: int = PGVECTOR_DIM):
+    """Crea (si faltan) la extensión vector, las tablas de vectores y sus índices."""
+    for statement in pgvector_ddl(dim):
+        connection.execute(text(statement))
+
+
+class StoryChunk(Base):
+    """Fragmentos (párrafos) de un cuento con su propio embedding para RAG multi-vector"""
+
+    __tablename__ = "story_chunks"
+    __table_args__ = (Index("ix_story_chunks_story_chunk", "story_id", "chunk_index", unique=True),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    story_id = Column(String(36), ForeignKey("stories.id", ondelete="CASCADE"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    embedding_blob = Column(LargeBinary, nullable=False)
+    embedding_dim = Column(Integer, nullable=False)
+    embedding_dtype = Column(String(8), nullable=False)
+    # Marca de sincronización del índice de fragmentos
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class ThemeEmbedding(Base):
+    """Cache persistente de embeddings de temas (compartido entre workers)"""
+
+    __tablename__ = "theme_embeddings"
+
+    theme_key = Column(String(500), primary_key=True)
+    model = Column(String(100), primary_key=True)
+    embedding_blob = Column(LargeBinary, nullable=False)
+    embedding_dim = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class GeminiResponse(Base):
+    """Cache de respuestas deterministas de Gemini (crítica, plantilla de ilustraciones)"""
+
+    __tablename__ = "gemini_responses"
+
+    # SHA-256 de tipo + modelo + versión del prompt + prompt completo
+    cache_key = Column(String(64), primary_key=True)
+    kind = Column(String(50), nullable=False, index=True)
+    model = Column(String(100), nullable=False)
+    response = Column(JSON, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    hits = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class Job(Base):
+    """Cola persistente de tareas en background (crítica, embeddings, síntesis)"""
+
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_run_after", "status", "run_after"),)
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = Column(String(50), nullable=False, index=True)
+    payload = Column(JSON, nullable=True)
+    # pending -> running -> succeeded | failed (pending de nuevo si se reintenta)
+    status = Column(String(16), nullable=False, default="pending")
+    # Evita encolar dos veces el mismo trabajo mientras siga pendiente
+    dedupe_key = Column(String(255), nullable=True, unique=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    result = Column(JSON, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class AppState(Base):
+    """Estado clave/valor compartido entre procesos (p. ej. marcas de progreso)"""
+
+    __tablename__ = "app_state"
+
+    key = Column(String(100), primary_key=True)
+    value = Column(JSON, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
 class Critique(Base):
@@ -66,6 +327,13 @@ class Critique(Base):
     score = Column(Integer)  # 1-10
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Críticas de un cuento y la última de cada cuento (RAG)
+        Index("ix_critiques_story_id_timestamp", story_id, timestamp.desc(), id.desc()),
+        # Últimas N críticas (síntesis, estadísticas) y marca de agua (timestamp, id)
+        Index("ix_critiques_timestamp_id", timestamp, id),
+    )
+
 
 class Lesson(Base):
     """Tabla de Lecciones Sintetizadas"""
@@ -73,12 +341,34 @@ class Lesson(Base):
     __tablename__ = "lessons"
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    lesson_text = Column(Text, nullable=False)
-    source_critique_id = Column(
-        String(36), ForeignKey("critiques.id", ondelete="SET NULL"), nullable=True
-    )
-    importance_score = Column(Integer, default=5)
+    lesson_number = Column(Integer, unique=True, nullable=False)  # lesson_id expuesto en la API
+    lesson_text = Column(Text, nullable=False)  # insight
+    category = Column(String(50), nullable=False, default="general")
+    priority = Column(String(20), default="medium")
+    actionable_guidance = Column(Text)
+    supporting_evidence = Column(JSON)  # Texto o lista de citas, tal como lo devuelve Gemini
+    origin_critique_ids = Column(JSON)  # Críticas de las que salió la lección
+    times_applied = Column(Integer, nullable=False, default=0)
+    effectiveness_score = Column(Float, nullable=True)
+    status = Column(String(20), nullable=False, default="active")  # active, archived
+    synthesized_at = Column(String(10))  # YYYY-MM-DD
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_lessons_status_category", "status", "category"),
+    )
+
+
+class StyleProfileVersion(Base):
+    """Versiones del perfil de estilo; la vigente es la de mayor id"""
+
+    __tablename__ = "style_profile_versions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    profile = Column(JSON, nullable=False)
+    reason = Column(String(50))  # import, synthesis, manual
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
 class Character(Base):
@@ -113,7 +403,7 @@ class PasswordResetToken(Base):
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     token = Column(String(255), unique=True, nullable=False, index=True)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # delete_expired_tokens
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     used = Column(Boolean, default=False, nullable=False)
 
@@ -206,44 +496,42 @@ def get_db():
         db.close()
 
 
-def _run_migrations():
-    """Ejecuta migraciones manuales para columnas añadidas a tablas existentes."""
-    import sqlite3
-    
-    # Obtener ruta de la BD desde la URL
-    db_path = DATABASE_URL.replace("sqlite:///", "")
-    if not os.path.exists(db_path):
-        return  # La BD se creará desde cero con create_all
-    
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Migraciones pendientes
-    migrations = [
-        # (tabla, columna, sentencias SQL)
-        ("users", "email", [
-            "ALTER TABLE users ADD COLUMN email VARCHAR",
-            "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users(email)",
-        ]),
-    ]
-    
-    for table, column, sql_statements in migrations:
-        try:
-            cursor.execute(f"PRAGMA table_info({table})")
-            columns = [row[1] for row in cursor.fetchall()]
-            if column not in columns:
-                for sql in sql_statements:
-                    cursor.execute(sql)
-                print(f"  🔄 Migración: Añadida columna '{column}' a tabla '{table}'")
-        except Exception as e:
-            print(f"  ⚠️ Error en migración ({table}.{column}): {e}")
-    
-    conn.commit()
-    conn.close()
+async def get_async_db():
+    """Genera una sesión async de base de datos para cada request async."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def run_db(db: Union[Session, AsyncSession], fn: Callable[..., T], *args) -> T:
+    """
+    Ejecuta código ORM síncrono fn(session, *args) con cualquiera de las dos
+    sesiones: con una AsyncSession corre sobre su conexión async (run_sync),
+    sin bloquear el event loop; con una Session normal se llama directamente.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return fn(db, *args)
+
+
+@event.listens_for(Story.__table__, "after_create")
+def _create_stories_fts_after_create(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        create_stories_fts(connection)
 
 
 def init_db():
-    """Inicializa la base de datos creando todas las tablas y ejecutando migraciones."""
-    _run_migrations()
+    """Inicializa la base de datos: migraciones pendientes y después las tablas que falten."""
+    from models.migrations import run_migrations  # Importación local para evitar ciclo
+    run_migrations(engine)
     Base.metadata.create_all(bind=engine)
+    if engine.dialect.name == "sqlite":
+        # En BD existentes stories ya estaba creada y after_create no se dispara
+        with engine.begin() as connection:
+            if create_stories_fts(connection):
+                print("  🔄 Migración: índice de texto completo stories_fts creado")
+    elif engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            create_pgvector_tables(connection)
+        print("✅ Base de datos PostgreSQL (pgvector) inicializada correctamente")
+        return
     print("✅ Base de datos SQLite inicializada correctamente")
@@ -0,0 +1,48 @@
+# Codificación binaria de embeddings para las columnas BLOB de la BD
+# Vectores little-endian float32 (o float16) en lugar de listas JSON
+
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+# Tipos de almacenamiento soportados -> dtype NumPy little-endian
+EMBEDDING_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2"),
+}
+
+
+def encode_embedding(values: Sequence[float], dtype: str = "float32") -> bytes:
+    """Serializa un vector como bytes little-endian del tipo indicado."""
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Tipo de embedding no soportado: {dtype}")
+    return np.asarray(values, dtype=EMBEDDING_DTYPES[dtype]).tobytes()
+
+
+def decode_embedding(blob: Optional[bytes], dim: Optional[int] = None, dtype: Optional[str] = "float32") -> Optional[np.ndarray]:
+    """
+    Decodifica un BLOB de embedding sin copiar (vista de solo lectura sobre
+    los bytes). Retorna None si el BLOB está vacío o no cuadra con dim.
+    """
+    if not blob:
+        return None
+    vector = np.frombuffer(blob, dtype=EMBEDDING_DTYPES[dtype or "float32"])
+    if dim is not None and vector.shape[0] != dim:
+        return None
+    return vector
+
+
+def embedding_columns(values: Optional[Sequence[float]], dtype: str = "float32") -> Dict[str, Any]:
+    """
+    Valores de las columnas embedding_blob/embedding_dim/embedding_dtype/
+    embedding_updated_at de Story para un vector (todas a None si no hay vector).
+    """
+    if values is None or len(values) == 0:
+        return {"embedding_blob": None, "embedding_dim": None, "embedding_dtype": None, "embedding_updated_at": None}
+    return {
+        "embedding_blob": encode_embedding(values, dtype),
+        "embedding_dim": len(values),
+        "embedding_dtype": dtype,
+        "embedding_updated_at": datetime.utcnow(),
+    }
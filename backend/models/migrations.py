@@ -0,0 +1,261 @@
+# Migraciones versionadas del esquema
+# Cada migración tiene un número de versión y se registra en la tabla
+# schema_version al aplicarse, así que solo corre una vez por BD. Se aplican
+# en orden sobre las tablas existentes antes de create_all (que solo crea las
+# que faltan). Una BD nueva se crea con create_all y se marca como al día.
+#
+# Reglas para añadir una migración:
+#   - Nunca cambiar ni renumerar las ya publicadas; añadir al final de MIGRATIONS.
+#   - Deben ser idempotentes (una BD antigua pudo aplicarlas a mano).
+#   - Índices con create_index (CONCURRENTLY en PostgreSQL, sin transacción).
+#   - Cambios de datos con batched=True: cada lote es una transacción corta,
+#     así que una BD grande no queda bloqueada durante todo el arranque y, si
+#     se interrumpe, la siguiente ejecución continúa donde lo dejó.
+
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from config import EMBEDDING_STORAGE_DTYPE, MIGRATION_BATCH_SIZE
+from models.database_sqlite import Lesson, Story, User
+from models.embeddings import embedding_columns
+
+SCHEMA_VERSION_DDL = (
+    "CREATE TABLE IF NOT EXISTS schema_version ("
+    "version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    # upgrade(conn) o, con batched=True, upgrade(conn, batch_size) -> filas procesadas
+    upgrade: Callable
+    # False: se ejecuta en autocommit (CREATE INDEX CONCURRENTLY no admite transacción)
+    transactional: bool = True
+    batched: bool = False
+
+
+# --- Utilidades para escribir migraciones ---
+
+def table_exists(conn: Connection, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+def add_columns(conn: Connection, model, *names: str) -> List[str]:
+    """Añade a la tabla del modelo las columnas que falten, con el tipo del modelo."""
+    table = model.__table__
+    if not table_exists(conn, table.name):
+        return []  # create_all la creará completa
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    added = []
+    for name in names:
+        if name in existing:
+            continue
+        column_type = table.c[name].type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+        added.append(name)
+    if added:
+        print(f"  🔄 Migración: añadidas columnas {', '.join(added)} a '{table.name}'")
+    return added
+
+
+def create_index(conn: Connection, name: str, table: str, columns: str, unique: bool = False) -> bool:
+    """
+    CREATE INDEX IF NOT EXISTS sin bloquear escrituras en PostgreSQL
+    (CONCURRENTLY; la migración debe ser transactional=False). En SQLite
+    bloquea solo a los escritores mientras se construye (los lectores en WAL siguen).
+    """
+    if not table_exists(conn, table):
+        return False  # create_all la creará con los índices del modelo
+    concurrently = "CONCURRENTLY " if conn.dialect.name == "postgresql" else ""
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})"
+    ))
+    return True
+
+
+# --- Migraciones ---
+
+def _users_email(conn: Connection):
+    if add_columns(conn, User, "email"):
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)"))
+
+
+def _stories_embedding_blob(conn: Connection):
+    add_columns(conn, Story, "embedding_blob", "embedding_dim", "embedding_dtype")
+
+
+def _stories_embedding_updated_at(conn: Connection):
+    if add_columns(conn, Story, "embedding_updated_at"):
+        conn.execute(text(
+            "UPDATE stories SET embedding_updated_at = created_at WHERE embedding_blob IS NOT NULL"
+        ))
+
+
+def _rebuild_legacy_lessons_table(conn: Connection):
+    """
+    La tabla lessons original nunca se usó (las lecciones vivían en JSON).
+    Si tiene el esquema antiguo se aparta para que create_all la cree de nuevo.
+    """
+    if not table_exists(conn, Lesson.__tablename__):
+        return
+    columns = {column["name"] for column in inspect(conn).get_columns(Lesson.__tablename__)}
+    if "lesson_number" in columns:
+        return
+    if conn.execute(text("SELECT COUNT(*) FROM lessons")).scalar():
+        conn.execute(text("ALTER TABLE lessons RENAME TO lessons_legacy"))
+        print("  🔄 Migración: tabla lessons antigua renombrada a lessons_legacy")
+    else:
+        conn.execute(text("DROP TABLE lessons"))
+        print("  🔄 Migración: tabla lessons antigua (vacía) reemplazada")
+
+
+def _stories_created_at_index(conn: Connection):
+    create_index(conn, "ix_stories_created_at_id", "stories", "created_at, id")
+
+
+def _migrate_embeddings_to_blob(conn: Connection, batch_size: int) -> int:
+    """
+    Un lote de la conversión de embeddings JSON heredados a BLOB binario;
+    vacía la columna JSON para liberar espacio (~5x menos por cuento).
+    """
+    if not table_exists(conn, "stories"):
+        return 0
+    rows = conn.execute(text(
+        "SELECT id, embedding_json FROM stories "
+        "WHERE embedding_json IS NOT NULL AND embedding_blob IS NULL LIMIT :limit"
+    ), {"limit": batch_size}).all()
+    updates = []
+    for story_id, raw in rows:
+        try:
+            values = json.loads(raw) if isinstance(raw, str) else raw
+        except (TypeError, ValueError):
+            values = None
+        cols = embedding_columns(values or None, EMBEDDING_STORAGE_DTYPE)
+        updates.append({**cols, "id": story_id})
+    if updates:
+        # Los JSON inválidos también se vacían para no volver a leerlos
+        conn.execute(text(
+            "UPDATE stories SET embedding_blob = :embedding_blob, embedding_dim = :embedding_dim, "
+            "embedding_dtype = :embedding_dtype, embedding_updated_at = :embedding_updated_at, "
+            "embedding_json = NULL WHERE id = :id"
+        ), updates)
+    return len(updates)
+
+
+def _hot_query_indexes(conn: Connection):
+    """Índices de las consultas frecuentes (los mismos que declaran los modelos)."""
+    create_index(conn, "ix_critiques_story_id_timestamp", "critiques", "story_id, timestamp DESC, id DESC")
+    create_index(conn, "ix_critiques_timestamp_id", "critiques", "timestamp, id")
+    create_index(conn, "ix_stories_is_seed_created_at_id", "stories", "is_seed, created_at, id")
+    create_index(conn, "ix_password_reset_tokens_expires_at", "password_reset_tokens", "expires_at")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "users_email", _users_email),
+    Migration(2, "stories_embedding_blob", _stories_embedding_blob),
+    Migration(3, "stories_embedding_updated_at", _stories_embedding_updated_at),
+    Migration(4, "lessons_legacy_rebuild", _rebuild_legacy_lessons_table),
+    Migration(5, "ix_stories_created_at_id", _stories_created_at_index, transactional=False),
+    Migration(6, "embeddings_json_to_blob", _migrate_embeddings_to_blob, batched=True),
+    Migration(7, "hot_query_indexes", _hot_query_indexes, transactional=False),
+]
+
+
+# --- Runner ---
+
+def _ensure_version_table(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA_VERSION_DDL))
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    with engine.connect() as conn:
+        if not table_exists(conn, "schema_version"):
+            return []
+        return list(conn.execute(text("SELECT version FROM schema_version ORDER BY version")).scalars())
+
+
+def current_version(engine: Engine) -> int:
+    """Última versión aplicada (0 en una BD sin migraciones)."""
+    versions = applied_versions(engine)
+    return versions[-1] if versions else 0
+
+
+def pending_migrations(engine: Engine, migrations: Optional[List[Migration]] = None) -> List[Migration]:
+    done = set(applied_versions(engine))
+    return [m for m in (migrations or MIGRATIONS) if m.version not in done]
+
+
+def _record(conn: Connection, migration: Migration):
+    # Otro proceso (API y worker arrancando a la vez) pudo registrarla ya
+    conn.execute(text(
+        "INSERT INTO schema_version (version, name, applied_at) "
+        "SELECT :version, :name, :applied_at "
+        "WHERE NOT EXISTS (SELECT 1 FROM schema_version WHERE version = :version)"
+    ), {"version": migration.version, "name": migration.name, "applied_at": datetime.utcnow()})
+
+
+def _apply(engine: Engine, migration: Migration, batch_size: int) -> Optional[int]:
+    """Aplica una migración y la registra. Retorna las filas procesadas si es por lotes."""
+    if migration.batched:
+        processed = 0
+        while True:
+            with engine.begin() as conn:
+                count = migration.upgrade(conn, batch_size)
+            processed += count
+            if count < batch_size:
+                break
+        with engine.begin() as conn:
+            _record(conn, migration)
+        return processed
+    if migration.transactional:
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            _record(conn, migration)
+        return None
+    with engine.connect() as conn:
+        migration.upgrade(conn.execution_options(isolation_level="AUTOCOMMIT"))
+    with engine.begin() as conn:
+        _record(conn, migration)
+    return None
+
+
+def run_migrations(
+    engine: Engine,
+    migrations: Optional[List[Migration]] = None,
+    batch_size: int = MIGRATION_BATCH_SIZE,
+) -> List[Tuple[int, str]]:
+    """
+    Aplica en orden las migraciones pendientes. En una BD nueva (sin tabla
+    stories) no hay nada que migrar: se marcan todas como aplicadas y
+    create_all crea el esquema actual. Si una migración falla se detiene
+    (las siguientes pueden depender de ella) y se reintenta en el próximo
+    arranque. Retorna [(versión, nombre)] de las aplicadas.
+    """
+    migrations = migrations or MIGRATIONS
+    with engine.connect() as conn:
+        fresh = not table_exists(conn, "stories")
+    _ensure_version_table(engine)
+
+    applied = []
+    for migration in pending_migrations(engine, migrations):
+        if fresh:
+            with engine.begin() as conn:
+                _record(conn, migration)
+            continue
+        try:
+            processed = _apply(engine, migration, batch_size)
+        except Exception as e:
+            print(f"  ⚠️ Error en migración {migration.version} ({migration.name}): {e}")
+            break
+        detail = f" ({processed} filas)" if processed else ""
+        print(f"  🔄 Migración {migration.version} ({migration.name}) aplicada{detail}")
+        applied.append((migration.version, migration.name))
+    return applied
@@ -49,12 +49,41 @@ class StoryResponse(StoryBase):
 
 class StoryResponseWithPrompt(StoryResponse):
     prompt_used: Optional[str] = None
+    critique_job_id: Optional[str] = None  # Consultar en /api/jobs/{id}
+    token_usage: Optional[Dict[str, Any]] = None  # Tokens de entrada cacheados / sin cache y de salida
 
 
 class StoryPromptResponse(BaseModel):
     prompt: str
 
 
+class StoryListItem(BaseModel):
+    """Cuento en la biblioteca: sin el contenido completo ni los embeddings."""
+    id: uuid.UUID
+    title: Optional[str] = None
+    excerpt: str  # Primeros caracteres del contenido
+    version: int
+    is_seed: bool
+    created_at: datetime
+    score: Optional[float] = None  # Score de la crítica más reciente
+
+
+class StoryPage(BaseModel):
+    items: List[StoryListItem]
+    next_cursor: Optional[str] = None  # Pasar como ?cursor= para la página siguiente
+    total: Optional[int] = None  # Solo con ?with_counts=true
+    generated: Optional[int] = None  # Cuentos no semilla (solo con ?with_counts=true)
+
+
+class StorySearchResult(BaseModel):
+    id: uuid.UUID
+    title: str
+    snippet: str  # Extracto con las coincidencias entre « »
+    score: float  # Relevancia BM25 (mayor = mejor)
+    is_seed: bool
+    created_at: datetime
+
+
 class CritiqueBase(BaseModel):
     score_coherence: int = Field(..., gt=0, le=10)
     score_style: int = Field(..., gt=0, le=10)
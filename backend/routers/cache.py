@@ -0,0 +1,31 @@
+# Router para administrar los caches persistentes (respuestas de Gemini)
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Query
+from services.gemini_service import gemini_service
+
+router = APIRouter(prefix="/cache", tags=["Cache"])
+
+
+@router.get(
+    "/responses",
+    response_model=Dict[str, Any],
+    summary="Estado del cache de respuestas de Gemini",
+)
+def get_response_cache_stats():
+    """Entradas, bytes y aciertos del cache de críticas y plantillas de ilustraciones."""
+    if gemini_service.response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **gemini_service.response_cache.stats()}
+
+
+@router.delete(
+    "/responses",
+    summary="Vaciar el cache de respuestas de Gemini",
+)
+def clear_response_cache(
+    kind: Optional[str] = Query(None, description="critique o illustration (por defecto, todo)"),
+):
+    """Borra las respuestas cacheadas para forzar su regeneración."""
+    if gemini_service.response_cache is None:
+        return {"removed": 0}
+    return {"removed": gemini_service.response_cache.clear(kind)}
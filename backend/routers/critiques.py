@@ -22,8 +22,7 @@ def add_critique_to_story(
     Esto es el resultado de la `Function C: SelfCritique`.
     """
     # Verificar que el cuento existe
-    story = db_session.query(db.Story).filter(db.Story.id == critique.story_id).first()
-    if not story:
+    if not db.story_exists(db_session, critique.story_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Story with id {critique.story_id} not found.",
@@ -0,0 +1,89 @@
+# Router para consultar la cola de jobs en background
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Query, status
+from services.job_queue import job_queue
+from services.embedding_backfill import EmbeddingBackfill
+from services.jobs import enqueue_critique, enqueue_embedding_backfill
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+@router.get(
+    "",
+    response_model=List[Dict[str, Any]],
+    summary="Listar jobs recientes",
+)
+def list_jobs(
+    status_filter: Optional[str] = Query(None, alias="status", description="pending, running, succeeded o failed"),
+    kind: Optional[str] = Query(None, description="critique, embedding_backfill o lesson_synthesis"),
+    limit: int = Query(50, ge=1, le=200),
+):
+    """Lista los jobs más recientes, opcionalmente filtrados por estado y tipo."""
+    return job_queue.list(status=status_filter, kind=kind, limit=limit)
+
+
+@router.get(
+    "/stats",
+    response_model=Dict[str, Dict[str, int]],
+    summary="Número de jobs por tipo y estado",
+)
+def get_jobs_stats():
+    """Resumen de la cola: {tipo: {estado: total}}."""
+    return job_queue.stats()
+
+
+@router.post(
+    "/embedding-backfill",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Encolar embeddings de los cuentos que no lo tienen",
+)
+def start_embedding_backfill(
+    restart: bool = Query(False, description="Empezar de cero en lugar de seguir desde el último checkpoint"),
+):
+    """
+    Encola un job que genera en lotes el embedding de todos los cuentos
+    pendientes. El progreso se consulta en GET /jobs/embedding-backfill.
+    """
+    return {"job_id": enqueue_embedding_backfill(restart=restart)}
+
+
+@router.get(
+    "/embedding-backfill",
+    response_model=Dict[str, Any],
+    summary="Progreso del backfill de embeddings",
+)
+def get_embedding_backfill_progress():
+    """Checkpoint de la última ejecución: cursor, procesados, con embedding y fallidos."""
+    return EmbeddingBackfill().load_checkpoint() or {"processed": 0, "finished_at": None}
+
+
+@router.post(
+    "/critique/{story_id}",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Encolar la crítica de un cuento",
+)
+def start_critique(
+    story_id: str,
+    force_refresh: bool = Query(False, description="Ignorar la crítica cacheada y pedir una nueva a Gemini"),
+):
+    """Re-critica un cuento. Sin force_refresh se reutiliza la respuesta cacheada si existe."""
+    return {"job_id": enqueue_critique(story_id, force_refresh=force_refresh)}
+
+
+@router.get(
+    "/{job_id}",
+    response_model=Dict[str, Any],
+    summary="Consultar el estado de un job",
+)
+def get_job(job_id: str):
+    """
+    Estado de un job para que el frontend pueda sondearlo: status, intentos,
+    último error y resultado cuando termina.
+    """
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with id {job_id} not found.",
+        )
+    return job
@@ -1,10 +1,16 @@
 # Router para sistema de aprendizaje evolutivo
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any
+from config import JOBS_POLL_INTERVAL, SYNTHESIS_WAIT_SECONDS
 from models import database_sqlite as db
 from services.gemini_service import gemini_service
+from services.job_queue import ACTIVE_STATUSES, job_queue
 from services.learning_service import learning_service
+from services.synthesis_scheduler import synthesis_scheduler
 
 router = APIRouter(prefix="/learning", tags=["Learning"])
 
@@ -12,113 +18,83 @@ router = APIRouter(prefix="/learning", tags=["Learning"])
 @router.post(
     "/synthesize",
     response_model=Dict[str, Any],
-    summary="Sintetizar lecciones de las últimas N críticas"
+    summary="Sintetizar lecciones de las críticas aún no sintetizadas"
 )
-async def synthesize_lessons(
-    last_n_critiques: int = 5,
-    db_session: Session = Depends(db.get_db)
-):
+async def synthesize_lessons():
     """
-    Ejecuta síntesis de lecciones aprendidas desde las últimas N críticas.
-    
-    - **last_n_critiques**: Número de críticas recientes a analizar (default: 5)
-    
-    Proceso:
-    1. Obtiene las últimas N críticas de la BD
-    2. Usa Gemini para sintetizar patrones y lecciones
-    3. Actualiza learning_history.json con nuevas lecciones
-    4. Actualiza style_profile.json con ajustes de estilo
-    5. Retorna resumen de la síntesis
+    Ejecuta ya la síntesis de lecciones sobre las críticas nuevas.
+
+    Usa el mismo job exclusivo `lesson_synthesis` que la síntesis programada:
+    nunca hay dos síntesis a la vez, solo se envían las críticas posteriores
+    a la marca de agua (hasta SYNTHESIS_MAX_BATCH) y la marca avanza al
+    terminar. Si ya había una síntesis en espera se adelanta en lugar de
+    crear otra. Espera el resultado hasta SYNTHESIS_WAIT_SECONDS; si tarda
+    más responde 202 con el job_id (GET /api/jobs/{job_id}).
     """
-    try:
-        # Verificar que Gemini esté configurado
-        if not gemini_service.is_configured():
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Servicio Gemini no configurado. Verifica GEMINI_API_KEY."
-            )
-        
-        # 1. Obtener últimas N críticas
-        critiques = db_session.query(db.Critique).order_by(
-            db.Critique.timestamp.desc()
-        ).limit(last_n_critiques).all()
-        
-        if not critiques:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No hay críticas disponibles para sintetizar"
-            )
-        
-        if len(critiques) < 3:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Se necesitan al menos 3 críticas para síntesis significativa. Solo hay {len(critiques)}."
-            )
-        
-        # 2. Preparar datos para Gemini
-        critiques_data = []
-        critique_ids = []
-        
-        for critique in critiques:
-            critiques_data.append({
-                'id': critique.id,
-                'story_id': critique.story_id,
-                'critique_text': critique.critique_text,
-                'score': critique.score
-            })
-            critique_ids.append(critique.id)
-        
-        print(f"[synthesize_lessons] 🧠 Analizando {len(critiques_data)} críticas...")
-        
-        # 3. Generar síntesis con Gemini
-        synthesis_result = await gemini_service.synthesize_lessons(critiques_data)
-        
-        if not synthesis_result:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error generando síntesis con Gemini"
-            )
-        
-        # 4. Guardar lecciones en learning_history.json
-        history_saved = learning_service.add_lessons_to_history(
-            synthesis_result,
-            critique_ids
+    # Verificar que Gemini esté configurado
+    if not gemini_service.is_configured():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio Gemini no configurado. Verifica GEMINI_API_KEY."
         )
-        
-        # 5. Actualizar style_profile.json
-        profile_updated = learning_service.update_style_profile(synthesis_result)
-        
-        # 6. Preparar respuesta
-        lessons_learned = synthesis_result.get('lessons_learned', [])
-        
-        return {
-            "status": "success",
-            "critiques_analyzed": len(critiques_data),
-            "lessons_extracted": len(lessons_learned),
-            "synthesis_summary": synthesis_result.get('synthesis_summary', ''),
-            "lessons": lessons_learned,
-            "style_adjustments": synthesis_result.get('style_adjustments', {}),
-            "meta_insights": synthesis_result.get('meta_insights', {}),
-            "history_updated": history_saved,
-            "profile_updated": profile_updated,
-            "message": f"✅ Síntesis completada: {len(lessons_learned)} lecciones aprendidas"
-        }
-        
-    except HTTPException:
-        raise
-    except Exception as e:
+
+    pending = await asyncio.to_thread(synthesis_scheduler.pending_count)
+    if not pending:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No hay críticas nuevas para sintetizar"
+        )
+    if pending < 3:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Se necesitan al menos 3 críticas nuevas para síntesis significativa. Solo hay {pending}."
+        )
+
+    job_id = await asyncio.to_thread(synthesis_scheduler.request_now)
+    print(f"[synthesize_lessons] 🧠 Síntesis manual encolada ({pending} críticas pendientes, job {job_id})")
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SYNTHESIS_WAIT_SECONDS
+    job = None
+    while loop.time() < deadline:
+        job = await asyncio.to_thread(job_queue.get, job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            break
+        await asyncio.sleep(JOBS_POLL_INTERVAL / 2)
+
+    if job is not None and job["status"] in ACTIVE_STATUSES:
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={
+            "status": "queued",
+            "job_id": job_id,
+            "pending_critiques": pending,
+            "message": "⏳ Síntesis en curso; consulta GET /api/jobs/{job_id}",
+        })
+    if job is None or job["status"] == "failed":
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error en síntesis: {str(e)}"
+            detail=f"Error en síntesis: {job['last_error'] if job else 'job no encontrado'}"
         )
 
+    result = job["result"] or {}
+    lessons_learned = result.get("lessons_learned", [])
+    return {
+        "status": "success",
+        "job_id": job_id,
+        "critiques_analyzed": len(result.get("critique_ids", [])),
+        "lessons_extracted": result.get("lessons", 0),
+        "synthesis_summary": result.get("synthesis_summary", ""),
+        "lessons": lessons_learned,
+        "next_job_id": result.get("next_job_id"),
+        "message": f"✅ Síntesis completada: {result.get('lessons', 0)} lecciones aprendidas"
+    }
+
 
 @router.get(
     "/statistics",
     response_model=Dict[str, Any],
     summary="Obtener estadísticas del sistema de aprendizaje"
 )
-async def get_learning_statistics(db_session: Session = Depends(db.get_db)):
+async def get_learning_statistics(db_session: AsyncSession = Depends(db.get_async_db)):
     """
     Retorna estadísticas sobre el estado del sistema de aprendizaje evolutivo.
     
@@ -130,39 +106,33 @@ async def get_learning_statistics(db_session: Session = Depends(db.get_db)):
     - Contadores de críticas y cuentos
     """
     try:
-        # Estadísticas del servicio de aprendizaje
-        stats = learning_service.get_synthesis_statistics()
+        # Estadísticas del servicio de aprendizaje (sesión síncrona: en un hilo)
+        stats = await asyncio.to_thread(learning_service.get_synthesis_statistics)
         
         # Contadores de base de datos
-        total_stories = db_session.query(db.Story).count()
-        total_critiques = db_session.query(db.Critique).count()
+        total_stories = await db_session.scalar(select(func.count(db.Story.id)))
+        total_critiques = await db_session.scalar(select(func.count(db.Critique.id)))
         
-        # Calcular críticas hasta próxima síntesis
-        SYNTHESIS_THRESHOLD = 2  # Debe coincidir con stories.py
-        critiques_until_next = SYNTHESIS_THRESHOLD - (total_critiques % SYNTHESIS_THRESHOLD)
-        if critiques_until_next == SYNTHESIS_THRESHOLD:
-            critiques_until_next = 0
+        # Estado del planificador de síntesis (marca de agua y críticas pendientes)
+        synthesis = await asyncio.to_thread(synthesis_scheduler.status)
         
         # Promedio de scores recientes
-        recent_critiques = db_session.query(db.Critique).order_by(
-            db.Critique.timestamp.desc()
-        ).limit(10).all()
+        recent_scores = (await db_session.scalars(
+            select(db.Critique.score).order_by(db.Critique.timestamp.desc()).limit(10)
+        )).all()
         
         avg_score = None
-        if recent_critiques:
-            scores = [c.score for c in recent_critiques if c.score is not None]
-            if scores:
-                avg_score = round(sum(scores) / len(scores), 2)
-        
-        # Calcular total de síntesis realizadas
-        # Cada síntesis procesa SYNTHESIS_THRESHOLD críticas
-        total_syntheses = total_critiques // SYNTHESIS_THRESHOLD
+        scores = [score for score in recent_scores if score is not None]
+        if scores:
+            avg_score = round(sum(scores) / len(scores), 2)
         
         return {
             **stats,
-            "total_syntheses": total_syntheses,
-            "total_critiques_analyzed": total_critiques,
-            "critiques_until_next_synthesis": critiques_until_next,
+            "total_syntheses": synthesis["runs"],
+            "total_critiques_analyzed": total_critiques - synthesis["pending_critiques"],
+            "critiques_until_next_synthesis": synthesis["critiques_until_next_synthesis"],
+            "pending_critiques": synthesis["pending_critiques"],
+            "last_synthesis_run_at": synthesis["last_run_at"],
             "database_stats": {
                 "total_stories": total_stories,
                 "total_critiques": total_critiques,
@@ -196,21 +166,19 @@ async def list_lessons(
     - **status_filter**: 'active', 'archived' o 'all' (default: 'active')
     """
     try:
-        history = learning_service.load_learning_history()
-        
-        # Filtrar por status
-        filtered = history
-        if status_filter and status_filter != "all":
-            filtered = [l for l in history if l.get('status') == status_filter]
-        
-        # Filtrar por categoría
-        if category:
-            filtered = [l for l in filtered if l.get('category') == category]
+        # Filtrar por status y categoría (índices en memoria; la revalidación
+        # de la cache consulta la BD, así que va a un hilo)
+        filtered = await asyncio.to_thread(
+            learning_service.get_lessons,
+            status=status_filter if status_filter != "all" else None,
+            category=category
+        )
+        stats = await asyncio.to_thread(learning_service.get_synthesis_statistics)
         
         return {
             "lessons": filtered,
             "total": len(filtered),
-            "total_all": len(history)
+            "total_all": stats["total_lessons"]
         }
         
     except Exception as e:
@@ -227,10 +195,10 @@ async def list_lessons(
 )
 async def get_learning_history():
     """
-    Retorna el contenido completo de learning_history.json
+    Retorna el historial completo de lecciones
     """
     try:
-        history = learning_service.load_learning_history()
+        history = await asyncio.to_thread(learning_service.load_learning_history)
         return {
             "history": history,
             "total_lessons": len(history)
@@ -249,10 +217,10 @@ async def get_learning_history():
 )
 async def get_style_profile():
     """
-    Retorna el contenido completo de style_profile.json
+    Retorna la versión vigente del perfil de estilo
     """
     try:
-        profile = learning_service.load_style_profile()
+        profile = await asyncio.to_thread(learning_service.load_style_profile)
         return profile
     except Exception as e:
         raise HTTPException(
@@ -1,8 +1,10 @@
 # Router para testing y debugging de RAG
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
-from models.database_sqlite import get_db
+from models.database_sqlite import Story, get_async_db
 from services.rag_service import rag_service
 from pydantic import BaseModel
 
@@ -25,7 +27,7 @@ async def search_similar_stories(
     top_k: int = Query(2, ge=1, le=5, description="Número de ejemplos a retornar"),
     min_similarity: float = Query(0.5, ge=0.0, le=1.0, description="Similitud mínima (0-1)"),
     min_score: float = Query(7.0, ge=0.0, le=10.0, description="Score mínimo de crítica"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Busca cuentos similares a un tema usando RAG.
@@ -36,9 +38,8 @@ async def search_similar_stories(
     GET /rag/search?theme=hermanos&target_age=4&top_k=2
     ```
     """
-    # Verificar si está en cache
-    theme_key = theme.lower().strip()
-    cache_hit = theme_key in rag_service._embedding_cache
+    # Verificar si está en cache (memoria o BD)
+    hits_before = rag_service.theme_cache.hits + rag_service.theme_cache.disk_hits
     
     # Buscar cuentos similares
     similar_stories = await rag_service.search_similar_stories(
@@ -49,6 +50,7 @@ async def search_similar_stories(
         min_similarity=min_similarity,
         min_score=min_score
     )
+    cache_hit = rag_service.theme_cache.hits + rag_service.theme_cache.disk_hits > hits_before
     
     return RAGSearchResponse(
         query_theme=theme,
@@ -61,48 +63,51 @@ async def search_similar_stories(
 @router.get("/cache/status")
 async def get_cache_status():
     """
-    Muestra el estado actual del cache de embeddings.
+    Muestra el estado del cache de embeddings de temas: tamaño, límites y
+    contadores de aciertos, fallos y expulsiones.
     """
-    cache = rag_service._embedding_cache
+    stats = await asyncio.to_thread(rag_service.theme_cache.stats)
     
     return {
-        "cache_size": len(cache),
-        "cached_themes": list(cache.keys()),
-        "total_embeddings": sum(1 for _ in cache.values())
+        "cache_size": stats["entries"],
+        **stats,
     }
 
 
 @router.delete("/cache/clear")
-async def clear_cache():
+async def clear_cache(
+    persistent: bool = Query(False, description="Borrar también la tabla persistente de la BD")
+):
     """
     Limpia el cache de embeddings (útil para testing).
     """
-    cache_size = len(rag_service._embedding_cache)
-    rag_service._embedding_cache.clear()
+    removed = await asyncio.to_thread(rag_service.theme_cache.clear, persistent=persistent)
     
     return {
         "message": "Cache limpiado",
-        "embeddings_removed": cache_size
+        "embeddings_removed": removed
     }
 
 
 @router.get("/stats")
-async def get_rag_stats(db: Session = Depends(get_db)):
+async def get_rag_stats(db: AsyncSession = Depends(get_async_db)):
     """
     Estadísticas del sistema RAG.
     """
-    from models.database_sqlite import Story
-    
     # Contar cuentos con embeddings
-    total_stories = db.query(Story).count()
-    stories_with_embeddings = db.query(Story).filter(
-        Story.embedding_json.isnot(None)
-    ).count()
+    total_stories = await db.scalar(select(func.count(Story.id)))
+    stories_with_embeddings = await db.scalar(
+        select(func.count(Story.id)).where(Story.embedding_blob.isnot(None))
+    )
+    
+    # Con pgvector las estadísticas del índice consultan la BD
+    index_stats = await asyncio.to_thread(rag_service.index_stats)
     
     return {
         "total_stories": total_stories,
         "stories_with_embeddings": stories_with_embeddings,
         "coverage_percentage": round((stories_with_embeddings / total_stories * 100) if total_stories > 0 else 0, 1),
-        "cache_size": len(rag_service._embedding_cache),
+        "cache_size": len(rag_service.theme_cache),
+        "index": index_stats,
         "ready_for_rag": stories_with_embeddings >= 2
     }
@@ -1,9 +1,26 @@
 # Router para endpoints de cuentos
+import asyncio
+import base64
+import time
 import uuid
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from models.database_sqlite import Story, Critique, get_db
+from config import EMBEDDING_STORAGE_DTYPE, RAG_EMBEDDING_TIMEOUT_SECONDS
+from models.database_sqlite import (
+    Story,
+    Critique,
+    AsyncSessionLocal,
+    get_async_db,
+    get_db,
+    load_story,
+    run_db,
+)
+from models.embeddings import embedding_columns
 from models.schemas import (
     StoryCreate,
     StoryResponse,
@@ -11,134 +28,74 @@ from models.schemas import (
     StoryPromptInput,
     StoryPromptResponse,
     StoryGenerateInput,
+    StorySearchResult,
+    StoryListItem,
+    StoryPage,
 )
 from services.prompt_service import prompt_service
 from services.gemini_service import gemini_service
+from services.story_chunks import embed_stories, save_story_chunks
+from services.text_search import search_stories
+from services.story_stream import StoryStreamParser, sse_event
+from services.jobs import enqueue_critique, enqueue_embedding_backfill
 
 router = APIRouter(prefix="/stories", tags=["Stories"])
 
 
-# Función auxiliar para crítica automática en background
-async def auto_critique_story(story_id: str, story_content: str):
-    """
-    Genera automáticamente una crítica del cuento usando Gemini.
-    Se ejecuta en background para no bloquear la respuesta al usuario.
-    """
+# Caracteres del contenido que se envían como extracto en la biblioteca
+STORY_EXCERPT_CHARS = 200
+
+
+def _encode_cursor(row) -> str:
+    """Cursor opaco con la posición (created_at, id) del último cuento de la página."""
+    raw = f"{row.created_at.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
     try:
-        print(f"[auto_critique_story] 🎯 Iniciando crítica automática para cuento {story_id}")
-        
-        # Generar crítica con Gemini
-        critique_data = await gemini_service.generate_critique(story_content)
-        
-        if not critique_data:
-            print(f"[auto_critique_story] ⚠️ No se pudo generar crítica para {story_id}")
-            return
-        
-        # Extraer datos de la crítica
-        evaluation = critique_data.get("evaluation", {})
-        feedback = critique_data.get("feedback", {})
-        
-        overall_score = evaluation.get("overall_score", 5)
-        actionable_lesson = feedback.get("actionable_lesson", "Sin lección específica")
-        
-        # Guardar en base de datos
-        from models.database_sqlite import SessionLocal
-        db_session = SessionLocal()
-        
-        try:
-            db_critique = Critique(
-                id=str(uuid.uuid4()),
-                story_id=story_id,
-                critique_text=str(critique_data),  # JSON completo como texto
-                score=overall_score,
-            )
-            db_session.add(db_critique)
-            db_session.commit()
-            
-            print(f"[auto_critique_story] ✅ Crítica guardada para {story_id} - Score: {overall_score}/10")
-            
-            # 🔄 BUCLE DE APRENDIZAJE: Cada N críticas, disparar síntesis automática
-            critique_count = db_session.query(Critique).count()
-            SYNTHESIS_THRESHOLD = 2  # Síntesis cada 2 críticas
-            
-            if critique_count % SYNTHESIS_THRESHOLD == 0:
-                print(f"[auto_critique_story] 🧠 Umbral alcanzado ({critique_count} críticas) - Disparando síntesis de lecciones...")
-                
-                # Importar servicios necesarios
-                from services.learning_service import learning_service
-                
-                # Obtener las últimas N críticas
-                recent_critiques = db_session.query(Critique).order_by(
-                    Critique.timestamp.desc()
-                ).limit(SYNTHESIS_THRESHOLD).all()
-                
-                # Preparar datos para síntesis
-                critiques_data = []
-                critique_ids = []
-                for c in recent_critiques:
-                    critiques_data.append({
-                        'id': c.id,
-                        'story_id': c.story_id,
-                        'critique_text': c.critique_text,
-                        'score': c.score
-                    })
-                    critique_ids.append(c.id)
-                
-                # Generar síntesis
-                synthesis_result = await gemini_service.synthesize_lessons(critiques_data)
-                
-                if synthesis_result:
-                    # Guardar lecciones y actualizar perfil
-                    learning_service.add_lessons_to_history(synthesis_result, critique_ids)
-                    learning_service.update_style_profile(synthesis_result)
-                    
-                    lessons_count = len(synthesis_result.get('lessons_learned', []))
-                    print(f"[auto_critique_story] ✅ Síntesis completada: {lessons_count} lecciones aprendidas")
-                else:
-                    print(f"[auto_critique_story] ⚠️ Síntesis falló - continuando...")
-            
-        finally:
-            db_session.close()
-            
-    except Exception as e:
-        import traceback
-        print(f"[auto_critique_story] ❌ Error generando crítica: {e}")
-        print(traceback.format_exc())
+        created_at, story_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), story_id
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
 
 
-@router.post(
-    "/generate",
-    response_model=StoryResponseWithPrompt,
-    status_code=status.HTTP_201_CREATED,
-    summary="Generar un cuento automáticamente",
-)
-async def generate_story(
-    story_inputs: StoryGenerateInput, 
-    background_tasks: BackgroundTasks,
-    db_session: Session = Depends(get_db)
-):
+async def _timed(timings: Dict[str, float], step: str, awaitable):
+    """Espera una corrutina y registra su duración en ms bajo el nombre del paso."""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[step] = (time.perf_counter() - start) * 1000
+
+
+def _server_timing(timings: Dict[str, float]) -> str:
+    """Formatea las duraciones como cabecera Server-Timing (visible en DevTools)."""
+    return ", ".join(f"{step};dur={ms:.1f}" for step, ms in timings.items())
+
+
+async def _prepare_story_prompt(
+    story_inputs: StoryGenerateInput,
+    db_session: Union[Session, AsyncSession],
+    timings: Dict[str, float],
+    log_tag: str = "generateStory",
+) -> Tuple[str, List[str], str]:
     """
-    Genera un cuento completo usando Gemini basado en los inputs del usuario.
-    Además, dispara automáticamente una crítica en background para mejorar el sistema.
+    Pasos 1-2.5 de la generación: contexto, lecciones activas, RAG y prompt.
+    Retorna (prompt, ids de lecciones aplicadas, prefijo estable del prompt
+    para la cache de contexto de Gemini).
     """
-    print(f"[generateStory] 🎯 Iniciando generación de cuento...")
-    print(f"[generateStory] Datos del cuento:")
-    print(f"  - theme: {story_inputs.theme}")
-    print(f"  - character_names: {story_inputs.character_names}")
-    print(f"  - moral_lesson: {story_inputs.moral_lesson}")
-    print(f"  - target_age: {story_inputs.target_age}")
-    print(f"  - length: {story_inputs.length}")
+    from services.rag_service import rag_service
     
-    if not gemini_service.is_configured():
-        print(f"[generateStory] ❌ Gemini no configurado")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Servicio Gemini no configurado. Verifica GEMINI_API_KEY."
-        )
+    # El embedding del tema solo depende del tema: se lanza ya y se solapa con
+    # la preparación del prompt
+    theme_embedding_task = asyncio.create_task(
+        _timed(timings, "theme_embedding", rag_service.get_theme_embedding(story_inputs.theme))
+    )
     
     try:
         # 1. Construir descripción del contexto
-        print(f"[generateStory] 📝 Construyendo contexto...")
+        print(f"[{log_tag}] 📝 Construyendo contexto...")
         context_parts = [f"Tema: {story_inputs.theme}"]
         
         # Agregar personajes si fueron seleccionados
@@ -155,12 +112,12 @@ async def generate_story(
             context_parts.append(f"Elementos especiales: {story_inputs.special_elements}")
         
         context = " | ".join(context_parts)
-        print(f"[generateStory] Contexto construido: {context}")
+        print(f"[{log_tag}] Contexto construido: {context}")
         
         # 2. Convertir formato moderno a formato de prompt legacy
         # Si no hay personajes, usar tema como base
         main_character = story_inputs.character_names[0] if story_inputs.character_names else "un personaje"
-        print(f"[generateStory] Personaje principal: {main_character}")
+        print(f"[{log_tag}] Personaje principal: {main_character}")
         
         prompt_inputs = StoryPromptInput(
             personaje=main_character,
@@ -169,43 +126,106 @@ async def generate_story(
             personajes_secundarios=story_inputs.character_names[1:] if story_inputs.character_names and len(story_inputs.character_names) > 1 else None
         )
         
+        # Trackear lecciones aplicadas (mientras llega el embedding del tema).
+        # Las llamadas síncronas a la BD van a un hilo para no bloquear el event loop
+        from services.learning_service import learning_service
+        active_lessons = await asyncio.to_thread(learning_service.get_active_lessons)
+        applied_lesson_ids = [lesson['lesson_id'] for lesson in active_lessons]
+        
+        if applied_lesson_ids:
+            print(f"[{log_tag}] 🎓 Aplicando {len(applied_lesson_ids)} lecciones al cuento")
+        
         # 2.5. Buscar cuentos similares con RAG
-        print(f"[generateStory] 🔍 Buscando cuentos similares con RAG...")
-        from services.rag_service import rag_service
+        print(f"[{log_tag}] 🔍 Buscando cuentos similares con RAG...")
+        try:
+            theme_embedding = await asyncio.wait_for(theme_embedding_task, RAG_EMBEDDING_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            # Sin esperar más: RAG continúa solo con la búsqueda léxica
+            print(f"[{log_tag}] ⏱️ Embedding del tema sin respuesta en {RAG_EMBEDDING_TIMEOUT_SECONDS}s")
+            theme_embedding = []
         
-        similar_stories = await rag_service.search_similar_stories(
+        similar_stories = await _timed(timings, "rag", rag_service.search_similar_stories(
             db=db_session,
             theme=story_inputs.theme,
             target_age=story_inputs.target_age,
             top_k=2,  # Máximo 2 ejemplos
             min_similarity=0.5,  # Similitud mínima 50%
-            min_score=7.5  # Score mínimo 7.5/10
-        )
+            min_score=7.5,  # Score mínimo 7.5/10
+            theme_embedding=theme_embedding
+        ))
         
         if similar_stories:
-            print(f"[generateStory] ✅ RAG encontró {len(similar_stories)} ejemplos similares")
+            print(f"[{log_tag}] ✅ RAG encontró {len(similar_stories)} ejemplos similares")
         else:
-            print(f"[generateStory] ℹ️ RAG no encontró ejemplos suficientemente similares")
+            print(f"[{log_tag}] ℹ️ RAG no encontró ejemplos suficientemente similares")
         
-        print(f"[generateStory] 🔧 Generando prompt con prompt_service...")
-        prompt = await prompt_service.build_story_prompt(
+        print(f"[{log_tag}] 🔧 Generando prompt con prompt_service...")
+        prompt_prefix, prompt_rest = await _timed(timings, "prompt", prompt_service.build_story_prompt_parts(
             prompt_inputs, 
             apply_lessons=True,
             similar_stories=similar_stories
+        ))
+        prompt = prompt_prefix + prompt_rest
+        print(f"[{log_tag}] ✅ Prompt generado ({len(prompt)} caracteres)")
+    finally:
+        theme_embedding_task.cancel()  # Sin efecto si ya terminó
+    
+    return prompt, applied_lesson_ids, prompt_prefix
+
+
+def _clean_title(title: str) -> str:
+    """Limpiar título de markdown o caracteres especiales (puede que Gemini aún los ponga)"""
+    title = title.replace('#', '').replace('*', '').strip()
+    if len(title) > 100:
+        title = title[:97] + "..."
+    return title
+
+
+@router.post(
+    "/generate",
+    response_model=StoryResponseWithPrompt,
+    status_code=status.HTTP_201_CREATED,
+    summary="Generar un cuento automáticamente",
+)
+async def generate_story(
+    story_inputs: StoryGenerateInput, 
+    response: Response,
+    db_session: AsyncSession = Depends(get_async_db)
+):
+    """
+    Genera un cuento completo usando Gemini basado en los inputs del usuario.
+    Además, encola automáticamente una crítica (critique_job_id) para mejorar el sistema.
+    La duración de cada paso se devuelve en la cabecera Server-Timing.
+    """
+    print(f"[generateStory] 🎯 Iniciando generación de cuento...")
+    print(f"[generateStory] Datos del cuento:")
+    print(f"  - theme: {story_inputs.theme}")
+    print(f"  - character_names: {story_inputs.character_names}")
+    print(f"  - moral_lesson: {story_inputs.moral_lesson}")
+    print(f"  - target_age: {story_inputs.target_age}")
+    print(f"  - length: {story_inputs.length}")
+    
+    if not gemini_service.is_configured():
+        print(f"[generateStory] ❌ Gemini no configurado")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio Gemini no configurado. Verifica GEMINI_API_KEY."
         )
-        print(f"[generateStory] ✅ Prompt generado ({len(prompt)} caracteres)")
-        
-        # Trackear lecciones aplicadas
-        from services.learning_service import learning_service
-        active_lessons = learning_service.get_active_lessons()
-        applied_lesson_ids = [lesson['lesson_id'] for lesson in active_lessons]
-        
-        if applied_lesson_ids:
-            print(f"[generateStory] 🎓 Aplicando {len(applied_lesson_ids)} lecciones al cuento")
+    
+    from services.rag_service import rag_service
+    from services.learning_service import learning_service
+    timings: Dict[str, float] = {}
+    request_start = time.perf_counter()
+    
+    try:
+        prompt, applied_lesson_ids, prompt_prefix = await _prepare_story_prompt(story_inputs, db_session, timings)
         
         # 3. Generar cuento con Gemini
         print(f"[generateStory] 🤖 Enviando request a Gemini...")
-        gemini_response = await gemini_service.generate_story(prompt)
+        token_usage: Dict[str, Any] = {}
+        gemini_response = await _timed(timings, "story", gemini_service.generate_story(
+            prompt, cache_prefix=prompt_prefix, usage=token_usage
+        ))
         
         if not gemini_response:
             print(f"[generateStory] ❌ Gemini no retornó contenido o título válido")
@@ -217,47 +237,61 @@ async def generate_story(
         title = gemini_response.get("title", f"Cuento sobre {story_inputs.theme}")
         story_content = gemini_response.get("content")
         
-        # Limpiar título de markdown o caracteres especiales (puede que Gemini aún los ponga)
-        title = title.replace('#', '').replace('*', '').strip()
-        if len(title) > 100:
-            title = title[:97] + "..."
+        title = _clean_title(title)
         
         print(f"[generateStory] ✅ Cuento generado ({len(story_content)} caracteres)")
         print(f"[generateStory] 📌 Título: {title}")
         
-        # 5. Generar embedding
-        print(f"[generateStory] 📊 Generando embedding...")
-        embedding_vector = await gemini_service.generate_embedding(story_content)
-        print(f"[generateStory] ✅ Embedding generado")
-        
-        # 6. Generar plantilla de ilustraciones
-        print(f"[generateStory] 🎨 Generando plantilla de ilustraciones...")
-        illustration_template = await gemini_service.generate_illustration_template(story_content, title)
-        print(f"[generateStory] ✅ Plantilla de ilustraciones generada")
+        # 5-6. Embeddings (cuento completo + fragmentos, una petición) y plantilla de ilustraciones en paralelo
+        print(f"[generateStory] 📊🎨 Generando embedding y plantilla de ilustraciones en paralelo...")
+        enrichment_start = time.perf_counter()
+        embedded, illustration_template = await asyncio.gather(
+            _timed(timings, "embedding", embed_stories(gemini_service, [story_content])),
+            _timed(timings, "illustration", gemini_service.generate_illustration_template(story_content, title)),
+        )
+        embedding_vector, chunks = embedded[0] or (None, [])
+        timings["enrichment"] = (time.perf_counter() - enrichment_start) * 1000
+        print(f"[generateStory] ✅ Embedding y plantilla generados ({timings['enrichment']:.0f} ms)")
         
-        # 7. Guardar en base de datos (SQLite usa embedding_json en lugar de embedding)
+        # 7. Guardar en base de datos (embedding como BLOB binario float32/float16)
         print(f"[generateStory] 💾 Guardando en base de datos...")
+        db_start = time.perf_counter()
         db_story = Story(
             title=title,
             content=story_content,
             is_seed=False,
-            embedding_json=embedding_vector,  # SQLite usa JSON para el vector
             illustration_template=illustration_template,  # JSON con plantilla de ilustraciones
+            **embedding_columns(embedding_vector, EMBEDDING_STORAGE_DTYPE),
         )
-        db_session.add(db_story)
-        db_session.commit()
-        db_session.refresh(db_story)
         
-        print(f"[generateStory] ✅ Cuento guardado con ID: {db_story.id}")
+        def save(session: Session):
+            session.add(db_story)
+            session.flush()
+            chunks_at = save_story_chunks(session, db_story.id, chunks, EMBEDDING_STORAGE_DTYPE)
+            session.commit()
+            session.refresh(db_story)
+            return chunks_at
+        
+        chunks_at = await run_db(db_session, save)
+        
+        timings["db"] = (time.perf_counter() - db_start) * 1000
+        print(f"[generateStory] ✅ Cuento guardado con ID: {db_story.id} ({len(chunks)} fragmentos)")
+        
+        # Añadir el nuevo cuento (y sus fragmentos) al índice vectorial de RAG
+        rag_service.add_to_index(db_story.id, embedding_vector, db_story.embedding_updated_at)
+        rag_service.add_chunks_to_index(db_story.id, [vector for _, vector in chunks], chunks_at)
         
         # Incrementar contador de aplicación de lecciones
         if applied_lesson_ids:
-            learning_service.increment_lesson_application(applied_lesson_ids)
+            await asyncio.to_thread(learning_service.increment_lesson_application, applied_lesson_ids)
             print(f"[generateStory] 📊 Contador de aplicación actualizado para {len(applied_lesson_ids)} lecciones")
         
-        # 8. Disparar crítica automática en background
-        background_tasks.add_task(auto_critique_story, db_story.id, story_content)
-        print(f"[generateStory] 📝 Crítica automática programada para cuento {db_story.id}")
+        # 8. Encolar crítica automática (la ejecuta el worker de jobs)
+        critique_job_id = await asyncio.to_thread(enqueue_critique, db_story.id)
+        print(f"[generateStory] 📝 Crítica automática encolada para cuento {db_story.id} (job {critique_job_id})")
+        
+        timings["total"] = (time.perf_counter() - request_start) * 1000
+        response.headers["Server-Timing"] = _server_timing(timings)
         
         return StoryResponseWithPrompt(
             id=db_story.id,
@@ -267,6 +301,8 @@ async def generate_story(
             is_seed=db_story.is_seed,
             created_at=db_story.created_at,
             prompt_used=prompt,
+            critique_job_id=critique_job_id,
+            token_usage=token_usage or None,
         )
         
     except HTTPException:
@@ -282,16 +318,122 @@ async def generate_story(
         )
 
 
+@router.post(
+    "/generate/stream",
+    summary="Generar un cuento en streaming (Server-Sent Events)",
+)
+async def generate_story_stream(
+    story_inputs: StoryGenerateInput,
+):
+    """
+    Igual que /generate pero transmite el cuento mientras Gemini lo escribe.
+    
+    Eventos SSE emitidos:
+    - `start`: inmediato, confirma que la generación comenzó
+    - `title`: el título en cuanto se ha recibido completo
+    - `token`: fragmentos del contenido a medida que llegan
+    - `done`: el cuento guardado (id, título, contenido, created_at)
+    - `error`: detalle del fallo (el stream se cierra tras él)
+    
+    El embedding, la plantilla de ilustraciones y la crítica se encolan como
+    jobs; sus IDs llegan en el evento `done` para consultar /api/jobs/{id}.
+    """
+    print(f"[generateStoryStream] 🎯 Iniciando generación en streaming (tema: {story_inputs.theme})")
+    
+    if not gemini_service.is_configured():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio Gemini no configurado. Verifica GEMINI_API_KEY."
+        )
+    
+    async def event_stream():
+        yield sse_event("start", {"theme": story_inputs.theme})
+        
+        timings: Dict[str, float] = {}
+        # La sesión de get_async_db se cierra antes de que empiece el cuerpo del
+        # stream: se abre una propia que dura lo mismo que la generación
+        db_session = AsyncSessionLocal()
+        try:
+            prompt, applied_lesson_ids, prompt_prefix = await _prepare_story_prompt(
+                story_inputs, db_session, timings, log_tag="generateStoryStream"
+            )
+            
+            # 3. Transmitir el cuento según llega de Gemini
+            parser = StoryStreamParser()
+            story_start = time.perf_counter()
+            token_usage: Dict[str, Any] = {}
+            async for chunk in gemini_service.generate_story_stream(
+                prompt, cache_prefix=prompt_prefix, usage=token_usage
+            ):
+                for kind, text in parser.feed(chunk):
+                    if kind == "title":
+                        yield sse_event("title", {"title": _clean_title(text)})
+                    else:
+                        yield sse_event("token", {"text": text})
+            timings["story"] = (time.perf_counter() - story_start) * 1000
+            
+            story_data = parser.result() or gemini_service.parse_story_json(parser.buffer)
+            if not story_data:
+                print(f"[generateStoryStream] ❌ Gemini no retornó contenido o título válido")
+                yield sse_event("error", {"detail": "Error generando el cuento con Gemini: No se pudo obtener título o contenido."})
+                return
+            
+            title = _clean_title(story_data["title"] or f"Cuento sobre {story_inputs.theme}")
+            story_content = story_data["content"]
+            print(f"[generateStoryStream] ✅ Cuento generado ({len(story_content)} caracteres) - {title}")
+            
+            # 4. Guardar ya el cuento; embedding e ilustraciones llegan después
+            db_story = Story(title=title, content=story_content, is_seed=False)
+            db_session.add(db_story)
+            await db_session.commit()
+            print(f"[generateStoryStream] ✅ Cuento guardado con ID: {db_story.id}")
+            
+            if applied_lesson_ids:
+                from services.learning_service import learning_service
+                await asyncio.to_thread(learning_service.increment_lesson_application, applied_lesson_ids)
+            
+            # Embedding, ilustraciones y crítica quedan en la cola de jobs
+            jobs = {
+                "embedding": await asyncio.to_thread(enqueue_embedding_backfill, db_story.id, illustration=True),
+                "critique": await asyncio.to_thread(enqueue_critique, db_story.id),
+            }
+            
+            yield sse_event("done", {
+                "id": db_story.id,
+                "title": db_story.title,
+                "content": db_story.content,
+                "version": db_story.version,
+                "is_seed": db_story.is_seed,
+                "created_at": db_story.created_at.isoformat(),
+                "jobs": jobs,
+                "timings": {step: round(ms, 1) for step, ms in timings.items()},
+                "usage": token_usage or None,
+            })
+        except Exception as e:
+            import traceback
+            print(f"[generateStoryStream] ❌ Error en la generación en streaming: {e}")
+            traceback.print_exc()
+            yield sse_event("error", {"detail": f"Error en la generación automática: {str(e)}"})
+        finally:
+            await db_session.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post(
     "/prompt",
     response_model=StoryPromptResponse,
     status_code=status.HTTP_200_OK,
     summary="Generar un prompt de cuento",
 )
-def generate_story_prompt(prompt_inputs: StoryPromptInput):
+async def generate_story_prompt(prompt_inputs: StoryPromptInput):
     """Genera un prompt basado en la guía de estilo, el input del usuario y datos del personaje."""
     try:
-        prompt = prompt_service.build_story_prompt(prompt_inputs)
+        prompt = await prompt_service.build_story_prompt(prompt_inputs)
         return StoryPromptResponse(prompt=prompt)
     except Exception as e:
         raise HTTPException(
@@ -306,7 +448,7 @@ def generate_story_prompt(prompt_inputs: StoryPromptInput):
     status_code=status.HTTP_201_CREATED,
     summary="Crear un nuevo cuento",
 )
-def create_story(story: StoryCreate, db_session: Session = Depends(get_db)):
+async def create_story(story: StoryCreate, db_session: AsyncSession = Depends(get_async_db)):
     """
     Crea un nuevo cuento en la base de datos.
 
@@ -314,28 +456,31 @@ def create_story(story: StoryCreate, db_session: Session = Depends(get_db)):
     - **content**: Contenido completo del cuento.
     - **is_seed**: Marcar como `True` si es uno de los 60 cuentos originales.
     - **prompt_inputs**: Opcional. Datos del usuario para generar un prompt.
+
+    El embedding (con fragmentos y plantilla de ilustraciones) y la crítica
+    automática se encolan como jobs; critique_job_id se consulta en /api/jobs/{id}.
     """
     prompt_used = None
     if story.prompt_inputs:
         try:
-            prompt_used = prompt_service.build_story_prompt(story.prompt_inputs)
+            prompt_used = await prompt_service.build_story_prompt(story.prompt_inputs)
         except Exception:
             # Si falla la generación del prompt, continuamos sin él
             pass
 
-    # TODO: Lógica para generar el embedding aquí (Function A y B de tu plan)
     db_story = Story(
         title=story.title,
         content=story.content,
         is_seed=story.is_seed,
-        embedding_json=None,  # SQLite usa JSON para el vector
     )
     db_session.add(db_story)
-    db_session.commit()
-    db_session.refresh(db_story)
+    await db_session.commit()
 
-    # TODO: Disparar la tarea asíncrona de autocrítica (Function C)
-    # self_critique_task.delay(db_story.id)
+    # Embedding, ilustraciones y crítica quedan en la cola de jobs (como en /generate/stream)
+    embedding_job_id = await asyncio.to_thread(enqueue_embedding_backfill, db_story.id, illustration=True)
+    critique_job_id = await asyncio.to_thread(enqueue_critique, db_story.id)
+    print(f"[createStory] 📝 Cuento {db_story.id} guardado: embedding (job {embedding_job_id}) "
+          f"y crítica (job {critique_job_id}) encolados")
 
     return StoryResponseWithPrompt(
         id=db_story.id,
@@ -345,25 +490,88 @@ def create_story(story: StoryCreate, db_session: Session = Depends(get_db)):
         is_seed=db_story.is_seed,
         created_at=db_story.created_at,
         prompt_used=prompt_used,
+        critique_job_id=critique_job_id,
     )
 
 
 @router.get(
     "",
-    response_model=List[StoryResponse],
-    summary="Obtener una lista de cuentos",
+    response_model=StoryPage,
+    summary="Obtener una página de cuentos",
 )
 def get_stories(
     is_seed: Optional[bool] = None,
-    limit: int = 100,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
+    with_counts: bool = Query(False, description="Incluir total de cuentos y creados (recorre el índice)"),
     db_session: Session = Depends(get_db),
 ):
-    """Obtiene una lista de todos los cuentos, con opción de filtrar por 'seed'."""
-    query = db_session.query(Story)
+    """
+    Lista los cuentos del más reciente al más antiguo, con opción de filtrar
+    por 'seed'. Paginación keyset sobre (created_at, id): cada página cuesta lo
+    mismo sin importar cuántos cuentos haya. Solo se leen las columnas de la
+    lista y un extracto del contenido, nunca los embeddings.
+    """
+    query = db_session.query(
+        Story.id,
+        Story.title,
+        func.substr(Story.content, 1, STORY_EXCERPT_CHARS).label("excerpt"),
+        Story.version,
+        Story.is_seed,
+        Story.created_at,
+    )
     if is_seed is not None:
         query = query.filter(Story.is_seed == is_seed)
-    stories = query.limit(limit).all()
-    return stories
+
+    counts = {}
+    if with_counts:
+        total, generated = query.with_entities(
+            func.count(Story.id),
+            func.coalesce(func.sum(case((Story.is_seed.is_(True), 0), else_=1)), 0),
+        ).one()
+        counts = {"total": total, "generated": generated}
+
+    if cursor:
+        created_at, story_id = _decode_cursor(cursor)
+        query = query.filter(tuple_(Story.created_at, Story.id) < tuple_(created_at, story_id))
+    rows = query.order_by(Story.created_at.desc(), Story.id.desc()).limit(limit + 1).all()
+
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    rows = rows[:limit]
+
+    from services.rag_service import rag_service
+    latest = rag_service.get_latest_critique_scores(db_session, story_ids=[row.id for row in rows]) if rows else {}
+    items = [
+        StoryListItem(
+            id=row.id,
+            title=row.title,
+            excerpt=row.excerpt or "",
+            version=row.version or 1,
+            is_seed=bool(row.is_seed),
+            created_at=row.created_at,
+            score=latest.get(row.id, {}).get("score"),
+        )
+        for row in rows
+    ]
+    return StoryPage(items=items, next_cursor=next_cursor, **counts)
+
+
+@router.get(
+    "/search",
+    response_model=List[StorySearchResult],
+    summary="Buscar cuentos por texto",
+)
+def search_stories_endpoint(
+    q: str = Query(..., min_length=1, description="Palabras a buscar en título y contenido"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db_session: Session = Depends(get_db),
+):
+    """
+    Búsqueda de texto completo (FTS5) ordenada por relevancia BM25, con un
+    extracto de cada cuento. No depende de Gemini.
+    """
+    return search_stories(db_session, q, limit=limit, offset=offset)
 
 
 @router.get(
@@ -373,7 +581,7 @@ def get_stories(
 )
 def get_story(story_id: uuid.UUID, db_session: Session = Depends(get_db)):
     """Obtiene los detalles de un cuento específico por su ID."""
-    story = db_session.query(Story).filter(Story.id == str(story_id)).first()
+    story = load_story(db_session, str(story_id), "illustration")
     if not story:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Story not found"
@@ -390,8 +598,8 @@ def get_story_critiques(story_id: str, db_session: Session = Depends(get_db)):
     Obtiene todas las críticas generadas automáticamente para un cuento específico.
     Útil para ver cómo el sistema evaluó el cuento y qué lecciones aprendió.
     """
-    # Verificar que el cuento existe
-    story = db_session.query(Story).filter(Story.id == story_id).first()
+    # Verificar que el cuento existe (solo se lee el título)
+    story = db_session.query(Story.title).filter(Story.id == story_id).first()
     if not story:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
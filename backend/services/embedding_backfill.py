@@ -0,0 +1,200 @@
+# Backfill de embeddings de los cuentos que no lo tienen (o no tienen fragmentos)
+# Recorre los cuentos pendientes por id (keyset) en oleadas de `concurrency`
+# lotes de `batch_size` cuentos; cada lote envía el texto completo y los
+# fragmentos de sus cuentos en peticiones batch de embed_content.
+# Tras cada oleada se guarda un checkpoint en app_state, así que si el proceso
+# se interrumpe la siguiente ejecución continúa donde se quedó.
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from config import EMBEDDING_BACKFILL_BATCH_SIZE, EMBEDDING_BACKFILL_CONCURRENCY, EMBEDDING_STORAGE_DTYPE
+from models.database_sqlite import AppState, SessionLocal, Story, StoryChunk
+from models.embeddings import embedding_columns
+from services.story_chunks import embed_stories, save_story_chunks
+
+STATE_KEY = "embedding_backfill"
+
+
+class EmbeddingBackfill:
+    """Calcula en lotes los embeddings pendientes con checkpoints reanudables."""
+
+    # Máximo de cuentos por lote
+    MAX_BATCH_SIZE = 100
+
+    def __init__(
+        self,
+        gemini=None,
+        session_factory: Callable[[], Any] = SessionLocal,
+        batch_size: int = EMBEDDING_BACKFILL_BATCH_SIZE,
+        concurrency: int = EMBEDDING_BACKFILL_CONCURRENCY,
+        storage_dtype: str = EMBEDDING_STORAGE_DTYPE,
+        add_to_index: Optional[Callable] = None,
+    ):
+        if gemini is None:
+            from services.gemini_service import gemini_service
+            gemini = gemini_service
+        self.gemini = gemini
+        self._session_factory = session_factory
+        self.batch_size = max(1, min(batch_size, self.MAX_BATCH_SIZE))
+        self.concurrency = max(1, concurrency)
+        self.storage_dtype = storage_dtype
+        self._add_to_index = add_to_index
+
+    # --- Checkpoint ---
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """Estado de la última ejecución (None si nunca se ejecutó)."""
+        db = self._session_factory()
+        try:
+            row = db.get(AppState, STATE_KEY)
+            return dict(row.value) if row and row.value else None
+        finally:
+            db.close()
+
+    def _save_checkpoint(self, state: Dict[str, Any]):
+        state["updated_at"] = datetime.utcnow().isoformat()
+        db = self._session_factory()
+        try:
+            db.merge(AppState(key=STATE_KEY, value=dict(state), updated_at=datetime.utcnow()))
+            db.commit()
+        finally:
+            db.close()
+
+    def _pending_query(self, db, cursor: Optional[str]):
+        has_chunks = db.query(StoryChunk.id).filter(StoryChunk.story_id == Story.id).exists()
+        query = db.query(Story.id, Story.content).filter(Story.embedding_blob.is_(None) | ~has_chunks)
+        if cursor is not None:
+            query = query.filter(Story.id > cursor)
+        return query
+
+    def _count_pending(self, cursor: Optional[str]) -> int:
+        db = self._session_factory()
+        try:
+            return self._pending_query(db, cursor).count()
+        finally:
+            db.close()
+
+    def _next_rows(self, cursor: Optional[str], limit: int) -> list:
+        db = self._session_factory()
+        try:
+            return self._pending_query(db, cursor).order_by(Story.id).limit(limit).all()
+        finally:
+            db.close()
+
+    # --- Ejecución ---
+
+    def _save_vectors(self, rows, embedded) -> List[tuple]:
+        """
+        Guarda el embedding y los fragmentos de cada cuento del lote. Retorna
+        (id, vector, fecha, vectores de los fragmentos, fecha de los fragmentos) de los guardados.
+        """
+        saved = []
+        db = self._session_factory()
+        try:
+            for row, (vector, chunks) in zip(rows, embedded):
+                if db.query(Story.id).filter(Story.id == row.id).first() is None:
+                    continue  # Borrado mientras se calculaba
+                columns = embedding_columns(vector, self.storage_dtype)
+                # El vector completo solo si sigue sin él (otro job pudo calcularlo mientras tanto)
+                db.query(Story).filter(
+                    Story.id == row.id, Story.embedding_blob.is_(None)
+                ).update(columns, synchronize_session=False)
+                chunks_at = save_story_chunks(db, row.id, chunks, self.storage_dtype)
+                saved.append((row.id, vector, columns["embedding_updated_at"],
+                               [chunk_vector for _, chunk_vector in chunks], chunks_at))
+            db.commit()
+        finally:
+            db.close()
+        return saved
+
+    def _index(self, saved: List[tuple]):
+        add = self._add_to_index
+        add_chunks = None
+        if add is None:
+            # El índice de otros procesos lo recoge al sincronizar por embedding_updated_at
+            from services.rag_service import rag_service
+            add, add_chunks = rag_service.add_to_index, rag_service.add_chunks_to_index
+        for story_id, vector, embedded_at, chunk_vectors, chunks_at in saved:
+            add(story_id, vector, embedded_at)
+            if add_chunks is not None:
+                add_chunks(story_id, chunk_vectors, chunks_at)
+
+    def _save_and_index(self, batches, results, failed: List[str]) -> int:
+        """Guarda los lotes calculados y los añade al índice. Retorna los cuentos guardados."""
+        saved = []
+        for batch, embedded in zip(batches, results):
+            ok = [(row, item) for row, item in zip(batch, embedded) if item is not None]
+            failed.extend(row.id for row, item in zip(batch, embedded) if item is None)
+            if ok:
+                saved.extend(self._save_vectors([row for row, _ in ok], [item for _, item in ok]))
+        self._index(saved)
+        return len(saved)
+
+    async def run(
+        self,
+        restart: bool = False,
+        limit: Optional[int] = None,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Procesa los cuentos sin embedding. Continúa desde el checkpoint salvo
+        que la ejecución anterior terminara o se pida restart. Con limit se para
+        tras ese número de cuentos (la siguiente ejecución sigue desde ahí).
+        Retorna el estado final del checkpoint.
+
+        Las consultas, escrituras y checkpoints usan sesiones síncronas y se
+        ejecutan con asyncio.to_thread: el job puede correr en el event loop de la API.
+        """
+        state = await asyncio.to_thread(self.load_checkpoint)
+        if restart or not state or state.get("finished_at"):
+            state = {
+                "cursor": None, "total": None, "processed": 0, "embedded": 0, "failed": [],
+                "started_at": datetime.utcnow().isoformat(), "finished_at": None,
+            }
+        elif state.get("cursor"):
+            print(f"[EmbeddingBackfill] ⏯️ Reanudando desde el cuento {state['cursor']} "
+                  f"({state['processed']} ya procesados)")
+
+        remaining = await asyncio.to_thread(self._count_pending, state["cursor"])
+        state["total"] = state["processed"] + remaining
+        print(f"[EmbeddingBackfill] 📊 {remaining} cuentos sin embedding "
+              f"(lotes de {self.batch_size}, {self.concurrency} en paralelo)")
+
+        started = time.perf_counter()
+        done_this_run = 0
+        while limit is None or done_this_run < limit:
+            wave_size = self.batch_size * self.concurrency
+            if limit is not None:
+                wave_size = min(wave_size, limit - done_this_run)
+            rows = await asyncio.to_thread(self._next_rows, state["cursor"], wave_size)
+            if not rows:
+                state["finished_at"] = datetime.utcnow().isoformat()
+                break
+
+            batches = [rows[i:i + self.batch_size] for i in range(0, len(rows), self.batch_size)]
+            results = await asyncio.gather(*[
+                embed_stories(self.gemini, [row.content for row in batch]) for batch in batches
+            ])
+
+            saved = await asyncio.to_thread(self._save_and_index, batches, results, state["failed"])
+
+            state["cursor"] = rows[-1].id
+            state["processed"] += len(rows)
+            state["embedded"] += saved
+            done_this_run += len(rows)
+            await asyncio.to_thread(self._save_checkpoint, state)
+
+            rate = done_this_run / max(time.perf_counter() - started, 1e-6)
+            print(f"[EmbeddingBackfill] ⏳ {state['processed']}/{state['total']} cuentos "
+                  f"({state['embedded']} con embedding, {len(state['failed'])} fallidos) · {rate:.1f} cuentos/s")
+            if progress is not None:
+                progress(dict(state))
+
+        await asyncio.to_thread(self._save_checkpoint, state)
+        if state["finished_at"]:
+            print(f"[EmbeddingBackfill] ✅ Backfill completado: {state['embedded']} embeddings, "
+                  f"{len(state['failed'])} fallidos")
+        return state
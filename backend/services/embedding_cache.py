@@ -0,0 +1,210 @@
+# Cache de dos niveles para embeddings de temas
+# Nivel 1: LRU en memoria acotado por entradas y bytes (por proceso)
+# Nivel 2: tabla theme_embeddings en la BD (compartida entre workers y reinicios)
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+from models.database_sqlite import ThemeEmbedding
+from models.embeddings import encode_embedding, decode_embedding
+
+
+def normalize_theme(theme: str) -> str:
+    """Clave canónica de un tema: minúsculas y espacios colapsados."""
+    return " ".join(theme.lower().split())
+
+
+class ThemeEmbeddingCache:
+    """
+    LRU en memoria con caducidad (TTL) respaldado por SQLite.
+    Las claves son (tema normalizado, modelo de embedding) para que un cambio
+    de modelo no reutilice vectores incompatibles.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_entries: int = 1000,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_seconds: int = 0,
+        session_factory: Optional[Callable[[], Any]] = None,
+    ):
+        self.model = model
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._session_factory = session_factory
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # clave -> (vector, guardado_en)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, theme: str) -> bool:
+        key = normalize_theme(theme)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._expired(entry[1])
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    # --- Nivel 1: memoria ---
+
+    def _remember(self, key: str, vector: np.ndarray, stored_at: float):
+        """Inserta en el LRU y expulsa las entradas menos usadas si se superan los límites."""
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[0].nbytes
+            self._entries[key] = (vector, stored_at)
+            self._bytes += vector.nbytes
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, (old_vector, _) = self._entries.popitem(last=False)
+                self._bytes -= old_vector.nbytes
+                self.evictions += 1
+
+    def _from_memory(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[1]):
+                self._entries.pop(key)
+                self._bytes -= entry[0].nbytes
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    # --- Nivel 2: base de datos ---
+
+    def _from_disk(self, key: str) -> Optional[tuple]:
+        if self._session_factory is None:
+            return None
+        db = self._session_factory()
+        try:
+            row = db.query(ThemeEmbedding).filter(
+                ThemeEmbedding.theme_key == key, ThemeEmbedding.model == self.model
+            ).first()
+            if row is None:
+                return None
+            stored_at = row.created_at.replace(tzinfo=timezone.utc).timestamp()  # created_at en UTC naive
+            if self._expired(stored_at):
+                db.delete(row)
+                db.commit()
+                self.expirations += 1
+                return None
+            vector = decode_embedding(row.embedding_blob, row.embedding_dim)
+            return (vector, stored_at) if vector is not None else None
+        except Exception as e:
+            print(f"[ThemeCache] ⚠️ Error leyendo cache persistente: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _to_disk(self, key: str, vector: np.ndarray):
+        if self._session_factory is None:
+            return
+        db = self._session_factory()
+        try:
+            db.merge(ThemeEmbedding(
+                theme_key=key,
+                model=self.model,
+                embedding_blob=encode_embedding(vector),
+                embedding_dim=len(vector),
+                created_at=datetime.utcnow(),
+            ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[ThemeCache] ⚠️ Error guardando cache persistente: {e}")
+        finally:
+            db.close()
+
+    # --- API pública ---
+
+    def get(self, theme: str) -> Optional[np.ndarray]:
+        """Busca el embedding en memoria y después en la BD. None si no está."""
+        key = normalize_theme(theme)
+        vector = self._from_memory(key)
+        if vector is not None:
+            self.hits += 1
+            return vector
+
+        stored = self._from_disk(key)
+        if stored is not None:
+            self.disk_hits += 1
+            # Conservar la fecha original para que el TTL no se renueve al subir a memoria
+            stored_at = stored[1] if self.ttl_seconds > 0 else time.time()
+            self._remember(key, stored[0], stored_at)
+            return stored[0]
+
+        self.misses += 1
+        return None
+
+    def put(self, theme: str, embedding: Sequence[float]):
+        """Guarda el embedding en ambos niveles."""
+        key = normalize_theme(theme)
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        self._remember(key, vector, time.time())
+        self._to_disk(key, vector)
+
+    def clear(self, persistent: bool = False) -> int:
+        """Vacía el LRU (y la tabla del modelo actual si persistent=True)."""
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        if persistent and self._session_factory is not None:
+            db = self._session_factory()
+            try:
+                removed = max(removed, db.query(ThemeEmbedding).filter(
+                    ThemeEmbedding.model == self.model
+                ).delete())
+                db.commit()
+            finally:
+                db.close()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño, límites y contadores del cache."""
+        lookups = self.hits + self.disk_hits + self.misses
+        persisted = None
+        if self._session_factory is not None:
+            db = self._session_factory()
+            try:
+                persisted = db.query(ThemeEmbedding).filter(ThemeEmbedding.model == self.model).count()
+            except Exception:
+                persisted = None
+            finally:
+                db.close()
+        return {
+            "model": self.model,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "persisted_entries": persisted,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+        }
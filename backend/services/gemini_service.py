@@ -1,65 +1,343 @@
 # Servicio de integración con Gemini (usando nuevo SDK google-genai)
+import asyncio
+import hashlib
+import threading
+import time
 from google import genai
-from typing import Optional, Dict, Any
-from config import GEMINI_API_KEY
+from google.genai import types
+from typing import AsyncIterator, Optional, Dict, Any, List, Tuple
+from config import (
+    GEMINI_API_KEY,
+    GEMINI_CONTEXT_CACHE,
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+    GEMINI_EMBEDDING_MODEL,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_RESPONSE_CACHE,
+    GEMINI_RESPONSE_CACHE_MAX_BYTES,
+)
+from services.response_cache import GeminiResponseCache
+
+TEXT_MODEL = 'gemini-2.5-pro'
+
+# Versiones de los prompts cuyas respuestas se cachean: subirlas al cambiar el
+# parseo o el significado de la respuesta invalida las entradas anteriores
+CRITIQUE_PROMPT_VERSION = "1"
+ILLUSTRATION_PROMPT_VERSION = "1"
 
 
 class GeminiService:
-    def __init__(self):
+    # Tras un fallo creando la cache de un prefijo no se reintenta hasta pasado este tiempo
+    CONTEXT_CACHE_RETRY_SECONDS = 600
+    # No usar un handle de cache a menos de este margen de su caducidad
+    CONTEXT_CACHE_MARGIN_SECONDS = 60
+
+    def __init__(
+        self,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        context_cache: bool = GEMINI_CONTEXT_CACHE,
+        context_cache_ttl: int = GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+        response_cache: Optional[GeminiResponseCache] = None,
+    ):
         if GEMINI_API_KEY:
             # El nuevo SDK usa Client() que toma la API key de GEMINI_API_KEY env var
             self.client = genai.Client(api_key=GEMINI_API_KEY)
             self._configured = True
         else:
             self._configured = False
+        # Límite de llamadas simultáneas a Gemini (el resto espera sin bloquear el event loop)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        # Cache de contexto del prefijo estable del prompt de cuentos
+        self.context_cache_enabled = context_cache
+        self.context_cache_ttl = context_cache_ttl
+        self._context_caches: Dict[str, Tuple[str, float]] = {}  # hash del prefijo -> (nombre, caduca en)
+        self._context_cache_failures: Dict[str, float] = {}  # hash del prefijo -> no reintentar hasta
+        self._context_cache_lock = asyncio.Lock()
+        # Cache de respuestas deterministas (None = siempre se llama a la API)
+        self.response_cache = response_cache
 
     def is_configured(self) -> bool:
         """Verifica si Gemini está configurado correctamente"""
         return self._configured
 
-    async def generate_story(self, prompt: str) -> Optional[Dict[str, Any]]:
+    async def _generate_content(self, contents, model: str = TEXT_MODEL):
+        """
+        Llamada a generate_content con el cliente asíncrono (client.aio), que
+        ejecuta la petición HTTP fuera del event loop de uvicorn.
+        """
+        async with self._semaphore:
+            return await self.client.aio.models.generate_content(model=model, contents=contents)
+
+    async def _stream_content(self, **kwargs) -> AsyncIterator[Any]:
+        """
+        Streaming de generate_content sin bloquear el event loop: el SDK
+        (google-genai 0.2.2) lee el cuerpo SSE de client.aio con llamadas
+        síncronas, así que se itera el stream síncrono en un hilo y los trozos
+        llegan por una asyncio.Queue. Si el consumidor deja de leer, el hilo
+        se detiene en el siguiente trozo.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for chunk in self.client.models.generate_content_stream(**kwargs):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        loop.run_in_executor(None, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    # --- Cache de contexto (prefijo estable del prompt) ---
+
+    @staticmethod
+    def _prefix_key(prefix: str, model: str = TEXT_MODEL) -> str:
+        return hashlib.sha256(f"{model}\n{prefix}".encode("utf-8")).hexdigest()
+
+    async def _get_context_cache(self, prefix: str) -> Optional[str]:
+        """
+        Nombre del cached content de Gemini para el prefijo, creándolo si hace
+        falta. None si la cache está desactivada o la API la rechaza (p. ej.
+        prefijo por debajo del mínimo de tokens): se enviará el prompt completo.
+        """
+        if not self.context_cache_enabled or not prefix:
+            return None
+        key = self._prefix_key(prefix)
+
+        def usable() -> Optional[str]:
+            now = time.monotonic()
+            cached = self._context_caches.get(key)
+            if cached and cached[1] - self.CONTEXT_CACHE_MARGIN_SECONDS > now:
+                return cached[0]
+            return None
+
+        name = usable()
+        if name or self._context_cache_failures.get(key, 0) > time.monotonic():
+            return name
+
+        async with self._context_cache_lock:
+            name = usable()  # Otra petición pudo crearla mientras esperábamos
+            if name or self._context_cache_failures.get(key, 0) > time.monotonic():
+                return name
+            try:
+                async with self._semaphore:
+                    cache = await self.client.aio.caches.create(
+                        model=TEXT_MODEL,
+                        contents=prefix,
+                        config=types.CreateCachedContentConfig(
+                            ttl=f"{self.context_cache_ttl}s",
+                            display_name=f"cuentacuentos-prompt-{key[:12]}",
+                        ),
+                    )
+            except Exception as e:
+                print(f"[gemini_service] ⚠️ Cache de contexto no disponible, se envía el prompt completo: {e}")
+                self._context_cache_failures[key] = time.monotonic() + self.CONTEXT_CACHE_RETRY_SECONDS
+                return None
+
+            now = time.monotonic()
+            # Los handles de prefijos anteriores caducan solos en Gemini (TTL)
+            self._context_caches = {k: v for k, v in self._context_caches.items() if v[1] > now}
+            self._context_caches[key] = (cache.name, now + self.context_cache_ttl)
+            print(f"[gemini_service] 🗄️ Cache de contexto creada para el prefijo {key[:12]} ({cache.name})")
+            return cache.name
+
+    def _forget_context_cache(self, prefix: str):
+        """Descarta el handle de un prefijo (p. ej. si Gemini ya no lo reconoce)."""
+        self._context_caches.pop(self._prefix_key(prefix), None)
+
+    async def _prepare_cached_request(self, prompt: str, cache_prefix: Optional[str]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Retorna (contenido a enviar, kwargs extra). Con cache de contexto solo
+        se envía la parte del prompt que sigue al prefijo cacheado.
+        """
+        if cache_prefix and prompt.startswith(cache_prefix):
+            cache_name = await self._get_context_cache(cache_prefix)
+            if cache_name:
+                return prompt[len(cache_prefix):], {"config": types.GenerateContentConfig(cached_content=cache_name)}
+        return prompt, None
+
+    @staticmethod
+    def token_usage(usage_metadata, context_cache: str) -> Dict[str, Any]:
+        """Tokens de entrada servidos desde la cache de contexto frente a los cobrados completos."""
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+        cached_tokens = getattr(usage_metadata, "cached_content_token_count", None) or 0
+        return {
+            "context_cache": context_cache,  # hit, miss o off
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "uncached_tokens": max(0, prompt_tokens - cached_tokens),
+            "output_tokens": getattr(usage_metadata, "candidates_token_count", None) or 0,
+        }
+
+    def _report_usage(self, usage: Optional[Dict[str, Any]], usage_metadata, context_cache: str):
+        report = self.token_usage(usage_metadata, context_cache)
+        print(f"[gemini_service] 🧾 Tokens de entrada: {report['prompt_tokens']} "
+              f"({report['cached_tokens']} desde cache de contexto, {report['uncached_tokens']} sin cache) "
+              f"· salida: {report['output_tokens']}")
+        if usage is not None:
+            usage.update(report)
+
+    # --- Cache de respuestas (crítica, plantilla de ilustraciones) ---
+
+    def _cached_response(self, kind: str, prompt_version: str, prompt: str, force_refresh: bool) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Retorna (clave, respuesta guardada). Con force_refresh no se consulta el
+        cache, pero la clave permite sobrescribir la entrada con la respuesta nueva.
+        Lee la BD de forma síncrona: llamar con asyncio.to_thread desde código async.
+        """
+        if self.response_cache is None:
+            return None, None
+        key = self.response_cache.make_key(kind, TEXT_MODEL, prompt_version, prompt)
+        if force_refresh:
+            return key, None
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            print(f"[gemini_service] ♻️ Respuesta de {kind} servida desde el cache ({key[:12]})")
+        return key, cached
+
+    def _store_response(self, key: Optional[str], kind: str, response: Dict[str, Any]):
+        if key is not None:
+            self.response_cache.put(key, kind, TEXT_MODEL, response)
+
+    async def _embed_content(self, contents, model: str = GEMINI_EMBEDDING_MODEL):
+        """Llamada a embed_content con el cliente asíncrono, sujeta al mismo límite."""
+        async with self._semaphore:
+            return await self.client.aio.models.embed_content(model=model, contents=contents)
+
+    async def generate_story(
+        self,
+        prompt: str,
+        cache_prefix: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
         """
         Genera un cuento usando Gemini 2.5 Pro, esperando un JSON con título y contenido.
         Retorna {'title': '...', 'content': '...'} o None si falla.
+        
+        Si el prompt empieza por cache_prefix, ese prefijo se sirve desde la cache
+        de contexto de Gemini. Si se pasa un dict en usage, se rellena con el
+        desglose de tokens (cacheados / sin cache).
         """
         if not self._configured:
             raise ValueError("Gemini API no está configurada. Verifica GEMINI_API_KEY.")
         
         try:
-            response = self.client.models.generate_content(
-                model='gemini-2.5-pro',
-                contents=prompt
-            )
+            contents, extra = await self._prepare_cached_request(prompt, cache_prefix)
+            context_cache = "hit" if extra else ("miss" if cache_prefix else "off")
+            try:
+                async with self._semaphore:
+                    response = await self.client.aio.models.generate_content(
+                        model=TEXT_MODEL, contents=contents, **(extra or {})
+                    )
+            except Exception as e:
+                if not extra:
+                    raise
+                # El handle pudo caducar o borrarse en Gemini: reintentar sin cache
+                print(f"[gemini_service] ⚠️ Fallo usando la cache de contexto, reintentando sin ella: {e}")
+                self._forget_context_cache(cache_prefix)
+                context_cache = "miss"
+                response = await self._generate_content(prompt)
             
+            self._report_usage(usage, getattr(response, "usage_metadata", None), context_cache)
             response_text = response.text.strip()
             print(f"[gemini_service] 📝 Respuesta cruda de Gemini (story): {response_text[:200]}...")
+            return self.parse_story_json(response_text)
             
-            # Remover bloques de markdown si existen
-            import re
-            import json
-            json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', response_text, re.DOTALL)
-            if json_match:
-                response_text = json_match.group(1)
-            
+        except Exception as e:
+            print(f"Error generando cuento: {e}")
+            return None
+
+    @staticmethod
+    def parse_story_json(response_text: str) -> Optional[Dict[str, Any]]:
+        """
+        Parsea la respuesta JSON de un cuento (con o sin bloque markdown).
+        Retorna {'title': '...', 'content': '...'} o None si no es válida.
+        """
+        import re
+        import json
+        
+        # Remover bloques de markdown si existen
+        response_text = response_text.strip()
+        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+        if json_match:
+            response_text = json_match.group(1)
+        
+        try:
             story_data = json.loads(response_text)
-            
-            if "title" not in story_data or "content" not in story_data:
-                print(f"Error: La respuesta JSON no contiene las claves 'title' o 'content'.")
-                return None
-            
-            print(f"[gemini_service] ✅ JSON de cuento parseado correctamente")
-            return {"title": story_data["title"], "content": story_data["content"]}
-            
         except json.JSONDecodeError as e:
             print(f"Error parseando JSON de cuento: {e}")
             print(f"Respuesta recibida: {response_text[:500]}")
             return None
-        except Exception as e:
-            print(f"Error generando cuento: {e}")
+        
+        if not isinstance(story_data, dict) or "title" not in story_data or "content" not in story_data:
+            print(f"Error: La respuesta JSON no contiene las claves 'title' o 'content'.")
             return None
+        
+        print(f"[gemini_service] ✅ JSON de cuento parseado correctamente")
+        return {"title": story_data["title"], "content": story_data["content"]}
 
-    async def generate_critique(self, story_content: str) -> Optional[Dict[str, Any]]:
-        """Genera una crítica del cuento usando Gemini 2.5 Pro"""
+    async def generate_story_stream(
+        self,
+        prompt: str,
+        cache_prefix: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Genera un cuento en streaming: produce los trozos de texto de la
+        respuesta de Gemini a medida que llegan (el JSON completo se reconstruye
+        concatenándolos). cache_prefix y usage funcionan como en generate_story.
+        """
+        if not self._configured:
+            raise ValueError("Gemini API no está configurada. Verifica GEMINI_API_KEY.")
+        
+        contents, extra = await self._prepare_cached_request(prompt, cache_prefix)
+        context_cache = "hit" if extra else ("miss" if cache_prefix else "off")
+        usage_metadata = None
+        received = False
+        try:
+            async with self._semaphore:
+                async for chunk in self._stream_content(
+                    model=TEXT_MODEL, contents=contents, **(extra or {})
+                ):
+                    usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                    if chunk.text:
+                        received = True
+                        yield chunk.text
+        except Exception as e:
+            if not extra or received:
+                raise
+            # Sin nada emitido aún: reintentar con el prompt completo
+            print(f"[gemini_service] ⚠️ Fallo usando la cache de contexto, reintentando sin ella: {e}")
+            self._forget_context_cache(cache_prefix)
+            context_cache = "miss"
+            async with self._semaphore:
+                async for chunk in self._stream_content(model=TEXT_MODEL, contents=prompt):
+                    usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                    if chunk.text:
+                        yield chunk.text
+        
+        self._report_usage(usage, usage_metadata, context_cache)
+
+    async def generate_critique(self, story_content: str, force_refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Genera una crítica del cuento usando Gemini 2.5 Pro.
+        Si ya existe una para el mismo cuento y versión del prompt se reutiliza,
+        salvo con force_refresh=True.
+        """
         if not self._configured:
             raise ValueError("Gemini API no está configurada. Verifica GEMINI_API_KEY.")
         
@@ -87,11 +365,14 @@ class GeminiService:
         Evalúa considerando que es para niños de 2-6 años, debe tener coherencia narrativa, buen ritmo, y seguir los principios de "Cuentos para Crecer".
         """
         
+        cache_key, cached = await asyncio.to_thread(
+            self._cached_response, "critique", CRITIQUE_PROMPT_VERSION, critique_prompt, force_refresh
+        )
+        if cached is not None:
+            return cached
+        
         try:
-            response = self.client.models.generate_content(
-                model='gemini-2.5-pro',
-                contents=critique_prompt
-            )
+            response = await self._generate_content(critique_prompt)
             
             # Limpiar respuesta (puede venir con markdown ```json...```)
             import json
@@ -108,6 +389,7 @@ class GeminiService:
             # Parsear JSON
             critique_data = json.loads(response_text)
             print(f"[gemini_service] ✅ JSON parseado correctamente")
+            await asyncio.to_thread(self._store_response, cache_key, "critique", critique_data)
             return critique_data
             
         except json.JSONDecodeError as e:
@@ -118,8 +400,14 @@ class GeminiService:
             print(f"Error generando crítica: {e}")
             return None
 
-    async def generate_illustration_template(self, story_content: str, story_title: str) -> Optional[Dict[str, Any]]:
-        """Genera plantilla JSON para ilustraciones basada en el cuento"""
+    async def generate_illustration_template(
+        self, story_content: str, story_title: str, force_refresh: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Genera plantilla JSON para ilustraciones basada en el cuento.
+        Se reutiliza la del cache si el cuento y el título no cambiaron, salvo
+        con force_refresh=True.
+        """
         if not self._configured:
             raise ValueError("Gemini API no está configurada. Verifica GEMINI_API_KEY.")
         
@@ -183,11 +471,14 @@ class GeminiService:
         - Usa el estilo "minimalist children's book" en todos los prompts
         """
         
+        cache_key, cached = await asyncio.to_thread(
+            self._cached_response, "illustration", ILLUSTRATION_PROMPT_VERSION, template_prompt, force_refresh
+        )
+        if cached is not None:
+            return cached
+        
         try:
-            response = self.client.models.generate_content(
-                model='gemini-2.5-pro',
-                contents=template_prompt
-            )
+            response = await self._generate_content(template_prompt)
             
             import json
             import re
@@ -202,6 +493,7 @@ class GeminiService:
             
             template_data = json.loads(response_text)
             print(f"[gemini_service] ✅ Plantilla de ilustraciones generada")
+            await asyncio.to_thread(self._store_response, cache_key, "illustration", template_data)
             return template_data
             
         except json.JSONDecodeError as e:
@@ -220,10 +512,7 @@ class GeminiService:
         try:
             # Nuevo SDK usa el método embed_content desde el cliente
             # IMPORTANTE: El parámetro es 'contents' (plural), no 'content'
-            result = self.client.models.embed_content(
-                model="models/gemini-embedding-001",
-                contents=text
-            )
+            result = await self._embed_content(text)
             # Log más conciso para el embedding
             embedding_values = result.embeddings[0].values
             print(f"[gemini_service] 📊 Embedding generado (primeros 5 valores: {embedding_values[:5]})")
@@ -236,6 +525,23 @@ class GeminiService:
 
 
 
+    async def generate_embeddings(self, texts: List[str]) -> Optional[List[list]]:
+        """
+        Genera los embeddings de varios textos en una sola petición batch.
+        Retorna los vectores en el mismo orden o None si falla.
+        """
+        if not self._configured:
+            raise ValueError("Gemini API no está configurada. Verifica GEMINI_API_KEY.")
+        
+        try:
+            result = await self._embed_content(list(texts))
+            vectors = [embedding.values for embedding in result.embeddings]
+            print(f"[gemini_service] 📊 {len(vectors)} embeddings generados en una petición")
+            return vectors
+        except Exception as e:
+            print(f"Error generando embeddings en lote: {e}")
+            return None
+
     async def synthesize_lessons(self, critiques_data: list) -> Optional[Dict[str, Any]]:
         """
         Sintetiza lecciones aprendidas de un lote de críticas usando Gemini.
@@ -303,10 +609,7 @@ IMPORTANTE:
 """
         
         try:
-            response = self.client.models.generate_content(
-                model='gemini-2.5-pro',
-                contents=synthesis_prompt
-            )
+            response = await self._generate_content(synthesis_prompt)
             
             import json
             import re
@@ -334,4 +637,11 @@ IMPORTANTE:
 
 
 # Instancia singleton
-gemini_service = GeminiService()
+def _create_response_cache() -> Optional[GeminiResponseCache]:
+    if not GEMINI_RESPONSE_CACHE:
+        return None
+    from models.database_sqlite import SessionLocal
+    return GeminiResponseCache(SessionLocal, max_bytes=GEMINI_RESPONSE_CACHE_MAX_BYTES)
+
+
+gemini_service = GeminiService(response_cache=_create_response_cache())
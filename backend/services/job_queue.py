@@ -0,0 +1,385 @@
+# Cola persistente de jobs sobre la tabla `jobs` de la BD
+# Los workers reclaman jobs con un lease que renuevan (heartbeat) mientras
+# trabajan; si un worker muere, el lease caduca y otro worker lo retoma.
+
+import asyncio
+import os
+import random
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, exists, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from config import (
+    JOBS_BACKOFF_BASE_SECONDS,
+    JOBS_BACKOFF_MAX_SECONDS,
+    JOBS_LEASE_SECONDS,
+    JOBS_MAX_ATTEMPTS,
+    JOBS_MAX_CONCURRENCY,
+    JOBS_POLL_INTERVAL,
+)
+from models.database_sqlite import Job, SessionLocal
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+ACTIVE_STATUSES = ("pending", "running")
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    """Representación serializable de un job para la API."""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "payload": job.payload,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "run_after": job.run_after,
+        "last_error": job.last_error,
+        "result": job.result,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class JobQueue:
+    """Operaciones atómicas sobre la tabla de jobs."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any] = SessionLocal,
+        max_attempts: int = JOBS_MAX_ATTEMPTS,
+        backoff_base: float = JOBS_BACKOFF_BASE_SECONDS,
+        backoff_max: float = JOBS_BACKOFF_MAX_SECONDS,
+    ):
+        self._session_factory = session_factory
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Optional[Dict[str, Any]] = None,
+        dedupe_key: Optional[str] = None,
+        delay_seconds: float = 0,
+        max_attempts: Optional[int] = None,
+    ) -> str:
+        """
+        Encola un job y retorna su ID. Si hay un job activo con la misma
+        dedupe_key se reutiliza en lugar de crear otro; si aún está pendiente,
+        el payload nuevo se fusiona con el suyo (p. ej. force_refresh no se pierde).
+        """
+        payload = payload or {}
+        db = self._session_factory()
+        try:
+            for attempt in range(3):
+                try:
+                    if dedupe_key:
+                        existing = db.query(Job).filter(Job.dedupe_key == dedupe_key).first()
+                        if existing and existing.status in ACTIVE_STATUSES:
+                            self._merge_payload(db, existing, payload)
+                            return existing.id
+                        if existing:
+                            # Terminado: liberar la clave para el nuevo job
+                            existing.dedupe_key = None
+                            db.flush()
+
+                    now = datetime.utcnow()
+                    job = Job(
+                        id=str(uuid.uuid4()),
+                        kind=kind,
+                        payload=payload,
+                        status="pending",
+                        dedupe_key=dedupe_key,
+                        max_attempts=max_attempts or self.max_attempts,
+                        run_after=now + timedelta(seconds=delay_seconds),
+                        created_at=now,
+                        updated_at=now,
+                    )
+                    db.add(job)
+                    db.commit()
+                    print(f"[JobQueue] 📥 Job {kind} encolado ({job.id})")
+                    return job.id
+                except IntegrityError:
+                    # Otro proceso encoló (o liberó) la misma dedupe_key a la vez:
+                    # se vuelve a leer; si el otro job ya no existe, se reintenta el INSERT
+                    db.rollback()
+                    if attempt == 2:
+                        raise
+        finally:
+            db.close()
+
+    def _merge_payload(self, db, existing: Job, payload: Dict[str, Any]):
+        """Fusiona el payload en un job duplicado solo si ningún worker lo ha reclamado aún."""
+        merged = {**(existing.payload or {}), **payload}
+        if existing.status != "pending" or merged == existing.payload:
+            return
+        updated = db.query(Job).filter(Job.id == existing.id, Job.status == "pending").update(
+            {Job.payload: merged, Job.updated_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+        if updated:
+            print(f"[JobQueue] 🔀 Payload fusionado en el job pendiente {existing.id}")
+
+    def claim(
+        self,
+        worker_id: str,
+        kinds: Optional[List[str]] = None,
+        lease_seconds: int = JOBS_LEASE_SECONDS,
+        exclusive_kinds: Optional[List[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Reclama el siguiente job ejecutable: pendiente y vencido, o en curso con
+        el lease caducado. El UPDATE condicional garantiza que solo un worker lo gana.
+        De los tipos en exclusive_kinds nunca hay más de un job en curso a la vez.
+        """
+        db = self._session_factory()
+        try:
+            for _ in range(5):
+                now = datetime.utcnow()
+                claimable = or_(
+                    and_(Job.status == "pending", Job.run_after <= now),
+                    and_(Job.status == "running", Job.lease_expires_at < now),
+                )
+                free = True
+                if exclusive_kinds:
+                    other = aliased(Job)
+                    busy = exists().where(
+                        other.kind == Job.kind,
+                        other.status == "running",
+                        other.lease_expires_at >= now,
+                        other.id != Job.id,
+                    )
+                    free = or_(Job.kind.notin_(exclusive_kinds), ~busy)
+                query = db.query(Job.id, Job.kind, Job.status, Job.attempts).filter(claimable, free)
+                if kinds:
+                    query = query.filter(Job.kind.in_(kinds))
+                candidate = query.order_by(Job.run_after, Job.created_at).first()
+                if candidate is None:
+                    return None
+
+                job_id, kind, status, attempts = candidate
+                values = {
+                    Job.status: "running",
+                    Job.attempts: attempts + 1,
+                    Job.locked_by: worker_id,
+                    Job.lease_expires_at: now + timedelta(seconds=lease_seconds),
+                    Job.updated_at: now,
+                }
+                if exclusive_kinds and kind in exclusive_kinds:
+                    # Liberar la clave: lo que se encole durante la ejecución queda pendiente detrás
+                    values[Job.dedupe_key] = None
+                won = db.query(Job).filter(
+                    Job.id == job_id, Job.status == status, Job.attempts == attempts, free
+                ).update(values, synchronize_session=False)
+                db.commit()
+                if won:
+                    if status == "running":
+                        print(f"[JobQueue] ♻️ Lease caducado, job {job_id} retomado por {worker_id}")
+                    return job_to_dict(db.get(Job, job_id))
+            return None
+        finally:
+            db.close()
+
+    def _update_owned(self, job_id: str, worker_id: str, values: Dict) -> bool:
+        """Actualiza un job solo si este worker sigue siendo su dueño."""
+        db = self._session_factory()
+        try:
+            values[Job.updated_at] = datetime.utcnow()
+            updated = db.query(Job).filter(
+                Job.id == job_id, Job.locked_by == worker_id, Job.status == "running"
+            ).update(values, synchronize_session=False)
+            db.commit()
+            return bool(updated)
+        finally:
+            db.close()
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: int = JOBS_LEASE_SECONDS) -> bool:
+        """Renueva el lease; False si el job ya no pertenece a este worker."""
+        return self._update_owned(job_id, worker_id, {
+            Job.lease_expires_at: datetime.utcnow() + timedelta(seconds=lease_seconds),
+        })
+
+    def complete(self, job_id: str, worker_id: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        now = datetime.utcnow()
+        return self._update_owned(job_id, worker_id, {
+            Job.status: "succeeded",
+            Job.result: result,
+            Job.last_error: None,
+            Job.locked_by: None,
+            Job.lease_expires_at: None,
+            Job.finished_at: now,
+        })
+
+    def backoff_seconds(self, attempts: int) -> float:
+        """Backoff exponencial con jitter: base * 2^(intentos-1), acotado."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def fail(self, job_id: str, worker_id: str, error: str, attempts: int, max_attempts: int) -> bool:
+        """Programa un reintento con backoff o marca el job como fallido definitivamente."""
+        now = datetime.utcnow()
+        if attempts < max_attempts:
+            delay = self.backoff_seconds(attempts)
+            print(f"[JobQueue] 🔁 Job {job_id} falló (intento {attempts}/{max_attempts}), "
+                  f"reintento en {delay:.0f}s: {error}")
+            values = {
+                Job.status: "pending",
+                Job.run_after: now + timedelta(seconds=delay),
+            }
+        else:
+            print(f"[JobQueue] ❌ Job {job_id} agotó sus {max_attempts} intentos: {error}")
+            values = {Job.status: "failed", Job.finished_at: now}
+        values.update({Job.last_error: error[:2000], Job.locked_by: None, Job.lease_expires_at: None})
+        return self._update_owned(job_id, worker_id, values)
+
+    def run_now(self, job_id: str) -> bool:
+        """Adelanta un job pendiente diferido para que se ejecute ya."""
+        db = self._session_factory()
+        try:
+            updated = db.query(Job).filter(Job.id == job_id, Job.status == "pending").update(
+                {Job.run_after: datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+            return updated > 0
+        finally:
+            db.close()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = self._session_factory()
+        try:
+            job = db.get(Job, job_id)
+            return job_to_dict(job) if job else None
+        finally:
+            db.close()
+
+    def list(self, status: Optional[str] = None, kind: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        db = self._session_factory()
+        try:
+            query = db.query(Job)
+            if status:
+                query = query.filter(Job.status == status)
+            if kind:
+                query = query.filter(Job.kind == kind)
+            return [job_to_dict(job) for job in query.order_by(Job.created_at.desc()).limit(limit).all()]
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Número de jobs por tipo y estado."""
+        db = self._session_factory()
+        try:
+            counts: Dict[str, Dict[str, int]] = {}
+            for kind, status, total in db.query(Job.kind, Job.status, func.count(Job.id)).group_by(Job.kind, Job.status):
+                counts.setdefault(kind, {})[status] = total
+            return counts
+        finally:
+            db.close()
+
+
+class JobWorker:
+    """
+    Drena la cola ejecutando hasta `concurrency` jobs a la vez, con heartbeat
+    del lease mientras cada job está en curso.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, JobHandler],
+        concurrency: int = JOBS_MAX_CONCURRENCY,
+        lease_seconds: int = JOBS_LEASE_SECONDS,
+        poll_interval: float = JOBS_POLL_INTERVAL,
+        worker_id: Optional[str] = None,
+        exclusive_kinds: Optional[List[str]] = None,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.exclusive_kinds = list(exclusive_kinds or [])
+        self._running: set = set()
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await asyncio.to_thread(self.queue.heartbeat, job_id, self.worker_id, self.lease_seconds):
+                print(f"[JobWorker] ⚠️ Lease perdido para job {job_id}")
+                return
+
+    async def _execute(self, job: Dict[str, Any]):
+        handler = self.handlers[job["kind"]]
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            print(f"[JobWorker] ▶️ Ejecutando job {job['kind']} ({job['id']}, intento {job['attempts']})")
+            result = await handler(job["payload"] or {})
+            await asyncio.to_thread(self.queue.complete, job["id"], self.worker_id, result)
+            print(f"[JobWorker] ✅ Job {job['kind']} completado ({job['id']})")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(traceback.format_exc())
+            await asyncio.to_thread(
+                self.queue.fail, job["id"], self.worker_id, error, job["attempts"], job["max_attempts"]
+            )
+        finally:
+            heartbeat.cancel()
+
+    async def run_once(self) -> int:
+        """Reclama jobs hasta llenar los huecos libres. Retorna cuántos lanzó."""
+        launched = 0
+        while len(self._running) < self.concurrency:
+            job = await asyncio.to_thread(
+                self.queue.claim, self.worker_id, list(self.handlers), self.lease_seconds, self.exclusive_kinds
+            )
+            if job is None:
+                break
+            task = asyncio.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            launched += 1
+        return launched
+
+    async def drain(self):
+        """Ejecuta jobs hasta que no quede ninguno ejecutable (útil en tests y scripts)."""
+        while True:
+            await self.run_once()
+            if not self._running:
+                # Un job pudo terminar (y reprogramarse) mientras se reclamaba: comprobar sin carreras
+                if not await self.run_once():
+                    return
+                continue
+            await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+
+    async def run(self, stop_event: Optional[asyncio.Event] = None):
+        """Bucle principal: sondea la cola hasta que se active stop_event."""
+        stop_event = stop_event or asyncio.Event()
+        print(f"[JobWorker] 🚀 Worker {self.worker_id} iniciado "
+              f"(concurrencia {self.concurrency}, tipos: {', '.join(self.handlers)})")
+        try:
+            while not stop_event.is_set():
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    print(f"[JobWorker] ⚠️ Error sondeando la cola: {e}")
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Dejar terminar los jobs en curso; si se cancelan, el lease caduca y se reintentan
+            if self._running:
+                await asyncio.gather(*self._running, return_exceptions=True)
+            print(f"[JobWorker] 🛑 Worker {self.worker_id} detenido")
+
+
+# Instancia singleton
+job_queue = JobQueue()
@@ -0,0 +1,235 @@
+# Handlers de los jobs en background y helpers para encolarlos
+# Cada handler recibe el payload del job; si lanza una excepción el job se
+# reintenta con backoff exponencial hasta agotar sus intentos.
+
+import asyncio
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import EMBEDDING_STORAGE_DTYPE
+from models.database_sqlite import Story, StoryChunk, Critique, SessionLocal
+from models.embeddings import embedding_columns
+from services.embedding_backfill import EmbeddingBackfill
+from services.gemini_service import gemini_service
+from services.job_queue import JobWorker, job_queue
+from services.story_chunks import embed_stories, save_story_chunks
+from services.synthesis_scheduler import synthesis_scheduler
+
+# Tipos de job de los que nunca se ejecuta más de uno a la vez
+EXCLUSIVE_KINDS = ["lesson_synthesis"]
+
+
+# --- Encolado ---
+
+def enqueue_critique(story_id: str, force_refresh: bool = False) -> str:
+    """
+    Encola la crítica automática de un cuento (una sola activa por cuento).
+    Con force_refresh se ignora la crítica cacheada y se pide una nueva a Gemini.
+    """
+    payload = {"story_id": story_id, "force_refresh": True} if force_refresh else {"story_id": story_id}
+    return job_queue.enqueue("critique", payload, dedupe_key=f"critique:{story_id}")
+
+
+def enqueue_embedding_backfill(story_id: Optional[str] = None, illustration: bool = False, restart: bool = False) -> str:
+    """
+    Encola la generación del embedding (y opcionalmente la plantilla) de un
+    cuento, o el backfill en lotes de todos los pendientes (restart ignora el
+    checkpoint de una ejecución interrumpida).
+    """
+    if story_id:
+        return job_queue.enqueue(
+            "embedding_backfill",
+            {"story_id": story_id, "illustration": illustration},
+            dedupe_key=f"embedding:{story_id}",
+        )
+    return job_queue.enqueue("embedding_backfill", {"restart": restart}, dedupe_key="embedding:all")
+
+
+# --- Handlers ---
+# Con JOBS_INPROCESS_WORKER los handlers corren en el event loop de la API:
+# toda la E/S síncrona a la BD (y al planificador) va a helpers que se
+# ejecutan con asyncio.to_thread; en el loop solo quedan las esperas a Gemini.
+
+def _story_content(story_id: str) -> Optional[str]:
+    db_session = SessionLocal()
+    try:
+        story = db_session.query(Story.content).filter(Story.id == story_id).first()
+        return story.content if story else None
+    finally:
+        db_session.close()
+
+
+def _save_critique(story_id: str, critique_data: Dict[str, Any], score: float) -> Tuple[str, Optional[str]]:
+    """Guarda la crítica y avisa al planificador de síntesis. Retorna (critique_id, synthesis_job_id)."""
+    db_session = SessionLocal()
+    try:
+        db_critique = Critique(
+            id=str(uuid.uuid4()),
+            story_id=story_id,
+            critique_text=str(critique_data),  # JSON completo como texto
+            score=score,
+        )
+        db_session.add(db_critique)
+        db_session.commit()
+        print(f"[critique_job] ✅ Crítica guardada para {story_id} - Score: {score}/10")
+        critique_id = db_critique.id
+    finally:
+        db_session.close()
+
+    # 🔄 BUCLE DE APRENDIZAJE: el planificador agrupa los avisos en una sola síntesis
+    return critique_id, synthesis_scheduler.notify()
+
+
+async def handle_critique(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Genera y guarda la crítica de un cuento y avisa al planificador de síntesis."""
+    story_id = payload["story_id"]
+    story_content = await asyncio.to_thread(_story_content, story_id)
+    if story_content is None:
+        print(f"[critique_job] ⚠️ El cuento {story_id} ya no existe")
+        return {"skipped": "story_not_found"}
+
+    print(f"[critique_job] 🎯 Generando crítica para cuento {story_id}")
+    critique_data = await gemini_service.generate_critique(
+        story_content, force_refresh=payload.get("force_refresh", False)
+    )
+    if not critique_data:
+        raise RuntimeError(f"Gemini no devolvió una crítica válida para {story_id}")
+
+    evaluation = critique_data.get("evaluation", {})
+    overall_score = evaluation.get("overall_score", 5)
+
+    critique_id, synthesis_job_id = await asyncio.to_thread(_save_critique, story_id, critique_data, overall_score)
+    return {"critique_id": critique_id, "score": overall_score, "synthesis_job_id": synthesis_job_id}
+
+
+def _backfill_needs(story_id: str, illustration: bool) -> Optional[Tuple[str, str, bool, bool]]:
+    """(contenido, título, falta embedding, falta plantilla) de un cuento, o None si no existe."""
+    db_session = SessionLocal()
+    try:
+        # Solo si faltan, sin leer el embedding ni la plantilla
+        story = db_session.query(
+            Story.content,
+            Story.title,
+            Story.embedding_blob.is_(None).label("missing_embedding"),
+            Story.illustration_template.is_(None).label("missing_illustration"),
+        ).filter(Story.id == story_id).first()
+        if story is None:
+            return None
+        needs_embedding = story.missing_embedding or not db_session.query(
+            StoryChunk.id
+        ).filter(StoryChunk.story_id == story_id).first()
+        return story.content, story.title, bool(needs_embedding), bool(illustration and story.missing_illustration)
+    finally:
+        db_session.close()
+
+
+def _save_backfill(
+    story_id: str,
+    illustration_template: Optional[Dict[str, Any]],
+    embedded: Optional[Tuple[List[float], list]],
+) -> bool:
+    """Guarda plantilla y/o embedding con sus fragmentos y los añade al índice de RAG."""
+    db_session = SessionLocal()
+    try:
+        story = db_session.query(Story).filter(Story.id == story_id).first()
+        if story is None:
+            return False
+        if illustration_template is not None:
+            story.illustration_template = illustration_template
+        if embedded is not None:
+            embedding_vector, chunks = embedded
+            for column, value in embedding_columns(embedding_vector, EMBEDDING_STORAGE_DTYPE).items():
+                setattr(story, column, value)
+            chunks_at = save_story_chunks(db_session, story_id, chunks, EMBEDDING_STORAGE_DTYPE)
+        db_session.commit()
+        embedded_at = story.embedding_updated_at
+    finally:
+        db_session.close()
+
+    if embedded is not None:
+        # El índice de otros procesos lo recoge al sincronizar por embedding_updated_at
+        from services.rag_service import rag_service
+        rag_service.add_to_index(story_id, embedding_vector, embedded_at)
+        rag_service.add_chunks_to_index(story_id, [vector for _, vector in chunks], chunks_at)
+    return True
+
+
+async def _backfill_story(story_id: str, illustration: bool) -> bool:
+    """Genera lo que le falte a un cuento (embedding y, si se pide, plantilla). True si hubo cambios."""
+    needs = await asyncio.to_thread(_backfill_needs, story_id, illustration)
+    if needs is None:
+        return False
+    content, title, needs_embedding, needs_illustration = needs
+    if not needs_embedding and not needs_illustration:
+        return False
+
+    async def nothing():
+        return None
+
+    embedded, illustration_template = await asyncio.gather(
+        embed_stories(gemini_service, [content]) if needs_embedding else nothing(),
+        gemini_service.generate_illustration_template(content, title) if needs_illustration else nothing(),
+    )
+    if needs_embedding and not embedded[0]:
+        raise RuntimeError(f"Gemini no devolvió embedding para {story_id}")
+
+    return await asyncio.to_thread(
+        _save_backfill, story_id, illustration_template, embedded[0] if needs_embedding else None
+    )
+
+
+async def handle_embedding_backfill(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Embedding (y plantilla opcional) de un cuento, o de todos los que no lo tengan en lotes."""
+    if payload.get("story_id"):
+        updated = await _backfill_story(payload["story_id"], payload.get("illustration", False))
+        return {"updated": int(updated)}
+
+    # Si el job se reintenta tras caerse el worker, el backfill sigue desde su checkpoint
+    state = await EmbeddingBackfill(gemini_service).run(restart=payload.get("restart", False))
+    return {"pending": state["total"], "updated": state["embedded"], "failed": len(state["failed"])}
+
+
+async def handle_lesson_synthesis(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Sintetiza lecciones de las críticas aún no sintetizadas y actualiza el perfil de estilo."""
+    from services.learning_service import learning_service
+
+    critiques_data = await asyncio.to_thread(synthesis_scheduler.next_batch)
+    if not critiques_data:
+        return {"lessons": 0, "critique_ids": []}
+
+    critique_ids = [c['id'] for c in critiques_data]
+    print(f"[synthesis_job] 🧠 Sintetizando {len(critique_ids)} críticas nuevas...")
+    synthesis_result = await gemini_service.synthesize_lessons(critiques_data)
+    if not synthesis_result:
+        raise RuntimeError("Gemini no devolvió una síntesis válida")
+
+    def save_synthesis() -> Optional[str]:
+        learning_service.add_lessons_to_history(synthesis_result, critique_ids)
+        learning_service.update_style_profile(synthesis_result)
+        synthesis_scheduler.mark_synthesized(critiques_data)
+        # Si quedaron críticas fuera del lote, programar la siguiente ronda
+        return synthesis_scheduler.notify()
+
+    next_job_id = await asyncio.to_thread(save_synthesis)
+    lessons_count = len(synthesis_result.get('lessons_learned', []))
+    print(f"[synthesis_job] ✅ Síntesis completada: {lessons_count} lecciones aprendidas")
+    return {
+        "lessons": lessons_count,
+        "critique_ids": critique_ids,
+        "next_job_id": next_job_id,
+        "synthesis_summary": synthesis_result.get('synthesis_summary', ''),
+        "lessons_learned": synthesis_result.get('lessons_learned', []),
+    }
+
+
+JOB_HANDLERS = {
+    "critique": handle_critique,
+    "embedding_backfill": handle_embedding_backfill,
+    "lesson_synthesis": handle_lesson_synthesis,
+}
+
+
+def create_worker(**kwargs) -> JobWorker:
+    """Worker con todos los handlers registrados."""
+    kwargs.setdefault("exclusive_kinds", EXCLUSIVE_KINDS)
+    return JobWorker(job_queue, JOB_HANDLERS, **kwargs)
@@ -1,212 +1,396 @@
 # Servicio de aprendizaje evolutivo
+# Las lecciones y las versiones del perfil de estilo viven en la BD (tablas
+# lessons y style_profile_versions). Cada proceso mantiene una copia en memoria
+# con índices por estado y categoría que revalida contra la BD periódicamente.
+import copy
 import json
-import os
+import threading
+import time
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import Any, Callable, List, Dict, Optional, Tuple
 from pathlib import Path
 
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from config import (
+    LEARNING_HISTORY_PATH,
+    LEARNING_RELOAD_CHECK_SECONDS,
+    STYLE_PROFILE_MAX_VERSIONS,
+    STYLE_PROFILE_PATH,
+)
+from models.database_sqlite import AppState, Lesson, SessionLocal, StyleProfileVersion
+
+IMPORT_STATE_KEY = "learning_json_import"
+
+
+def lesson_to_dict(lesson: Lesson) -> Dict[str, Any]:
+    """Lección con el mismo formato que tenía learning_history.json."""
+    return {
+        "lesson_id": lesson.lesson_number,
+        "origin_critique_ids": lesson.origin_critique_ids or [],
+        "insight": lesson.lesson_text,
+        "category": lesson.category,
+        "priority": lesson.priority,
+        "actionable_guidance": lesson.actionable_guidance,
+        "supporting_evidence": lesson.supporting_evidence,
+        "applied_count": lesson.times_applied,
+        "effectiveness_score": lesson.effectiveness_score,
+        "status": lesson.status,
+        "synthesized_at": lesson.synthesized_at,
+    }
+
 
 class LearningService:
     """Servicio para gestionar el bucle de aprendizaje evolutivo"""
-    
-    def __init__(self):
-        self.data_dir = Path(__file__).parent.parent / "data"
-        self.learning_history_file = self.data_dir / "learning_history.json"
-        self.style_profile_file = self.data_dir / "style_profile.json"
-    
-    def load_learning_history(self) -> List[Dict]:
-        """Carga el historial de lecciones aprendidas"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any] = SessionLocal,
+        reload_check_interval: float = LEARNING_RELOAD_CHECK_SECONDS,
+        max_profile_versions: int = STYLE_PROFILE_MAX_VERSIONS,
+    ):
+        self._session_factory = session_factory
+        self.reload_check_interval = reload_check_interval
+        self.max_profile_versions = max(1, max_profile_versions)
+        self._lock = threading.RLock()
+
+        # Cache de lectura y marcas para detectar cambios en la BD
+        self._loaded = False
+        self._checked_at = 0.0
+        self._lessons_token: Optional[Tuple] = None
+        self._profile_version: Optional[int] = None
+        self._lessons: List[Dict] = []
+        self._profile: Dict = {}
+
+        # Índices sobre las lecciones
+        self._by_id: Dict[int, Dict] = {}
+        self._by_status: Dict[str, List[Dict]] = {}
+        self._by_status_category: Dict[Tuple[str, str], List[Dict]] = {}
+
+    # --- Cache de lectura ---
+
+    def _reindex(self):
+        self._by_id = {}
+        self._by_status = {}
+        self._by_status_category = {}
+        for lesson in self._lessons:
+            self._by_id[lesson['lesson_id']] = lesson
+            status = lesson['status']
+            self._by_status.setdefault(status, []).append(lesson)
+            self._by_status_category.setdefault((status, lesson['category']), []).append(lesson)
+
+    def _refresh(self):
+        """Recarga lecciones y/o perfil si cambiaron en la BD (llamar con el lock tomado)."""
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < self.reload_check_interval:
+            return
+
+        db = self._session_factory()
         try:
-            if self.learning_history_file.exists():
-                with open(self.learning_history_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return []
+            lessons_token = tuple(db.query(func.count(Lesson.id), func.max(Lesson.updated_at)).one())
+            profile_version = db.query(func.max(StyleProfileVersion.id)).scalar()
+
+            if not self._loaded or lessons_token != self._lessons_token:
+                rows = db.query(Lesson).order_by(Lesson.lesson_number).all()
+                self._lessons = [lesson_to_dict(row) for row in rows]
+                self._lessons_token = lessons_token
+                self._reindex()
+
+            if not self._loaded or profile_version != self._profile_version:
+                latest = db.get(StyleProfileVersion, profile_version) if profile_version else None
+                self._profile = dict(latest.profile) if latest else {}
+                self._profile_version = profile_version
+
+            self._loaded = True
+            self._checked_at = now
         except Exception as e:
-            print(f"Error cargando learning_history.json: {e}")
-            return []
-    
-    def save_learning_history(self, history: List[Dict]) -> bool:
-        """Guarda el historial de lecciones"""
+            print(f"⚠️ Error cargando lecciones desde la BD: {e}")
+        finally:
+            db.close()
+
+    def _invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+
+    # --- Importación de los ficheros JSON antiguos ---
+
+    def import_legacy_json(
+        self,
+        history_file: Path = LEARNING_HISTORY_PATH,
+        profile_file: Path = STYLE_PROFILE_PATH,
+        force: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Importa learning_history.json y style_profile.json a la BD una sola vez.
+        Es idempotente: no duplica lecciones ya importadas ni sustituye un perfil existente.
+        """
+        db = self._session_factory()
         try:
-            with open(self.learning_history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
-            print(f"✅ Learning history guardado: {len(history)} lecciones")
-            return True
-        except Exception as e:
-            print(f"❌ Error guardando learning_history.json: {e}")
-            return False
-    
-    def load_style_profile(self) -> Dict:
-        """Carga el perfil de estilo actual"""
+            if not force and db.get(AppState, IMPORT_STATE_KEY) is not None:
+                return {"skipped": True, "lessons": 0, "profile": False}
+
+            history = self._read_json(history_file, [])
+            existing = {number for (number,) in db.query(Lesson.lesson_number)}
+            imported = 0
+            for entry in history:
+                number = entry.get('lesson_id')
+                if number is None or number in existing:
+                    continue
+                db.add(Lesson(
+                    lesson_number=number,
+                    lesson_text=entry.get('insight', ''),
+                    category=entry.get('category', 'general'),
+                    priority=entry.get('priority', 'medium'),
+                    actionable_guidance=entry.get('actionable_guidance', ''),
+                    supporting_evidence=entry.get('supporting_evidence', ''),
+                    origin_critique_ids=entry.get('origin_critique_ids', []),
+                    times_applied=entry.get('applied_count', 0),
+                    effectiveness_score=entry.get('effectiveness_score'),
+                    status=entry.get('status', 'active'),
+                    synthesized_at=entry.get('synthesized_at'),
+                ))
+                existing.add(number)
+                imported += 1
+
+            profile = self._read_json(profile_file, {})
+            profile_imported = False
+            if profile and db.query(StyleProfileVersion.id).first() is None:
+                db.add(StyleProfileVersion(profile=profile, reason="import"))
+                profile_imported = True
+
+            db.merge(AppState(
+                key=IMPORT_STATE_KEY,
+                value={"lessons": imported, "profile": profile_imported},
+                updated_at=datetime.utcnow(),
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+        if imported or profile_imported:
+            print(f"✅ Importadas {imported} lecciones"
+                  f"{' y el perfil de estilo' if profile_imported else ''} desde JSON")
+        self._invalidate()
+        return {"skipped": False, "lessons": imported, "profile": profile_imported}
+
+    @staticmethod
+    def _read_json(path: Path, default: Any) -> Any:
         try:
-            if self.style_profile_file.exists():
-                with open(self.style_profile_file, 'r', encoding='utf-8') as f:
+            if Path(path).exists():
+                with open(path, 'r', encoding='utf-8') as f:
                     return json.load(f)
-            return {}
         except Exception as e:
-            print(f"Error cargando style_profile.json: {e}")
-            return {}
-    
-    def save_style_profile(self, profile: Dict) -> bool:
-        """Guarda el perfil de estilo actualizado"""
+            print(f"Error cargando {Path(path).name}: {e}")
+        return default
+
+    # --- API pública ---
+
+    def load_learning_history(self) -> List[Dict]:
+        """Retorna una copia del historial de lecciones aprendidas"""
+        with self._lock:
+            self._refresh()
+            return [dict(lesson) for lesson in self._lessons]
+
+    def load_style_profile(self) -> Dict:
+        """Retorna una copia del perfil de estilo vigente"""
+        with self._lock:
+            self._refresh()
+            return copy.deepcopy(self._profile)
+
+    def save_style_profile(self, profile: Dict, reason: str = "manual") -> bool:
+        """Guarda una nueva versión del perfil de estilo"""
+        db = self._session_factory()
         try:
-            with open(self.style_profile_file, 'w', encoding='utf-8') as f:
-                json.dump(profile, f, ensure_ascii=False, indent=2)
-            print(f"✅ Style profile actualizado")
+            version = StyleProfileVersion(profile=profile, reason=reason)
+            db.add(version)
+            db.flush()
+            # Conservar solo las últimas versiones
+            db.query(StyleProfileVersion).filter(
+                StyleProfileVersion.id <= version.id - self.max_profile_versions
+            ).delete(synchronize_session=False)
+            db.commit()
+            print(f"✅ Style profile actualizado (versión {version.id})")
             return True
         except Exception as e:
-            print(f"❌ Error guardando style_profile.json: {e}")
+            db.rollback()
+            print(f"❌ Error guardando el perfil de estilo: {e}")
             return False
-    
+        finally:
+            db.close()
+            self._invalidate()
+
     def add_lessons_to_history(self, synthesis_data: Dict, critique_ids: List[str]) -> bool:
         """
         Añade nuevas lecciones al historial desde una síntesis de Gemini
-        
+
         Args:
             synthesis_data: Resultado de gemini_service.synthesize_lessons()
             critique_ids: IDs de las críticas que se usaron para la síntesis
         """
-        try:
-            history = self.load_learning_history()
-            next_id = max([lesson.get('lesson_id', 0) for lesson in history], default=0) + 1
-            
-            lessons_learned = synthesis_data.get('lessons_learned', [])
-            today = datetime.utcnow().strftime('%Y-%m-%d')
-            
-            for lesson_data in lessons_learned:
-                new_lesson = {
-                    "lesson_id": next_id,
-                    "origin_critique_ids": critique_ids,
-                    "insight": lesson_data.get('insight', ''),
-                    "category": lesson_data.get('category', 'general'),
-                    "priority": lesson_data.get('priority', 'medium'),
-                    "actionable_guidance": lesson_data.get('actionable_guidance', ''),
-                    "supporting_evidence": lesson_data.get('supporting_evidence', ''),
-                    "applied_count": 0,
-                    "effectiveness_score": None,
-                    "status": "active",
-                    "synthesized_at": today
-                }
-                history.append(new_lesson)
-                next_id += 1
-            
-            return self.save_learning_history(history)
-            
-        except Exception as e:
-            print(f"❌ Error añadiendo lecciones al historial: {e}")
-            return False
-    
+        lessons_learned = synthesis_data.get('lessons_learned', [])
+        if not lessons_learned:
+            return True
+
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        for _ in range(3):  # lesson_number es único: reintentar si otro proceso insertó a la vez
+            db = self._session_factory()
+            try:
+                next_id = (db.query(func.max(Lesson.lesson_number)).scalar() or 0) + 1
+                for lesson_data in lessons_learned:
+                    db.add(Lesson(
+                        lesson_number=next_id,
+                        lesson_text=lesson_data.get('insight', ''),
+                        category=lesson_data.get('category', 'general'),
+                        priority=lesson_data.get('priority', 'medium'),
+                        actionable_guidance=lesson_data.get('actionable_guidance', ''),
+                        supporting_evidence=lesson_data.get('supporting_evidence', ''),
+                        origin_critique_ids=critique_ids,
+                        times_applied=0,
+                        status="active",
+                        synthesized_at=today,
+                    ))
+                    next_id += 1
+                db.commit()
+                print(f"✅ {len(lessons_learned)} lecciones añadidas al historial")
+                return True
+            except IntegrityError:
+                db.rollback()
+            except Exception as e:
+                db.rollback()
+                print(f"❌ Error añadiendo lecciones al historial: {e}")
+                return False
+            finally:
+                db.close()
+                self._invalidate()
+        print("❌ Error añadiendo lecciones al historial: conflicto de numeración")
+        return False
+
     def update_style_profile(self, synthesis_data: Dict) -> bool:
         """
         Actualiza el perfil de estilo con insights de la síntesis
-        
+
         Args:
             synthesis_data: Resultado de gemini_service.synthesize_lessons()
         """
         try:
-            profile = self.load_style_profile()
-            
+            with self._lock:
+                self._checked_at = 0.0  # Partir del estado más reciente de la BD
+                self._refresh()
+                profile = copy.deepcopy(self._profile)
+                total_lessons = len(self._lessons)
+                active_lessons = len(self._by_status.get('active', []))
+
             if not profile:
-                print("⚠️ No se pudo cargar style_profile.json")
+                print("⚠️ No hay perfil de estilo en la BD")
                 return False
-            
+
             # Actualizar métricas de evolución
-            history = self.load_learning_history()
-            active_lessons = [l for l in history if l.get('status') == 'active']
-            
             if 'evolution_metrics' not in profile:
                 profile['evolution_metrics'] = {}
-            
+
             profile['evolution_metrics'].update({
                 'last_synthesis': datetime.utcnow().strftime('%Y-%m-%d'),
-                'lessons_active': len(active_lessons),
-                'total_lessons_learned': len(history)
+                'lessons_active': active_lessons,
+                'total_lessons_learned': total_lessons
             })
-            
+
             # Actualizar focos de aprendizaje
             style_adjustments = synthesis_data.get('style_adjustments', {})
             suggested_focus = style_adjustments.get('suggested_focus', '')
-            
+
             if suggested_focus:
                 if 'active_learning_focus' not in profile:
                     profile['active_learning_focus'] = []
-                
+
                 # Añadir nuevo foco si no existe
                 if suggested_focus not in profile['active_learning_focus']:
                     profile['active_learning_focus'].insert(0, suggested_focus)
                     # Mantener solo los 3 focos más recientes
                     profile['active_learning_focus'] = profile['active_learning_focus'][:3]
-            
+
             # Actualizar áreas a mejorar si existen
             areas_to_improve = style_adjustments.get('areas_to_improve', [])
             if areas_to_improve and 'stylistic_markers' in profile:
                 profile['stylistic_markers']['current_improvement_areas'] = areas_to_improve[:3]
-            
-            return self.save_style_profile(profile)
-            
+
+            return self.save_style_profile(profile, reason="synthesis")
+
         except Exception as e:
             print(f"❌ Error actualizando style_profile: {e}")
             return False
-    
+
     def get_active_lessons(self, category: Optional[str] = None) -> List[Dict]:
         """
         Obtiene lecciones activas, opcionalmente filtradas por categoría
-        
+
         Args:
             category: Categoría para filtrar (opcional)
         """
-        history = self.load_learning_history()
-        active = [l for l in history if l.get('status') == 'active']
-        
-        if category:
-            active = [l for l in active if l.get('category') == category]
-        
-        return active
-    
+        return self.get_lessons(status='active', category=category)
+
+    def get_lessons(self, status: Optional[str] = None, category: Optional[str] = None) -> List[Dict]:
+        """Lecciones filtradas por estado y/o categoría usando los índices"""
+        with self._lock:
+            self._refresh()
+            if status and category:
+                lessons = self._by_status_category.get((status, category), [])
+            elif status:
+                lessons = self._by_status.get(status, [])
+            elif category:
+                lessons = [l for l in self._lessons if l['category'] == category]
+            else:
+                lessons = self._lessons
+            return [dict(lesson) for lesson in lessons]
+
     def increment_lesson_application(self, lesson_ids: List[int]) -> bool:
         """
         Incrementa el contador de aplicaciones para lecciones específicas
-        
+
         Args:
             lesson_ids: Lista de IDs de lecciones que se aplicaron
         """
-        try:
-            history = self.load_learning_history()
-            modified = False
-            
-            for lesson in history:
-                if lesson.get('lesson_id') in lesson_ids:
-                    lesson['applied_count'] = lesson.get('applied_count', 0) + 1
-                    modified = True
-            
-            if modified:
-                return self.save_learning_history(history)
-            
+        if not lesson_ids:
             return True
-            
+        db = self._session_factory()
+        try:
+            # Un único UPDATE atómico: sin lectura-modificación-escritura. No toca
+            # updated_at: es parte del token de recarga y cada cuento generado
+            # obligaría a recargar todas las lecciones (la cache ya se ajusta abajo)
+            db.query(Lesson).filter(Lesson.lesson_number.in_(set(lesson_ids))).update({
+                Lesson.times_applied: Lesson.times_applied + 1,
+            }, synchronize_session=False)
+            db.commit()
         except Exception as e:
+            db.rollback()
             print(f"❌ Error incrementando contador de aplicaciones: {e}")
             return False
-    
+        finally:
+            db.close()
+
+        with self._lock:
+            for lesson_id in set(lesson_ids):
+                lesson = self._by_id.get(lesson_id)
+                if lesson is not None:
+                    lesson['applied_count'] += 1
+        return True
+
     def get_synthesis_statistics(self) -> Dict:
         """Obtiene estadísticas del sistema de aprendizaje"""
-        history = self.load_learning_history()
-        profile = self.load_style_profile()
-        
-        active_lessons = [l for l in history if l.get('status') == 'active']
-        categories = {}
-        
-        for lesson in active_lessons:
-            cat = lesson.get('category', 'unknown')
-            categories[cat] = categories.get(cat, 0) + 1
-        
-        return {
-            "total_lessons": len(history),
-            "active_lessons": len(active_lessons),
-            "lessons_by_category": categories,
-            "last_synthesis": profile.get('evolution_metrics', {}).get('last_synthesis', 'never'),
-            "current_focus_areas": profile.get('active_learning_focus', [])
-        }
+        with self._lock:
+            self._refresh()
+            categories = {}
+            for (status, category), lessons in self._by_status_category.items():
+                if status == 'active':
+                    categories[category] = categories.get(category, 0) + len(lessons)
+
+            return {
+                "total_lessons": len(self._lessons),
+                "active_lessons": len(self._by_status.get('active', [])),
+                "lessons_by_category": categories,
+                "last_synthesis": self._profile.get('evolution_metrics', {}).get('last_synthesis', 'never'),
+                "current_focus_areas": list(self._profile.get('active_learning_focus', []))
+            }
 
 
 # Instancia singleton
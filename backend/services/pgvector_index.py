@@ -0,0 +1,298 @@
+# Índices vectoriales de RAG dentro de PostgreSQL con pgvector
+# Misma interfaz que services/vector_index.py, pero los vectores viven en las
+# tablas story_vectors / story_chunk_vectors (halfvec + índice HNSW) y cada
+# búsqueda es una consulta SQL: ningún nodo necesita cargar la biblioteca en
+# memoria y todos ven los mismos vectores.
+
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Collection, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from config import PGVECTOR_DIM, PGVECTOR_EF_SEARCH
+from models.database_sqlite import SessionLocal
+from services.vector_index import ChunkVectorIndex, VectorIndex
+
+
+def to_pgvector(vector: Sequence[float]) -> str:
+    """Vector normalizado (L2) en el formato de texto de pgvector: '[x,y,...]'."""
+    row = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(row))
+    if norm > 0:
+        row = row / norm
+    return "[" + ",".join(f"{x:.7g}" for x in row) + "]"
+
+
+def from_pgvector(value: str) -> np.ndarray:
+    return np.asarray([float(x) for x in value.strip("[]").split(",") if x], dtype=np.float32)
+
+
+class PgVectorIndex(VectorIndex):
+    """Vectores de cuentos completos en story_vectors, búsqueda HNSW por coseno."""
+
+    index_type = "pgvector_hnsw"
+    table = "story_vectors"
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any] = SessionLocal,
+        dim: int = PGVECTOR_DIM,
+        ef_search: int = PGVECTOR_EF_SEARCH,
+    ):
+        self._session_factory = session_factory
+        self.dim = dim
+        self.ef_search = ef_search
+        self.built_at = datetime.utcnow()
+
+    @contextmanager
+    def _session(self, db=None):
+        """La sesión de la petición si se pasa (sin commit) o una propia."""
+        if db is not None:
+            yield db
+            return
+        db = self._session_factory()
+        try:
+            yield db
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _vector_param(self, query: Sequence[float]) -> Optional[str]:
+        if len(query) != self.dim:
+            print(f"[pgvector] ⚠️ Dimensión {len(query)} distinta de la columna halfvec({self.dim})")
+            return None
+        return to_pgvector(query)
+
+    @staticmethod
+    def _ids_param(allowed_ids: Optional[Collection[str]]) -> Dict[str, List[str]]:
+        return {} if allowed_ids is None else {"ids": list(allowed_ids)}
+
+    def _set_ef_search(self, db):
+        # SET LOCAL: solo para la transacción de esta búsqueda
+        db.execute(text(f"SET LOCAL hnsw.ef_search = {int(self.ef_search)}"))
+
+    def __len__(self) -> int:
+        with self._session() as db:
+            return db.execute(text(f"SELECT count(*) FROM {self.table}")).scalar()
+
+    def __contains__(self, item_id: str) -> bool:
+        with self._session() as db:
+            return db.execute(
+                text(f"SELECT 1 FROM {self.table} WHERE story_id = :id LIMIT 1"), {"id": item_id}
+            ).first() is not None
+
+    def ids(self) -> List[str]:
+        with self._session() as db:
+            return list(db.execute(text(f"SELECT story_id FROM {self.table}")).scalars())
+
+    def vector(self, item_id: str) -> Optional[np.ndarray]:
+        with self._session() as db:
+            value = db.execute(
+                text(f"SELECT embedding::text FROM {self.table} WHERE story_id = :id"), {"id": item_id}
+            ).scalar()
+        return from_pgvector(value) if value else None
+
+    def build(self, ids: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        start = time.perf_counter()
+        for item_id, vector in zip(ids, vectors):
+            self.add(item_id, vector)
+        self.build_seconds = time.perf_counter() - start
+        self.built_at = datetime.utcnow()
+
+    def add(self, item_id: str, vector: Sequence[float]) -> bool:
+        value = self._vector_param(vector)
+        if value is None:
+            return False
+        with self._session() as db:
+            db.execute(text(
+                f"INSERT INTO {self.table} (story_id, embedding) VALUES (:id, CAST(:v AS halfvec({self.dim}))) "
+                "ON CONFLICT (story_id) DO UPDATE SET embedding = EXCLUDED.embedding"
+            ), {"id": item_id, "v": value})
+        return True
+
+    def remove(self, item_id: str) -> bool:
+        with self._session() as db:
+            return db.execute(
+                text(f"DELETE FROM {self.table} WHERE story_id = :id"), {"id": item_id}
+            ).rowcount > 0
+
+    def search(
+        self,
+        query: Sequence[float],
+        k: int,
+        min_similarity: float = -1.0,
+        allowed_ids: Optional[Collection[str]] = None,
+        db=None,
+    ) -> List[Tuple[str, float]]:
+        value = self._vector_param(query)
+        if value is None or k <= 0 or (allowed_ids is not None and not allowed_ids):
+            return []
+        where = "WHERE story_id = ANY(:ids)" if allowed_ids is not None else ""
+        with self._session(db) as session:
+            self._set_ef_search(session)
+            rows = session.execute(text(
+                f"SELECT story_id, 1 - (embedding <=> CAST(:q AS halfvec({self.dim}))) AS similarity "
+                f"FROM {self.table} {where} "
+                f"ORDER BY embedding <=> CAST(:q AS halfvec({self.dim})) LIMIT :k"
+            ), {"q": value, "k": k, **self._ids_param(allowed_ids)}).all()
+        return [(story_id, float(similarity)) for story_id, similarity in rows if similarity >= min_similarity]
+
+    def stats(self) -> Dict:
+        return {
+            "type": self.index_type,
+            "size": len(self),
+            "dimension": self.dim,
+            "memory_bytes": 0,  # En la BD, no en el proceso
+            "build_seconds": round(getattr(self, "build_seconds", 0.0), 4),
+            "built_at": self.built_at.isoformat(),
+            "ef_search": self.ef_search,
+        }
+
+    def save(self, path: Path) -> None:
+        """Nada que guardar: los vectores ya están en la BD."""
+
+
+class PgChunkVectorIndex(PgVectorIndex):
+    """Fragmentos de cuentos en story_chunk_vectors, agregados por cuento en SQL."""
+
+    index_type = "pgvector_chunk_hnsw"
+    table = "story_chunk_vectors"
+    # Fragmentos candidatos del HNSW por cada cuento pedido antes de agregar
+    CANDIDATES_PER_RESULT = 10
+
+    item_id = ChunkVectorIndex.item_id
+    split_item_id = ChunkVectorIndex.split_item_id
+
+    def ids(self) -> List[str]:
+        with self._session() as db:
+            rows = db.execute(text(f"SELECT story_id, chunk_index FROM {self.table}")).all()
+        return [self.item_id(story_id, chunk_index) for story_id, chunk_index in rows]
+
+    def __contains__(self, item_id: str) -> bool:
+        group, chunk_index = self.split_item_id(item_id)
+        with self._session() as db:
+            return db.execute(text(
+                f"SELECT 1 FROM {self.table} WHERE story_id = :id AND chunk_index = :n"
+            ), {"id": group, "n": chunk_index}).first() is not None
+
+    def groups(self) -> List[str]:
+        """Cuentos con al menos un fragmento indexado."""
+        with self._session() as db:
+            return list(db.execute(text(f"SELECT DISTINCT story_id FROM {self.table}")).scalars())
+
+    def has_group(self, group: str) -> bool:
+        with self._session() as db:
+            return db.execute(
+                text(f"SELECT 1 FROM {self.table} WHERE story_id = :id LIMIT 1"), {"id": group}
+            ).first() is not None
+
+    def add(self, item_id: str, vector: Sequence[float]) -> bool:
+        group, chunk_index = self.split_item_id(item_id)
+        value = self._vector_param(vector)
+        if value is None:
+            return False
+        with self._session() as db:
+            db.execute(text(
+                f"INSERT INTO {self.table} (story_id, chunk_index, embedding) "
+                f"VALUES (:id, :n, CAST(:v AS halfvec({self.dim}))) "
+                "ON CONFLICT (story_id, chunk_index) DO UPDATE SET embedding = EXCLUDED.embedding"
+            ), {"id": group, "n": chunk_index, "v": value})
+        return True
+
+    def remove(self, item_id: str) -> bool:
+        group, chunk_index = self.split_item_id(item_id)
+        with self._session() as db:
+            return db.execute(text(
+                f"DELETE FROM {self.table} WHERE story_id = :id AND chunk_index = :n"
+            ), {"id": group, "n": chunk_index}).rowcount > 0
+
+    def replace_group(self, group: str, vectors: Sequence[Sequence[float]]) -> int:
+        """Sustituye todos los fragmentos de un cuento en una transacción. Retorna los añadidos."""
+        values = [self._vector_param(vector) for vector in vectors]
+        values = [(n, value) for n, value in enumerate(values) if value is not None]
+        with self._session() as db:
+            db.execute(text(f"DELETE FROM {self.table} WHERE story_id = :id"), {"id": group})
+            if values:
+                db.execute(text(
+                    f"INSERT INTO {self.table} (story_id, chunk_index, embedding) "
+                    f"VALUES (:id, :n, CAST(:v AS halfvec({self.dim})))"
+                ), [{"id": group, "n": n, "v": value} for n, value in values])
+        return len(values)
+
+    def search_stories(
+        self,
+        query: Sequence[float],
+        k: int,
+        min_similarity: float = -1.0,
+        allowed_ids: Optional[Collection[str]] = None,
+        aggregate: str = "max",
+        top_n: int = 2,
+        db=None,
+    ) -> Tuple[List[Tuple[str, float]], Dict[str, int]]:
+        """
+        Equivalente en una consulta de RAGService._rank_stories: los cuentos
+        fragmentados puntúan por sus fragmentos (max o media de los top_n) y
+        los que aún no tienen fragmentos por su vector completo.
+        Retorna ([(story_id, similitud)], {story_id: mejor fragmento}).
+
+        La agregación se hace sobre los k * CANDIDATES_PER_RESULT fragmentos
+        más cercanos que devuelve el HNSW, no sobre todos.
+        """
+        value = self._vector_param(query)
+        if value is None or k <= 0 or (allowed_ids is not None and not allowed_ids):
+            return [], {}
+        q = f"CAST(:q AS halfvec({self.dim}))"
+        ids_filter = "AND story_id = ANY(:ids)" if allowed_ids is not None else ""
+        keep = max(1, top_n) if aggregate == "mean_top" else 1
+        sql = f"""
+            WITH chunk_hits AS (
+                SELECT story_id, chunk_index, 1 - (embedding <=> {q}) AS similarity
+                FROM {self.table} WHERE TRUE {ids_filter}
+                ORDER BY embedding <=> {q} LIMIT :candidates
+            ), ranked AS (
+                SELECT story_id, chunk_index, similarity,
+                       row_number() OVER (PARTITION BY story_id ORDER BY similarity DESC) AS rn
+                FROM chunk_hits
+            ), chunk_scores AS (
+                SELECT story_id, avg(similarity) AS similarity,
+                       min(chunk_index) FILTER (WHERE rn = 1) AS best_chunk
+                FROM ranked WHERE rn <= :keep GROUP BY story_id
+            ), story_hits AS (
+                SELECT v.story_id, 1 - (v.embedding <=> {q}) AS similarity, NULL::integer AS best_chunk
+                FROM {PgVectorIndex.table} v
+                WHERE NOT EXISTS (SELECT 1 FROM {self.table} c WHERE c.story_id = v.story_id)
+                {ids_filter.replace('story_id', 'v.story_id')}
+                ORDER BY v.embedding <=> {q} LIMIT :k
+            )
+            SELECT story_id, similarity, best_chunk FROM (
+                SELECT * FROM chunk_scores UNION ALL SELECT * FROM story_hits
+            ) scored
+            WHERE similarity >= :min_similarity
+            ORDER BY similarity DESC LIMIT :k
+        """
+        with self._session(db) as session:
+            self._set_ef_search(session)
+            rows = session.execute(text(sql), {
+                "q": value,
+                "k": k,
+                "candidates": k * self.CANDIDATES_PER_RESULT,
+                "keep": keep,
+                "min_similarity": min_similarity,
+                **self._ids_param(allowed_ids),
+            }).all()
+        ranked = [(story_id, float(similarity)) for story_id, similarity, _ in rows]
+        best_chunks = {story_id: best for story_id, _, best in rows if best is not None}
+        return ranked, best_chunks
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        with self._session() as db:
+            stats["stories"] = db.execute(text(f"SELECT count(DISTINCT story_id) FROM {self.table}")).scalar()
+        return stats
@@ -1,14 +1,37 @@
 # Servicio de generación de prompts
+# La parte del prompt que solo depende de la guía de estilo se compila una vez
+# en una plantilla (cabecera + cola) versionada por el hash de la guía.
+# El prompt empieza por un prefijo estable (cabecera + lecciones activas) que
+# gemini_service puede guardar en la cache de contexto de Gemini.
+import asyncio
+import hashlib
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from config import STYLE_GUIDE_PATH
 from models.schemas import StoryPromptInput
 from services.character_service import character_service
 
 
+# Instrucción final para el formato de salida JSON
+_OUTPUT_FORMAT = """
+
+⭐ FORMATO DE SALIDA REQUERIDO:
+Entrega tu respuesta EXCLUSIVAMENTE en formato JSON, con dos claves:
+{
+  "title": "El título del cuento",
+  "content": "El contenido completo del cuento aquí, estructurado con párrafos y saltos de línea."
+}
+Asegúrate de que el contenido del cuento sea una cadena de texto larga y coherente.
+NO incluyas ningún texto o comentario fuera del objeto JSON.
+"""
+
+
 class PromptService:
     def __init__(self):
         self._style_guide = None
+        self._style_guide_hash: Optional[str] = None
+        self._template: Optional[Tuple[str, str]] = None
+        self._template_version: Optional[str] = None
         self._learning_service = None
 
     def _get_learning_service(self):
@@ -26,6 +49,8 @@ class PromptService:
             else:
                 with STYLE_GUIDE_PATH.open("r", encoding="utf-8") as file:
                     self._style_guide = json.load(file)
+            canonical = json.dumps(self._style_guide, sort_keys=True, ensure_ascii=False)
+            self._style_guide_hash = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
         return self._style_guide
 
     def _format_list(self, items: List[str]) -> str:
@@ -125,23 +150,12 @@ class PromptService:
         
         return examples_section
 
-    async def build_story_prompt(
-        self, 
-        prompt_inputs: StoryPromptInput, 
-        apply_lessons: bool = True,
-        similar_stories: Optional[List[Dict[str, Any]]] = None
-    ) -> str:
+    def _compile_template(self, style_guide: Dict[str, Any]) -> Tuple[str, str]:
         """
-        Construir prompt para generación de cuentos
-        
-        Args:
-            prompt_inputs: Datos del usuario para el cuento
-            apply_lessons: Si es True, incluye lecciones activas en el prompt
-            similar_stories: Lista de cuentos similares del RAG (opcional)
+        Compila las partes fijas del prompt (todo lo que depende solo de la guía
+        de estilo). Retorna (cabecera, cola); entre ambas van las lecciones,
+        los inputs del usuario y los ejemplos de RAG.
         """
-        print(f"[prompt_service] Construyendo prompt (apply_lessons={apply_lessons}, RAG={similar_stories is not None})...")
-        
-        style_guide = self.load_style_guide()
         guia = style_guide.get("guia_estilo_cuento", {})
         estructura = guia.get("estructura_narrativa", {})
         requisitos = guia.get("requisitos_minimos", {})
@@ -151,38 +165,6 @@ class PromptService:
         refinamiento = guia.get("refinamiento_literario", {})
         nivel_edad = guia.get("nivel_complejidad", {})
 
-        # Resolver personaje si se proporciona ID
-        character_detail = None
-        if prompt_inputs.personaje_id:
-            character_detail = character_service.get_character_by_id(prompt_inputs.personaje_id)
-        elif prompt_inputs.personaje:
-            character_detail = character_service.get_character_by_name(prompt_inputs.personaje)
-
-        user_lines = [f"Personaje principal: {prompt_inputs.personaje}"]
-        if character_detail:
-            rasgos = character_detail.get("rasgos_distintivos", {})
-            personalidad = character_detail.get("personalidad_narrativa", {})
-            user_lines.append(f"  Descripción visual: {rasgos.get('cabello', '')}, {rasgos.get('ojos', '')}, {rasgos.get('edad_aparente', '')}")
-            if personalidad.get("arquetipos"):
-                user_lines.append(f"  Arquetipos: {', '.join(personalidad.get('arquetipos', []))}")
-            if personalidad.get("motivaciones"):
-                user_lines.append(f"  Motivaciones: {', '.join(personalidad.get('motivaciones', []))}")
-        
-        if prompt_inputs.rol_personaje:
-            user_lines.append(f"Rol: {prompt_inputs.rol_personaje}")
-        
-        if prompt_inputs.personajes_secundarios:
-            user_lines.append(f"Personajes secundarios: {', '.join(prompt_inputs.personajes_secundarios)}")
-        
-        if prompt_inputs.contexto_opcional:
-            user_lines.append(f"Contexto opcional: {prompt_inputs.contexto_opcional}")
-        if prompt_inputs.emocion_objetivo:
-            user_lines.append(f"Emoción objetivo: {prompt_inputs.emocion_objetivo}")
-        if prompt_inputs.lugar:
-            user_lines.append(f"Lugar: {prompt_inputs.lugar}")
-        if prompt_inputs.objeto_significativo:
-            user_lines.append(f"Objeto significativo: {prompt_inputs.objeto_significativo}")
-
         prompt_parts = [
             "Escribe un cuento infantil siguiendo esta guía:",
             f"Colección: {guia.get('coleccion', 'Sin especificar')}",
@@ -328,26 +310,14 @@ class PromptService:
             f"- Variación temática: {', '.join(flex.get('variacion_tematica', [])) or 'Sin especificar'}",
             f"- Variación de escenarios: {', '.join(flex.get('variacion_escenarios', [])) or 'Sin especificar'}",
             f"- Elementos opcionales: {', '.join(flex.get('elementos_opcionales', [])) or 'Sin especificar'}",
-            "Inputs del usuario:",
-            self._format_list(user_lines),
         ])
 
-        # Añadir ejemplos de RAG si están disponibles
-        if similar_stories:
-            examples_section = self._build_examples_section(similar_stories)
-            if examples_section:
-                prompt_parts.extend(examples_section)
-        
-        # Añadir lecciones aprendidas si está habilitado
-        if apply_lessons:
-            lessons_section = self._build_lessons_section()
-            if lessons_section:
-                prompt_parts.extend(lessons_section)
-        
+        tail_parts = []
+
         # Añadir NOTA CRÍTICA DE OFICIO (máxima prominencia)
         nota_critica = guia.get("nota_critica_de_oficio", {})
         if nota_critica:
-            prompt_parts.extend([
+            tail_parts.extend([
                 "",
                 "=" * 80,
                 "🔥 REGLA IRROMPIBLE DE LITERATURA INFANTIL DE CALIDAD:",
@@ -362,11 +332,11 @@ class PromptService:
             
             ejemplos = nota_critica.get("ejemplos_criticos", {})
             for emocion, ejemplo in list(ejemplos.items())[:3]:  # Primeros 3 ejemplos
-                prompt_parts.append(f"  {emocion.upper()}:")
-                prompt_parts.append(f"    {ejemplo.get('nominacion_mal', '')}")
-                prompt_parts.append(f"    {ejemplo.get('evocacion_bien', '')}")
+                tail_parts.append(f"  {emocion.upper()}:")
+                tail_parts.append(f"    {ejemplo.get('nominacion_mal', '')}")
+                tail_parts.append(f"    {ejemplo.get('evocacion_bien', '')}")
             
-            prompt_parts.extend([
+            tail_parts.extend([
                 "",
                 "⚠️ REGLA IRROMPIBLE:",
                 f"{nota_critica.get('regla_irrompible', '')}",
@@ -374,7 +344,7 @@ class PromptService:
                 ""
             ])
         
-        prompt_parts.extend([
+        tail_parts.extend([
             "",
             "⭐ INSTRUCCIÓN CLAVE:",
             "Elige UNA de las estructuras alternativas listadas arriba.",
@@ -385,27 +355,125 @@ class PromptService:
             "Entrega un texto único, cálido y coherente, evitando clichés explícitos.",
         ])
 
-        final_prompt = "\n".join(prompt_parts)
+        return "\n".join(prompt_parts), "\n".join(tail_parts) + _OUTPUT_FORMAT
+
+    def _get_template(self) -> Tuple[str, str]:
+        """Plantilla compilada de la guía de estilo actual (se recompila si cambia su hash)."""
+        style_guide = self.load_style_guide()
+        if self._template is None or self._template_version != self._style_guide_hash:
+            self._template = self._compile_template(style_guide)
+            self._template_version = self._style_guide_hash
+            print(f"[prompt_service] 🧩 Plantilla de prompt compilada (versión {self.template_version})")
+        return self._template
+
+    @property
+    def template_version(self) -> Optional[str]:
+        """Hash corto de la guía de estilo con la que se compiló la plantilla."""
+        return self._template_version[:12] if self._template_version else None
+
+    def _build_user_lines(self, prompt_inputs: StoryPromptInput) -> List[str]:
+        """Líneas con los datos del usuario y del personaje."""
+        # Resolver personaje si se proporciona ID
+        character_detail = None
+        if prompt_inputs.personaje_id:
+            character_detail = character_service.get_character_by_id(prompt_inputs.personaje_id)
+        elif prompt_inputs.personaje:
+            character_detail = character_service.get_character_by_name(prompt_inputs.personaje)
+
+        user_lines = [f"Personaje principal: {prompt_inputs.personaje}"]
+        if character_detail:
+            rasgos = character_detail.get("rasgos_distintivos", {})
+            personalidad = character_detail.get("personalidad_narrativa", {})
+            user_lines.append(f"  Descripción visual: {rasgos.get('cabello', '')}, {rasgos.get('ojos', '')}, {rasgos.get('edad_aparente', '')}")
+            if personalidad.get("arquetipos"):
+                user_lines.append(f"  Arquetipos: {', '.join(personalidad.get('arquetipos', []))}")
+            if personalidad.get("motivaciones"):
+                user_lines.append(f"  Motivaciones: {', '.join(personalidad.get('motivaciones', []))}")
+        
+        if prompt_inputs.rol_personaje:
+            user_lines.append(f"Rol: {prompt_inputs.rol_personaje}")
+        
+        if prompt_inputs.personajes_secundarios:
+            user_lines.append(f"Personajes secundarios: {', '.join(prompt_inputs.personajes_secundarios)}")
         
-        # Añadir instrucción final para el formato de salida JSON
-        final_prompt += """
+        if prompt_inputs.contexto_opcional:
+            user_lines.append(f"Contexto opcional: {prompt_inputs.contexto_opcional}")
+        if prompt_inputs.emocion_objetivo:
+            user_lines.append(f"Emoción objetivo: {prompt_inputs.emocion_objetivo}")
+        if prompt_inputs.lugar:
+            user_lines.append(f"Lugar: {prompt_inputs.lugar}")
+        if prompt_inputs.objeto_significativo:
+            user_lines.append(f"Objeto significativo: {prompt_inputs.objeto_significativo}")
 
-⭐ FORMATO DE SALIDA REQUERIDO:
-Entrega tu respuesta EXCLUSIVAMENTE en formato JSON, con dos claves:
-{
-  "title": "El título del cuento",
-  "content": "El contenido completo del cuento aquí, estructurado con párrafos y saltos de línea."
-}
-Asegúrate de que el contenido del cuento sea una cadena de texto larga y coherente.
-NO incluyas ningún texto o comentario fuera del objeto JSON.
-"""
-        print(f"[prompt_service] ✅ Prompt construido ({len(final_prompt)} caracteres)")
+        return user_lines
+
+    async def build_story_prompt_parts(
+        self, 
+        prompt_inputs: StoryPromptInput, 
+        apply_lessons: bool = True,
+        similar_stories: Optional[List[Dict[str, Any]]] = None
+    ) -> Tuple[str, str]:
+        """
+        Construir el prompt separado en (prefijo estable, resto).
+        El prefijo (guía de estilo + lecciones activas) es igual para todas las
+        peticiones mientras no cambien la guía ni las lecciones; el resto lleva
+        los inputs del usuario, los ejemplos de RAG y las reglas finales.
+        
+        Args:
+            prompt_inputs: Datos del usuario para el cuento
+            apply_lessons: Si es True, incluye lecciones activas en el prompt
+            similar_stories: Lista de cuentos similares del RAG (opcional)
+        """
+        print(f"[prompt_service] Construyendo prompt (apply_lessons={apply_lessons}, RAG={similar_stories is not None})...")
+        
+        head, tail = self._get_template()
+        prefix_parts = [head]
+
+        # Añadir lecciones aprendidas si está habilitado
+        if apply_lessons:
+            # Las lecciones pueden recargarse de la BD: en un hilo, fuera del event loop
+            lessons_section = await asyncio.to_thread(self._build_lessons_section)
+            if lessons_section:
+                prefix_parts.extend(lessons_section)
+
+        # Huecos dinámicos: inputs del usuario y ejemplos de RAG
+        dynamic_parts = ["Inputs del usuario:", self._format_list(self._build_user_lines(prompt_inputs))]
+
+        # Añadir ejemplos de RAG si están disponibles
+        if similar_stories:
+            examples_section = self._build_examples_section(similar_stories)
+            if examples_section:
+                dynamic_parts.extend(examples_section)
+
+        prefix = "\n".join(prefix_parts)
+        rest = "\n" + "\n".join([*dynamic_parts, tail])
+        print(f"[prompt_service] ✅ Prompt construido ({len(prefix) + len(rest)} caracteres, prefijo estable {len(prefix)})")
         
-        return final_prompt
+        return prefix, rest
+
+    async def build_story_prompt(
+        self, 
+        prompt_inputs: StoryPromptInput, 
+        apply_lessons: bool = True,
+        similar_stories: Optional[List[Dict[str, Any]]] = None
+    ) -> str:
+        """
+        Construir prompt para generación de cuentos
+        
+        Args:
+            prompt_inputs: Datos del usuario para el cuento
+            apply_lessons: Si es True, incluye lecciones activas en el prompt
+            similar_stories: Lista de cuentos similares del RAG (opcional)
+        """
+        prefix, rest = await self.build_story_prompt_parts(prompt_inputs, apply_lessons, similar_stories)
+        return prefix + rest
 
     def refresh_style_guide(self):
-        """Forzar recarga de la guía de estilo"""
+        """Forzar recarga de la guía de estilo (y recompilar la plantilla)"""
         self._style_guide = None
+        self._style_guide_hash = None
+        self._template = None
+        self._template_version = None
 
 
 # Instancia singleton
@@ -1,13 +1,46 @@
 # Servicio RAG (Retrieval-Augmented Generation)
 # Búsqueda semántica de cuentos similares para mejorar generación
 
+import asyncio
 import json
-from typing import List, Dict, Any, Optional
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Union
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from models.database_sqlite import Story, Critique
-from services.gemini_service import GeminiService
+from config import (
+    RAG_ANN_MIN_STORIES,
+    RAG_IVF_NLIST,
+    RAG_IVF_NPROBE,
+    RAG_CHUNK_AGGREGATE,
+    RAG_CHUNK_TOP_N,
+    RAG_EMBEDDING_TIMEOUT_SECONDS,
+    RAG_HYBRID_CANDIDATES,
+    RAG_HYBRID_SEARCH,
+    RAG_RRF_K,
+    VECTOR_INDEX_PATH,
+    GEMINI_EMBEDDING_MODEL,
+    THEME_CACHE_MAX_ENTRIES,
+    THEME_CACHE_MAX_BYTES,
+    THEME_CACHE_TTL_SECONDS,
+    VECTOR_BACKEND,
+)
+from models.database_sqlite import Story, StoryChunk, Critique, SessionLocal, run_db
+from models.embeddings import decode_embedding
+from services.embedding_cache import ThemeEmbeddingCache
+from services.gemini_service import gemini_service
+from services.pgvector_index import PgChunkVectorIndex, PgVectorIndex
+from services.text_search import lexical_rank
+from services.vector_index import VectorIndex, FlatVectorIndex, IVFFlatIndex, ChunkVectorIndex
 import math
 
+# Margen al sincronizar con la BD: cubre embeddings escritos por otro proceso
+# cuya transacción se confirmó después de avanzar la marca
+SYNC_OVERLAP = timedelta(seconds=60)
+
 
 class RAGService:
     """
@@ -15,15 +48,53 @@ class RAGService:
     Busca cuentos similares exitosos para usar como ejemplos en la generación.
     """
     
-    def __init__(self):
-        self._embedding_cache = {}  # Cache de embeddings de temas
-        self._gemini_service = None
+    def __init__(
+        self,
+        index_path: Optional[str] = VECTOR_INDEX_PATH,
+        ann_min_stories: int = RAG_ANN_MIN_STORIES,
+        theme_cache: Optional[ThemeEmbeddingCache] = None,
+        vector_backend: str = VECTOR_BACKEND,
+        session_factory=SessionLocal,
+    ):
+        # Cache de embeddings de temas: LRU en memoria + tabla theme_embeddings
+        self.theme_cache = theme_cache or ThemeEmbeddingCache(
+            model=GEMINI_EMBEDDING_MODEL,
+            max_entries=THEME_CACHE_MAX_ENTRIES,
+            max_bytes=THEME_CACHE_MAX_BYTES,
+            ttl_seconds=THEME_CACHE_TTL_SECONDS,
+            session_factory=session_factory,
+        )
+        self._session_factory = session_factory
+        self._gemini_service = None  # Solo para sustituirlo en tests
+        self._index: VectorIndex = FlatVectorIndex()  # Embeddings de cuentos en memoria
+        self._index_built = False
+        self._index_dirty = False
+        self._index_watermark: Optional[datetime] = None  # embedding más reciente indexado
+        self._index_versions: Dict[str, datetime] = {}  # story_id -> fecha del embedding indexado
+        # Serializa las escrituras en el índice con el cambio de índice del reentreno;
+        # mientras se entrena, _rebuild_journal anota los IDs modificados
+        self._index_lock = threading.RLock()
+        self._rebuild_journal: Optional[set] = None
+        self._index_path = Path(index_path) if index_path else None
+        self._ann_min_stories = ann_min_stories
+        self._rebuild_thread: Optional[threading.Thread] = None
+        # Fragmentos de párrafo de cada cuento (búsqueda multi-vector, no se persiste)
+        self._chunk_index = ChunkVectorIndex()
+        self._chunk_versions: Dict[str, datetime] = {}  # story_id -> created_at de sus fragmentos
+        self._chunk_watermark: Optional[datetime] = None
+        # pgvector: los vectores viven en la BD (HNSW) y no hay índice en memoria que persistir
+        self._in_database = vector_backend == "pgvector"
+        if self._in_database:
+            self._index = PgVectorIndex(session_factory)
+            self._chunk_index = PgChunkVectorIndex(session_factory)
+            self._index_path = None
     
     def _get_gemini_service(self):
-        """Lazy loading de GeminiService"""
-        if self._gemini_service is None:
-            self._gemini_service = GeminiService()
-        return self._gemini_service
+        """
+        El GeminiService único del proceso: los embeddings de RAG comparten su
+        semáforo (GEMINI_MAX_CONCURRENCY) con el resto de llamadas a Gemini.
+        """
+        return self._gemini_service or gemini_service
     
     def cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """
@@ -45,124 +116,638 @@ class RAGService:
         
         return dot_product / (magnitude1 * magnitude2)
     
+    # Momento de escritura del embedding (created_at en filas anteriores a la columna)
+    _embedded_at = func.coalesce(Story.embedding_updated_at, Story.created_at)
+
+    @classmethod
+    def _embedding_query(cls, db: Session):
+        """Proyección mínima para indexar: id, embedding binario y fecha del embedding."""
+        return db.query(
+            Story.id, Story.embedding_blob, Story.embedding_dim, Story.embedding_dtype, cls._embedded_at
+        ).filter(Story.embedding_blob.isnot(None))
+
+    def _advance_watermark(self, embedded_at: Optional[datetime]):
+        if embedded_at and (self._index_watermark is None or embedded_at > self._index_watermark):
+            self._index_watermark = embedded_at
+
+    def _index_add(self, story_id: str, vector, embedded_at: Optional[datetime]) -> bool:
+        """Inserta o reemplaza el vector de un cuento y anota la fecha de su embedding."""
+        with self._index_lock:
+            if not self._index.add(story_id, vector):
+                return False
+            if embedded_at is not None:
+                self._index_versions[story_id] = embedded_at
+            if self._rebuild_journal is not None:
+                self._rebuild_journal.add(story_id)
+            return True
+
+    def _index_remove(self, story_id: str) -> bool:
+        with self._index_lock:
+            self._index_versions.pop(story_id, None)
+            if self._rebuild_journal is not None:
+                self._rebuild_journal.add(story_id)
+            return self._index.remove(story_id)
+
+    def _new_index(self, size: int) -> VectorIndex:
+        """Índice exacto para bibliotecas pequeñas, IVF-Flat a partir del umbral."""
+        if size >= self._ann_min_stories:
+            return IVFFlatIndex(nlist=RAG_IVF_NLIST, nprobe=RAG_IVF_NPROBE)
+        return FlatVectorIndex()
+
+    def _load_embeddings(self, db: Session, story_ids: Optional[List[str]] = None):
+        """Lee (id, vector, fecha del embedding) de los cuentos con embedding, por lotes si hay IDs."""
+        base = self._embedding_query(db)
+        if story_ids is None:
+            batches = [base.all()]
+        else:
+            batches = (
+                base.filter(Story.id.in_(story_ids[i:i + 500])).all()
+                for i in range(0, len(story_ids), 500)
+            )
+
+        dim = None
+        for rows in batches:
+            for story_id, blob, blob_dim, blob_dtype, embedded_at in rows:
+                try:
+                    vector = decode_embedding(blob, blob_dim, blob_dtype)
+                except (KeyError, ValueError) as e:
+                    print(f"[RAG] ⚠️ Embedding inválido en cuento {story_id}: {e}")
+                    continue
+                if vector is None:
+                    print(f"[RAG] ⚠️ Embedding vacío o truncado en cuento {story_id}")
+                    continue
+                dim = dim or len(vector)
+                if len(vector) != dim:
+                    print(f"[RAG] ⚠️ Dimensión inesperada en cuento {story_id}: {len(vector)} != {dim}")
+                    continue
+                yield story_id, vector, embedded_at
+
+    def _chunk_rows(self, db: Session, since: Optional[datetime] = None):
+        """Fragmentos con embedding agrupados por cuento: {story_id: (created_at, [vectores en orden])}."""
+        query = db.query(
+            StoryChunk.story_id, StoryChunk.chunk_index, StoryChunk.embedding_blob,
+            StoryChunk.embedding_dim, StoryChunk.embedding_dtype, StoryChunk.created_at,
+        )
+        if since is not None:
+            query = query.filter(StoryChunk.created_at >= since)
+        grouped: Dict[str, tuple] = {}
+        for story_id, _, blob, blob_dim, blob_dtype, created_at in query.order_by(
+            StoryChunk.story_id, StoryChunk.chunk_index
+        ).all():
+            try:
+                vector = decode_embedding(blob, blob_dim, blob_dtype)
+            except (KeyError, ValueError):
+                vector = None
+            if vector is None:
+                continue
+            # save_story_chunks sustituye todos los fragmentos de un cuento en una transacción
+            grouped.setdefault(story_id, (created_at, []))[1].append(vector)
+        return grouped
+
+    def _build_chunk_index(self, db: Session):
+        ids, vectors = [], []
+        self._chunk_versions, self._chunk_watermark = {}, None
+        for story_id, (created_at, story_vectors) in self._chunk_rows(db).items():
+            for chunk_index, vector in enumerate(story_vectors):
+                ids.append(ChunkVectorIndex.item_id(story_id, chunk_index))
+                vectors.append(vector)
+            self._chunk_versions[story_id] = created_at
+            if self._chunk_watermark is None or created_at > self._chunk_watermark:
+                self._chunk_watermark = created_at
+        index = ChunkVectorIndex()
+        index.build(ids, vectors)
+        self._chunk_index = index
+        if ids:
+            print(f"[RAG] 🧩 Índice de fragmentos construido: {len(ids)} fragmentos de "
+                  f"{len(self._chunk_versions)} cuentos")
+
+    def _sync_chunks(self, db: Session):
+        """Incorpora los fragmentos escritos por otros procesos desde la última sincronización."""
+        since = self._chunk_watermark - SYNC_OVERLAP if self._chunk_watermark else None
+        updated = 0
+        for story_id, (created_at, vectors) in self._chunk_rows(db, since).items():
+            if self._chunk_versions.get(story_id) == created_at:
+                continue
+            self.add_chunks_to_index(story_id, vectors, created_at, log=False)
+            updated += 1
+        if updated:
+            print(f"[RAG] 🔄 Fragmentos sincronizados: {updated} cuentos")
+
+    def add_chunks_to_index(self, story_id: str, vectors: List[List[float]], created_at: Optional[datetime] = None, log: bool = True):
+        """Sustituye en el índice los fragmentos de un cuento recién (re)fragmentado."""
+        if not vectors:
+            return
+        self._chunk_index.replace_group(story_id, vectors)
+        if created_at is not None:
+            self._chunk_versions[story_id] = created_at
+            if self._chunk_watermark is None or created_at > self._chunk_watermark:
+                self._chunk_watermark = created_at
+        if log:
+            print(f"[RAG] 🧩 {len(vectors)} fragmentos del cuento {story_id} añadidos al índice")
+
+    def build_index(self, db: Optional[Session] = None, force: bool = False):
+        """
+        Prepara el índice vectorial al arrancar la aplicación.
+
+        Si existe un índice persistido junto a la BD se carga y se reconcilia
+        con los cuentos actuales; si no (o con force=True) se construye desde cero.
+        El índice de fragmentos siempre se construye desde la BD.
+        """
+        own_session = db is None
+        db = db or self._session_factory()
+        try:
+            if self._in_database:
+                self._build_pg_index(db)
+                return
+            self._build_chunk_index(db)
+            if not force and self._index_path and self._index_path.exists():
+                try:
+                    saved_at = datetime.utcfromtimestamp(self._index_path.stat().st_mtime)
+                    self._index = VectorIndex.load(self._index_path)
+                    self._index_built = True
+                    print(f"[RAG] 💾 Índice vectorial cargado de {self._index_path.name} "
+                          f"({len(self._index)} cuentos)")
+                    self._reconcile_index(db, saved_at)
+                    self._maybe_upgrade_index()
+                    return
+                except Exception as e:
+                    print(f"[RAG] ⚠️ No se pudo cargar el índice persistido: {e}")
+
+            ids, vectors, versions = [], [], {}
+            self._index_watermark = None
+            for story_id, vector, embedded_at in self._load_embeddings(db):
+                ids.append(story_id)
+                vectors.append(vector)
+                versions[story_id] = embedded_at
+                self._advance_watermark(embedded_at)
+
+            index = self._new_index(len(ids))
+            index.build(ids, vectors)
+            with self._index_lock:
+                self._index = index
+                self._index_versions = versions
+            self._index_built = True
+            self._index_dirty = True
+            stats = self._index.stats()
+            print(f"[RAG] 🧮 Índice vectorial ({stats['type']}) construido: {stats['size']} cuentos "
+                  f"en {stats['build_seconds']}s")
+            self.save_index()
+        finally:
+            if own_session:
+                db.close()
+
+    def _build_pg_index(self, db: Session):
+        """
+        pgvector: las tablas de vectores ya son el índice; solo se copian desde
+        embedding_blob los cuentos y fragmentos que aún no están en ellas.
+        """
+        self._index_built = True
+        self._reconcile_index(db)
+        indexed = set(self._chunk_index.groups())
+        added = 0
+        self._chunk_versions, self._chunk_watermark = {}, None
+        for story_id, (created_at, vectors) in self._chunk_rows(db).items():
+            if story_id not in indexed:
+                self._chunk_index.replace_group(story_id, vectors)
+                added += 1
+            self._chunk_versions[story_id] = created_at
+            if self._chunk_watermark is None or created_at > self._chunk_watermark:
+                self._chunk_watermark = created_at
+        stats = self._index.stats()
+        print(f"[RAG] 🐘 Índice pgvector ({stats['type']}): {stats['size']} cuentos"
+              + (f", fragmentos de {added} cuentos copiados" if added else ""))
+
+    def _reconcile_index(self, db: Session, saved_at: Optional[datetime] = None):
+        """
+        Alinea un índice cargado de disco con los cuentos de la BD. Los
+        embeddings reescritos después de guardar el índice (saved_at) se
+        vuelven a cargar para no buscar con vectores obsoletos.
+        """
+        db_rows = db.query(Story.id, self._embedded_at).filter(
+            Story.embedding_blob.isnot(None)
+        ).all()
+        db_ids = {story_id for story_id, _ in db_rows}
+        indexed = set(self._index.ids())
+
+        removed = 0
+        for story_id in indexed - db_ids:
+            removed += int(self._index_remove(story_id))
+
+        stale_after = saved_at - SYNC_OVERLAP if saved_at else None
+        reload_ids = [
+            story_id for story_id, embedded_at in db_rows
+            if story_id not in indexed or (stale_after and embedded_at and embedded_at >= stale_after)
+        ]
+        added = 0
+        for story_id, vector, embedded_at in self._load_embeddings(db, reload_ids):
+            added += int(self._index_add(story_id, vector, embedded_at))
+
+        self._index_watermark = None
+        for story_id, embedded_at in db_rows:
+            self._index_versions[story_id] = embedded_at
+            self._advance_watermark(embedded_at)
+
+        if added or removed:
+            self._index_dirty = True
+            print(f"[RAG] 🔄 Índice reconciliado con la BD: +{added} / -{removed} cuentos")
+            self.save_index()
+
+    def save_index(self):
+        """Persiste el índice junto a la BD si hay cambios pendientes."""
+        if not self._index_path or not self._index_dirty or not self._index_built:
+            return
+        try:
+            self._index.save(self._index_path)
+            self._index_dirty = False
+            print(f"[RAG] 💾 Índice vectorial guardado en {self._index_path.name}")
+        except Exception as e:
+            print(f"[RAG] ⚠️ Error guardando índice vectorial: {e}")
+
+    def _maybe_upgrade_index(self):
+        """
+        Lanza en segundo plano la migración a IVF-Flat cuando la biblioteca
+        supera el umbral, o el reentrenamiento cuando el IVF ha doblado su tamaño.
+        """
+        if self._in_database:
+            return  # El HNSW de pgvector se mantiene solo
+        current = self._index
+        if isinstance(current, IVFFlatIndex):
+            needed = current.needs_retrain()
+        else:
+            needed = len(current) >= self._ann_min_stories
+        if not needed or (self._rebuild_thread and self._rebuild_thread.is_alive()):
+            return
+
+        def rebuild():
+            with self._index_lock:
+                ids, vectors = current.ids(), current.vectors()
+                self._rebuild_journal = set()
+            try:
+                index = IVFFlatIndex(nlist=RAG_IVF_NLIST, nprobe=RAG_IVF_NPROBE)
+                index.build(ids, vectors)
+                # Reaplicar lo añadido, reemplazado o borrado durante el entrenamiento
+                # y cambiar de índice sin que entre ninguna escritura en medio
+                with self._index_lock:
+                    for story_id in self._rebuild_journal:
+                        vector = current.vector(story_id)
+                        if vector is None:
+                            index.remove(story_id)
+                        else:
+                            index.add(story_id, vector)
+                    self._index = index
+            finally:
+                self._rebuild_journal = None
+            self._index_dirty = True
+            print(f"[RAG] 🧮 Índice IVF-Flat entrenado: {len(index)} cuentos, "
+                  f"{index.stats()['nlist']} listas en {round(index.build_seconds, 2)}s")
+            self.save_index()
+
+        self._rebuild_thread = threading.Thread(target=rebuild, name="rag-index-rebuild", daemon=True)
+        self._rebuild_thread.start()
+
+    def sync_index(self, db: Session):
+        """
+        Incorpora al índice los cuentos creados por otros procesos (API o
+        worker de jobs) desde la última sincronización. Consulta solo las filas
+        cuyo embedding se escribió después de la marca, con un margen para
+        transacciones que se confirmaron con retraso.
+        """
+        if not self._index_built:
+            self.build_index(db)
+            return
+
+        self._sync_chunks(db)
+        query = self._embedding_query(db)
+        if self._index_watermark is not None:
+            query = query.filter(self._embedded_at >= self._index_watermark - SYNC_OVERLAP)
+
+        added = 0
+        for story_id, blob, blob_dim, blob_dtype, embedded_at in query.all():
+            # Ya indexado con este mismo embedding (un cuento re-embebido se reemplaza)
+            if story_id in self._index_versions and self._index_versions[story_id] == embedded_at:
+                continue
+            try:
+                vector = decode_embedding(blob, blob_dim, blob_dtype)
+            except (KeyError, ValueError):
+                continue
+            if vector is not None and self._index_add(story_id, vector, embedded_at):
+                added += 1
+                self._advance_watermark(embedded_at)
+
+        if added:
+            self._index_dirty = True
+            print(f"[RAG] 🔄 Índice sincronizado: {added} cuentos nuevos o re-embebidos")
+            self._maybe_upgrade_index()
+
+    def add_to_index(self, story_id: str, embedding: Optional[List[float]], embedded_at: Optional[datetime] = None):
+        """Añade incrementalmente un cuento recién guardado al índice."""
+        if embedding is None or len(embedding) == 0 or not (self._index_built or self._in_database):
+            return
+        if self._index_add(story_id, embedding, embedded_at):
+            self._index_dirty = True
+            self._advance_watermark(embedded_at)
+            print(f"[RAG] ➕ Cuento {story_id} añadido al índice ({len(self._index)} total)")
+            self._maybe_upgrade_index()
+
+    def index_stats(self) -> Dict[str, Any]:
+        """Tamaño, tipo y tiempo de construcción del índice vectorial."""
+        return {
+            **self._index.stats(),
+            "built": self._index_built,
+            "ann_min_stories": self._ann_min_stories,
+            "persisted_path": str(self._index_path) if self._index_path else None,
+            "chunks": self._chunk_index.stats(),
+        }
+
+    def get_latest_critique_scores(
+        self,
+        db: Session,
+        min_score: Optional[float] = None,
+        story_ids: Optional[List[str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Obtiene la crítica más reciente de cada cuento en una sola consulta
+        (ROW_NUMBER() sobre story_id ordenado por timestamp descendente).
+
+        Returns:
+            {story_id: {'critique_id': ..., 'score': ...}} solo para cuentos
+            cuya última crítica alcanza min_score (si se indica), opcionalmente
+            restringido a story_ids.
+        """
+        critiques = db.query(
+            Critique.id.label("critique_id"),
+            Critique.story_id.label("story_id"),
+            Critique.score.label("score"),
+            func.row_number().over(
+                partition_by=Critique.story_id,
+                order_by=(Critique.timestamp.desc(), Critique.id.desc())
+            ).label("rn")
+        )
+        if story_ids is not None:
+            critiques = critiques.filter(Critique.story_id.in_(story_ids))
+        ranked = critiques.subquery()
+
+        query = db.query(ranked.c.story_id, ranked.c.critique_id, ranked.c.score).filter(
+            ranked.c.rn == 1
+        )
+        if min_score is not None:
+            query = query.filter(ranked.c.score >= min_score)
+
+        return {
+            story_id: {'critique_id': critique_id, 'score': score}
+            for story_id, critique_id, score in query.all()
+        }
+
+    def _fuse_rankings(
+        self,
+        semantic_ranked: List[tuple],
+        lexical_ranked: List[tuple],
+        top_k: int,
+        query: Optional[List[float]],
+        min_similarity: float,
+    ):
+        """
+        Reciprocal rank fusion de los rankings semántico y léxico:
+        score = Σ 1 / (RAG_RRF_K + posición). Retorna ([(story_id, similitud)],
+        {story_id: "semantic" | "lexical" | "hybrid"}).
+
+        Con embedding del tema, un cuento que solo encontró BM25 se puntúa por
+        el coseno con su vector y se descarta si no llega a min_similarity o
+        no tiene vector. Solo sin embedding del tema (búsqueda léxica de
+        respaldo) la similitud es la relevancia BM25 relativa a la mejor.
+        """
+        fused: Dict[str, float] = {}
+        matches: Dict[str, str] = {}
+        for kind, ranking in (("semantic", semantic_ranked), ("lexical", lexical_ranked)):
+            for position, (story_id, _) in enumerate(ranking, 1):
+                fused[story_id] = fused.get(story_id, 0.0) + 1.0 / (RAG_RRF_K + position)
+                matches[story_id] = "hybrid" if story_id in matches else kind
+
+        similarity = dict(semantic_ranked)
+        best_lexical = lexical_ranked[0][1] if lexical_ranked else 0.0
+        lexical = dict(lexical_ranked)
+        q = np.asarray(query, dtype=np.float32) if query is not None else None
+        norm = float(np.linalg.norm(q)) if q is not None else 0.0
+        ranked = []
+        for story_id in sorted(fused, key=fused.get, reverse=True):
+            if len(ranked) == top_k:
+                break
+            if story_id not in similarity:
+                if q is None:
+                    similarity[story_id] = lexical[story_id] / best_lexical if best_lexical > 0 else 0.0
+                else:
+                    vector = self._index.vector(story_id) if story_id in self._index else None
+                    if vector is None:
+                        continue
+                    similarity[story_id] = float(vector @ q) / norm if norm else 0.0
+                    if similarity[story_id] < min_similarity:
+                        continue
+            ranked.append((story_id, similarity[story_id]))
+        return ranked, {story_id: matches[story_id] for story_id, _ in ranked}
+
+    def _rank_stories(
+        self,
+        query: List[float],
+        top_k: int,
+        min_similarity: float,
+        allowed_ids: Optional[set],
+        db: Optional[Session] = None,
+    ):
+        """
+        Retorna ([(story_id, similitud)], {story_id: índice del mejor fragmento})
+        combinando el índice de fragmentos y el de cuentos completos.
+        """
+        if self._in_database:
+            # Una sola consulta en la sesión de la petición
+            return self._chunk_index.search_stories(
+                query, top_k, min_similarity, allowed_ids,
+                aggregate=RAG_CHUNK_AGGREGATE, top_n=RAG_CHUNK_TOP_N, db=db,
+            )
+        chunked = set(self._chunk_index.groups())
+        ranked = []
+        best_chunks = {}
+        if chunked:
+            for story_id, similarity, chunk_index in self._chunk_index.search_groups(
+                query, top_k, min_similarity, allowed_ids,
+                aggregate=RAG_CHUNK_AGGREGATE, top_n=RAG_CHUNK_TOP_N,
+            ):
+                ranked.append((story_id, similarity))
+                best_chunks[story_id] = chunk_index
+            # Cuentos aún sin fragmentos: vector del cuento completo
+            unchunked = (allowed_ids if allowed_ids is not None else set(self._index.ids())) - chunked
+            if unchunked:
+                ranked.extend(self._index.search(query, top_k, min_similarity, unchunked))
+            ranked = sorted(ranked, key=lambda item: item[1], reverse=True)[:top_k]
+        else:
+            ranked = self._index.search(query, top_k, min_similarity, allowed_ids)
+        return ranked, {story_id: best_chunks[story_id] for story_id, _ in ranked if story_id in best_chunks}
+
     async def get_theme_embedding(self, theme: str) -> Optional[List[float]]:
         """
-        Obtiene embedding de un tema, usando cache si está disponible.
+        Obtiene embedding de un tema, usando cache (memoria o BD) si está disponible.
+        La cache lee y escribe en la BD de forma síncrona: se consulta desde un hilo.
         """
-        # Normalizar tema para cache
-        theme_key = theme.lower().strip()
-        
-        # Buscar en cache
-        if theme_key in self._embedding_cache:
-            print(f"[RAG] ✅ Embedding en cache: '{theme_key}'")
-            return self._embedding_cache[theme_key]
+        cached = await asyncio.to_thread(self.theme_cache.get, theme)
+        if cached is not None:
+            print(f"[RAG] ✅ Embedding en cache: '{theme.strip()}'")
+            return cached
         
         # Generar nuevo embedding
-        print(f"[RAG] 🔄 Generando embedding para: '{theme_key}'")
+        print(f"[RAG] 🔄 Generando embedding para: '{theme.strip()}'")
         gemini = self._get_gemini_service()
         embedding = await gemini.generate_embedding(theme)
         
         if embedding:
-            self._embedding_cache[theme_key] = embedding
-            print(f"[RAG] ✅ Embedding cacheado: '{theme_key}'")
+            await asyncio.to_thread(self.theme_cache.put, theme, embedding)
+            print(f"[RAG] ✅ Embedding cacheado: '{theme.strip()}'")
         
         return embedding
     
     async def search_similar_stories(
         self,
-        db: Session,
+        db: Union[Session, AsyncSession],
         theme: str,
         target_age: Optional[int] = None,
         top_k: int = 2,
         min_similarity: float = 0.5,
-        min_score: float = 7.0
+        min_score: float = 7.0,
+        theme_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         Busca cuentos similares al tema con buen score de crítica.
         
         Args:
-            db: Sesión de base de datos
+            db: Sesión de base de datos (síncrona o AsyncSession)
             theme: Tema del cuento a generar
             target_age: Edad objetivo (opcional, para pre-filtrado)
             top_k: Número máximo de ejemplos a retornar
             min_similarity: Similitud mínima (0-1)
             min_score: Score mínimo de crítica
+            theme_embedding: Embedding del tema ya calculado (opcional)
             
         Returns:
             Lista de cuentos similares con metadata
         """
         print(f"[RAG] 🔍 Buscando cuentos similares a: '{theme}'")
         
-        # 1. Generar embedding del tema
-        theme_embedding = await self.get_theme_embedding(theme)
-        if not theme_embedding:
-            print("[RAG] ⚠️ No se pudo generar embedding del tema")
-            return []
-        
-        # 2. Pre-filtrado por metadatos (SQL, muy rápido)
-        query = db.query(Story).filter(
-            Story.embedding_json.isnot(None),
-            Story.content.isnot(None)
-        )
-        
-        # Filtrar por edad si se especifica (±1 año de tolerancia)
-        if target_age:
-            # SQLite no tiene target_age en Story, pero podemos agregarlo después
-            # Por ahora, omitimos este filtro
-            pass
+        # 1. Generar embedding del tema (si no viene precalculado), con límite de tiempo
+        if theme_embedding is None:
+            try:
+                theme_embedding = await asyncio.wait_for(
+                    self.get_theme_embedding(theme), RAG_EMBEDDING_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                print(f"[RAG] ⏱️ El embedding del tema tardó más de {RAG_EMBEDDING_TIMEOUT_SECONDS}s")
+                theme_embedding = None
+        if theme_embedding is None or len(theme_embedding) == 0:
+            # Sin red o sin embedding: solo búsqueda léxica (FTS5)
+            print("[RAG] ⚠️ No se pudo generar embedding del tema: búsqueda solo léxica")
+            theme_embedding = None
         
-        candidates = query.all()
-        print(f"[RAG] 📊 Candidatos pre-filtrados: {len(candidates)} cuentos")
+        # 2-5. Consultas a la BD: con una AsyncSession no bloquean el event loop
+        return await run_db(db, self._search_in_db, theme, theme_embedding, top_k, min_similarity, min_score)
+
+    def _search_in_db(
+        self,
+        db: Session,
+        theme: str,
+        theme_embedding: Optional[List[float]],
+        top_k: int,
+        min_similarity: float,
+        min_score: float,
+    ) -> List[Dict[str, Any]]:
+        """Pasos 2-5 de search_similar_stories, con el embedding del tema ya resuelto."""
+        semantic = theme_embedding is not None
         
-        if not candidates:
+        # 2. Similitud vectorial contra el índice (en memoria o pgvector)
+        self.sync_index(db)
+        if len(self._index) == 0 and semantic and not RAG_HYBRID_SEARCH:
             print("[RAG] ⚠️ No hay cuentos con embeddings en la BD")
             return []
-        
-        # 3. Calcular similitudes
-        similarities = []
-        for story in candidates:
-            try:
-                # Parsear embedding JSON
-                story_embedding = story.embedding_json
-                if isinstance(story_embedding, str):
-                    story_embedding = json.loads(story_embedding)
-                
-                # Calcular similitud
-                similarity = self.cosine_similarity(theme_embedding, story_embedding)
-                
-                # Obtener score de crítica (si existe)
-                critique = db.query(Critique).filter(
-                    Critique.story_id == story.id
-                ).order_by(Critique.timestamp.desc()).first()
-                
-                critique_score = critique.score if critique else 0.0
-                
-                # Aplicar filtros
-                if similarity >= min_similarity and critique_score >= min_score:
-                    similarities.append({
-                        'story': story,
-                        'similarity': similarity,
-                        'score': critique_score,
-                        'critique': critique
-                    })
-            
-            except Exception as e:
-                print(f"[RAG] ⚠️ Error procesando cuento {story.id}: {e}")
+
+        # 3. Pre-filtrado por score de crítica (una sola consulta SQL)
+        # Los cuentos sin crítica cuentan como score 0, así que solo se
+        # pueden descartar cuando se exige un score mínimo positivo.
+        latest = {}
+        allowed_ids = None
+        if min_score > 0:
+            latest = self.get_latest_critique_scores(db, min_score=min_score)
+            allowed_ids = set(latest.keys())
+            if not allowed_ids:
+                print(f"[RAG] ℹ️ Ningún cuento alcanza el score mínimo {min_score}")
+                return []
+        candidates = len(allowed_ids) if allowed_ids is not None else len(self._index)
+        print(f"[RAG] 📊 Candidatos pre-filtrados: {candidates} de {len(self._index)} cuentos indexados")
+
+        # 4. Similitud vectorial solo sobre los candidatos (los cuentos fragmentados
+        # puntúan por sus fragmentos y el resto por su vector completo) fusionada
+        # con el ranking BM25 de texto completo
+        best_chunks = {}
+        if semantic and not RAG_HYBRID_SEARCH:
+            ranked, best_chunks = self._rank_stories(theme_embedding, top_k, min_similarity, allowed_ids, db)
+            matches = {story_id: "semantic" for story_id, _ in ranked}
+        else:
+            candidate_k = top_k * RAG_HYBRID_CANDIDATES
+            semantic_ranked = []
+            if semantic:
+                semantic_ranked, best_chunks = self._rank_stories(
+                    theme_embedding, candidate_k, min_similarity, allowed_ids, db
+                )
+            lexical_ranked = lexical_rank(db, theme, candidate_k, allowed_ids)
+            ranked, matches = self._fuse_rankings(
+                semantic_ranked, lexical_ranked, top_k, theme_embedding, min_similarity
+            )
+            best_chunks = {story_id: best_chunks[story_id] for story_id, _ in ranked if story_id in best_chunks}
+        if not ranked:
+            print("[RAG] ✅ Encontrados 0 cuentos que cumplen criterios")
+            return []
+
+        ranked_ids = [story_id for story_id, _ in ranked]
+        if allowed_ids is None:
+            latest = self.get_latest_critique_scores(db, story_ids=ranked_ids)
+        stories = {
+            story.id: story
+            for story in db.query(Story).filter(Story.id.in_(ranked_ids)).all()
+        }
+        fragments = {}
+        if best_chunks:
+            fragments = {
+                story_id: content
+                for story_id, chunk_index, content in db.query(
+                    StoryChunk.story_id, StoryChunk.chunk_index, StoryChunk.content
+                ).filter(StoryChunk.story_id.in_(list(best_chunks))).all()
+                if best_chunks[story_id] == chunk_index
+            }
+        critique_ids = [latest[i]['critique_id'] for i in ranked_ids if i in latest]
+        critiques = {
+            critique.story_id: critique
+            for critique in db.query(Critique).filter(Critique.id.in_(critique_ids)).all()
+        } if critique_ids else {}
+
+        top_stories = []
+        for story_id, similarity in ranked:
+            story = stories.get(story_id)
+            if story is None or story.content is None:
                 continue
-        
-        print(f"[RAG] ✅ Encontrados {len(similarities)} cuentos que cumplen criterios")
-        
-        # 4. Ordenar por similitud (descendente) y tomar top_k
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        top_stories = similarities[:top_k]
+            critique = critiques.get(story_id)
+            top_stories.append({
+                'story': story,
+                'similarity': similarity,
+                'score': critique.score if critique else 0.0,
+                'critique': critique
+            })
+
+        print(f"[RAG] ✅ Encontrados {len(top_stories)} cuentos que cumplen criterios")
         
         # 5. Formatear resultado
         results = []
         for idx, item in enumerate(top_stories, 1):
             story = item['story']
             
-            # Crear fragmento (primeros 250 caracteres)
-            fragment = story.content[:250] + "..." if len(story.content) > 250 else story.content
+            # Fragmento: el trozo del cuento más parecido al tema (o los primeros 250 caracteres)
+            fragment = fragments.get(story.id)
+            if fragment is None:
+                fragment = story.content[:250] + "..." if len(story.content) > 250 else story.content
             
             # Extraer técnicas de la crítica si existe
             techniques = []
@@ -184,6 +769,7 @@ class RAGService:
                 'title': story.title or 'Sin título',
                 'fragment': fragment,
                 'similarity': round(item['similarity'], 3),
+                'match': matches.get(story.id, "semantic"),
                 'score': round(item['score'], 1),
                 'techniques': techniques,
                 'rank': idx
@@ -0,0 +1,133 @@
+# Cache de respuestas de Gemini direccionada por contenido
+# La crítica y la plantilla de ilustraciones solo dependen del modelo, de la
+# versión del prompt y del cuento: si ya se generaron para esa combinación, se
+# reutilizan sin llamar a la API (reprocesados y backfills salen gratis).
+# Las entradas viven en la tabla gemini_responses y se expulsan por antigüedad
+# de uso cuando el total supera max_bytes.
+
+import hashlib
+import json
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import func
+
+from models.database_sqlite import GeminiResponse
+
+
+class GeminiResponseCache:
+    """Resultados JSON de Gemini guardados en SQLite y acotados por tamaño (LRU)."""
+
+    def __init__(self, session_factory: Callable[[], Any], max_bytes: int = 64 * 1024 * 1024):
+        self._session_factory = session_factory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()  # Serializa escrituras y expulsiones dentro del proceso
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(kind: str, model: str, prompt_version: str, prompt: str) -> str:
+        """Clave del cache: SHA-256 de tipo, modelo, versión del prompt y prompt completo."""
+        digest = hashlib.sha256()
+        for part in (kind, model, prompt_version, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Respuesta guardada para la clave o None. Marca la entrada como usada."""
+        db = self._session_factory()
+        try:
+            row = db.query(GeminiResponse).filter(GeminiResponse.cache_key == key).first()
+            if row is None:
+                self.misses += 1
+                return None
+            row.hits += 1
+            row.last_used_at = datetime.utcnow()
+            response = row.response
+            db.commit()
+            self.hits += 1
+            return response
+        except Exception as e:
+            db.rollback()
+            print(f"[ResponseCache] ⚠️ Error leyendo cache de respuestas: {e}")
+            return None
+        finally:
+            db.close()
+
+    def put(self, key: str, kind: str, model: str, response: Dict[str, Any]):
+        """Guarda la respuesta y expulsa las menos usadas si se supera max_bytes."""
+        size = len(json.dumps(response, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            db = self._session_factory()
+            try:
+                now = datetime.utcnow()
+                db.merge(GeminiResponse(
+                    cache_key=key, kind=kind, model=model, response=response,
+                    size_bytes=size, hits=0, created_at=now, last_used_at=now,
+                ))
+                db.flush()
+                self._evict(db)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"[ResponseCache] ⚠️ Error guardando cache de respuestas: {e}")
+            finally:
+                db.close()
+
+    def _evict(self, db):
+        """Borra las entradas usadas hace más tiempo hasta volver por debajo del límite."""
+        total = db.query(func.coalesce(func.sum(GeminiResponse.size_bytes), 0)).scalar()
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims = []
+        for cache_key, size in db.query(GeminiResponse.cache_key, GeminiResponse.size_bytes).order_by(
+            GeminiResponse.last_used_at, GeminiResponse.cache_key
+        ).yield_per(200):
+            victims.append(cache_key)
+            excess -= size
+            if excess <= 0:
+                break
+        db.query(GeminiResponse).filter(GeminiResponse.cache_key.in_(victims)).delete(synchronize_session=False)
+        self.evictions += len(victims)
+        print(f"[ResponseCache] 🧹 {len(victims)} respuestas expulsadas del cache (límite {self.max_bytes} bytes)")
+
+    def clear(self, kind: Optional[str] = None) -> int:
+        """Vacía el cache (solo un tipo si se indica). Retorna las entradas borradas."""
+        with self._lock:
+            db = self._session_factory()
+            try:
+                query = db.query(GeminiResponse)
+                if kind:
+                    query = query.filter(GeminiResponse.kind == kind)
+                removed = query.delete(synchronize_session=False)
+                db.commit()
+                return removed
+            finally:
+                db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Entradas y bytes por tipo más los contadores del proceso."""
+        db = self._session_factory()
+        try:
+            rows = db.query(
+                GeminiResponse.kind, func.count(), func.sum(GeminiResponse.size_bytes)
+            ).group_by(GeminiResponse.kind).all()
+        finally:
+            db.close()
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(count for _, count, _ in rows),
+            "bytes": sum(size or 0 for _, _, size in rows),
+            "max_bytes": self.max_bytes,
+            "by_kind": {kind: {"entries": count, "bytes": size or 0} for kind, count, size in rows},
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
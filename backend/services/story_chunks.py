@@ -0,0 +1,126 @@
+# Fragmentación de cuentos en trozos del tamaño de un párrafo para RAG multi-vector
+# Cada cuento se guarda con el embedding del texto completo (stories) y uno por
+# fragmento (story_chunks); ambos se piden a Gemini en la misma petición batch.
+
+import re
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from config import STORY_CHUNK_MAX_CHARS, STORY_CHUNK_MIN_CHARS
+from models.database_sqlite import StoryChunk
+from models.embeddings import encode_embedding
+
+# Textos por petición batch de embed_content
+MAX_TEXTS_PER_REQUEST = 100
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n|\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def _split_long(paragraph: str, max_chars: int) -> List[str]:
+    """Parte un párrafo demasiado largo por frases (o a lo bruto si una frase no cabe)."""
+    pieces, current = [], ""
+    for sentence in _SENTENCE_END.split(paragraph):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(
+    text: str,
+    max_chars: int = STORY_CHUNK_MAX_CHARS,
+    min_chars: int = STORY_CHUNK_MIN_CHARS,
+) -> List[str]:
+    """
+    Divide un cuento en fragmentos de uno o varios párrafos de como mucho
+    max_chars caracteres. Los párrafos cortos (diálogos, una línea) se unen con
+    el siguiente hasta llegar a min_chars para que cada fragmento tenga contexto.
+    """
+    paragraphs = []
+    for paragraph in _PARAGRAPH_BREAK.split(text or ""):
+        paragraph = paragraph.strip()
+        if paragraph:
+            paragraphs.extend(_split_long(paragraph, max_chars) if len(paragraph) > max_chars else [paragraph])
+
+    chunks: List[str] = []
+    current = ""
+    for paragraph in paragraphs:
+        if current and (len(current) >= min_chars or len(current) + 1 + len(paragraph) > max_chars):
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        if chunks and len(current) < min_chars and len(chunks[-1]) + 1 + len(current) <= max_chars:
+            chunks[-1] = f"{chunks[-1]}\n{current}"
+        else:
+            chunks.append(current)
+    return chunks
+
+
+async def embed_stories(
+    gemini, contents: Sequence[str]
+) -> List[Optional[Tuple[list, List[Tuple[str, list]]]]]:
+    """
+    Embeddings de varios cuentos: por cada uno, (vector del texto completo,
+    [(fragmento, vector), ...]) o None si falló. Todos los textos se envían en
+    peticiones batch de hasta MAX_TEXTS_PER_REQUEST; si un cuento cabe en un
+    solo fragmento, su vector sirve para ambos.
+    """
+    texts: List[str] = []
+    layout = []  # Por cuento: (posición del texto completo, [(fragmento, posición)])
+    for content in contents:
+        chunks = split_into_chunks(content)
+        story_pos = len(texts)
+        texts.append(content)
+        if len(chunks) <= 1:
+            layout.append((story_pos, [(chunk, story_pos) for chunk in chunks]))
+            continue
+        positions = []
+        for chunk in chunks:
+            positions.append((chunk, len(texts)))
+            texts.append(chunk)
+        layout.append((story_pos, positions))
+
+    vectors: List[Optional[list]] = [None] * len(texts)
+    for start in range(0, len(texts), MAX_TEXTS_PER_REQUEST):
+        batch = await gemini.generate_embeddings(texts[start:start + MAX_TEXTS_PER_REQUEST])
+        if batch and len(batch) == min(MAX_TEXTS_PER_REQUEST, len(texts) - start):
+            vectors[start:start + len(batch)] = batch
+
+    results = []
+    for story_pos, positions in layout:
+        needed = [story_pos] + [pos for _, pos in positions]
+        if any(vectors[pos] is None for pos in needed):
+            results.append(None)
+        else:
+            results.append((vectors[story_pos], [(chunk, vectors[pos]) for chunk, pos in positions]))
+    return results
+
+
+def save_story_chunks(db, story_id: str, chunks: Sequence[Tuple[str, list]], dtype: str = "float32") -> datetime:
+    """Sustituye los fragmentos de un cuento en la sesión (sin commit). Retorna su fecha."""
+    created_at = datetime.utcnow()
+    db.query(StoryChunk).filter(StoryChunk.story_id == story_id).delete(synchronize_session=False)
+    for chunk_index, (content, vector) in enumerate(chunks):
+        db.add(StoryChunk(
+            story_id=story_id,
+            chunk_index=chunk_index,
+            content=content,
+            embedding_blob=encode_embedding(vector, dtype),
+            embedding_dim=len(vector),
+            embedding_dtype=dtype,
+            created_at=created_at,
+        ))
+    return created_at
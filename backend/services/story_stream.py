@@ -0,0 +1,102 @@
+# Utilidades para la generación de cuentos en streaming (SSE)
+# Gemini responde con un JSON {"title": ..., "content": ...} que llega en trozos;
+# este parser extrae el título en cuanto se cierra y el contenido a medida que llega.
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_FIELD_RE = re.compile(r'"(title|content)"\s*:\s*"')
+_HIGH_SURROGATE_RE = re.compile(r'\\u[dD][89abAB][0-9a-fA-F]{2}$')
+
+
+class StoryStreamParser:
+    """
+    Parser incremental del JSON del cuento.
+    feed() devuelve eventos ("title", texto) una vez y ("content", fragmento)
+    con el texto ya decodificado (escapes JSON resueltos).
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.title: Optional[str] = None
+        self._content_parts: List[str] = []
+        self._field: Optional[str] = None  # Campo cuyo valor se está leyendo
+        self._field_start = 0  # Inicio del valor (sin comillas) en el buffer
+        self._pos = 0  # Posición segura hasta la que se ha procesado el buffer
+        self._seen_fields = set()
+
+    @property
+    def content(self) -> str:
+        return "".join(self._content_parts)
+
+    def _scan_string(self) -> Tuple[int, bool]:
+        """
+        Avanza desde _pos por el valor de cadena actual.
+        Retorna (fin seguro, cerrada): fin seguro nunca corta una secuencia de escape.
+        """
+        i = self._pos
+        n = len(self.buffer)
+        while i < n:
+            ch = self.buffer[i]
+            if ch == "\\":
+                if i + 1 >= n:
+                    break
+                step = 6 if self.buffer[i + 1] == "u" else 2
+                if i + step > n:
+                    break
+                i += step
+            elif ch == '"':
+                return i, True
+            else:
+                i += 1
+        return i, False
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """Añade un trozo de respuesta y retorna los eventos que produce."""
+        self.buffer += text
+        events: List[Tuple[str, str]] = []
+        while True:
+            if self._field is None:
+                match = _FIELD_RE.search(self.buffer, self._pos)
+                while match and match.group(1) in self._seen_fields:
+                    match = _FIELD_RE.search(self.buffer, match.end())
+                if not match:
+                    break
+                self._field = match.group(1)
+                self._seen_fields.add(self._field)
+                self._field_start = self._pos = match.end()
+                continue
+
+            end, closed = self._scan_string()
+            if self._field == "content":
+                safe_end = end
+                if not closed and _HIGH_SURROGATE_RE.search(self.buffer, self._pos, end):
+                    safe_end = end - 6  # Esperar a la segunda mitad del par surrogate
+                if safe_end > self._pos:
+                    delta = json.loads('"' + self.buffer[self._pos:safe_end] + '"')
+                    self._content_parts.append(delta)
+                    events.append(("content", delta))
+                    self._pos = safe_end
+            else:
+                self._pos = end
+            if not closed:
+                break
+
+            if self._field == "title":
+                self.title = json.loads('"' + self.buffer[self._field_start:end] + '"')
+                events.append(("title", self.title))
+            self._field = None
+            self._pos = end + 1
+        return events
+
+    def result(self) -> Optional[Dict[str, str]]:
+        """Cuento completo si se recibieron título y contenido."""
+        if self.title is None or "content" not in self._seen_fields or self._field == "content":
+            return None
+        return {"title": self.title, "content": self.content}
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Formatea un evento Server-Sent Events con datos JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
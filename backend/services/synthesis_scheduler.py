@@ -0,0 +1,188 @@
+# Planificador de la síntesis de lecciones
+# Agrupa los disparos que llegan dentro de una ventana en un único job
+# (dedupe_key + run_after diferido), la cola garantiza que solo hay una síntesis
+# en curso y una marca de agua (timestamp, id) en app_state recuerda hasta qué
+# crítica se ha sintetizado, para enviar al modelo solo las críticas nuevas.
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import tuple_
+
+from config import SYNTHESIS_DEBOUNCE_SECONDS, SYNTHESIS_MAX_BATCH, SYNTHESIS_MIN_CRITIQUES
+from models.database_sqlite import AppState, Critique, SessionLocal
+from services.job_queue import JobQueue, job_queue
+
+STATE_KEY = "lesson_synthesis"
+JOB_KIND = "lesson_synthesis"
+
+
+class SynthesisScheduler:
+    """Decide cuándo encolar la síntesis y qué críticas le corresponden."""
+
+    # Las críticas más recientes que esto esperan a la siguiente ronda, para que
+    # una crítica con timestamp anterior que aún no ha hecho commit no quede por
+    # detrás de la marca de agua
+    SETTLE_SECONDS = 5
+
+    def __init__(
+        self,
+        queue: JobQueue = job_queue,
+        session_factory: Callable[[], Any] = SessionLocal,
+        min_critiques: int = SYNTHESIS_MIN_CRITIQUES,
+        debounce_seconds: float = SYNTHESIS_DEBOUNCE_SECONDS,
+        max_batch: int = SYNTHESIS_MAX_BATCH,
+        settle_seconds: Optional[float] = None,
+    ):
+        self.queue = queue
+        self._session_factory = session_factory
+        self.min_critiques = max(1, min_critiques)
+        self.debounce_seconds = debounce_seconds
+        self.max_batch = max(1, max_batch)
+        self.settle_seconds = self.SETTLE_SECONDS if settle_seconds is None else settle_seconds
+
+    # --- Estado persistente ---
+
+    def _state(self, db) -> Dict[str, Any]:
+        row = db.get(AppState, STATE_KEY)
+        state = dict(row.value or {}) if row else {}
+        state.setdefault("last_timestamp", None)
+        state.setdefault("last_id", None)
+        state.setdefault("runs", 0)
+        state.setdefault("critiques_synthesized", 0)
+        state.setdefault("last_run_at", None)
+        return state
+
+    def _save_state(self, db, state: Dict[str, Any]):
+        row = db.get(AppState, STATE_KEY)
+        if row is None:
+            db.add(AppState(key=STATE_KEY, value=state, updated_at=datetime.utcnow()))
+        else:
+            row.value = state
+            row.updated_at = datetime.utcnow()
+        db.commit()
+
+    def initialize(self):
+        """
+        Crea la marca de agua si no existe. En una BD con críticas previas se
+        consideran ya sintetizadas (las procesó el disparador anterior).
+        """
+        db = self._session_factory()
+        try:
+            if db.get(AppState, STATE_KEY) is not None:
+                return
+            latest = db.query(Critique.timestamp, Critique.id).order_by(
+                Critique.timestamp.desc(), Critique.id.desc()
+            ).first()
+            state = self._state(db)
+            if latest is not None:
+                state["last_timestamp"] = latest.timestamp.isoformat()
+                state["last_id"] = latest.id
+                print(f"[Synthesis] 📌 Marca de agua inicial en la crítica {latest.id}")
+            self._save_state(db, state)
+        finally:
+            db.close()
+
+    def _unseen(self, db, state: Dict[str, Any]):
+        """Críticas posteriores a la marca de agua, en orden (timestamp, id)."""
+        query = db.query(Critique)
+        if state["last_timestamp"]:
+            last_ts = datetime.fromisoformat(state["last_timestamp"])
+            # Comparación de filas: un solo rango sobre ix_critiques_timestamp_id
+            query = query.filter(tuple_(Critique.timestamp, Critique.id) > tuple_(last_ts, state["last_id"]))
+        return query
+
+    # --- API pública ---
+
+    def pending_count(self) -> int:
+        """Críticas aún no sintetizadas."""
+        db = self._session_factory()
+        try:
+            return self._unseen(db, self._state(db)).count()
+        finally:
+            db.close()
+
+    def notify(self) -> Optional[str]:
+        """
+        Avisa de una crítica nueva. Si hay suficientes sin sintetizar encola la
+        síntesis tras la ventana de agrupación; los avisos dentro de la ventana
+        reutilizan el mismo job. Retorna el ID del job o None.
+        """
+        pending = self.pending_count()
+        if pending < self.min_critiques:
+            return None
+        print(f"[Synthesis] 🧠 {pending} críticas sin sintetizar - síntesis programada "
+              f"en {self.debounce_seconds:.0f}s")
+        return self.queue.enqueue(JOB_KIND, {}, dedupe_key=JOB_KIND, delay_seconds=self.debounce_seconds)
+
+    def request_now(self) -> str:
+        """
+        Síntesis pedida a mano: el mismo job exclusivo que la programada (si
+        ya hay uno en espera se reutiliza y se adelanta). Retorna el ID del job.
+        """
+        job_id = self.queue.enqueue(JOB_KIND, {}, dedupe_key=JOB_KIND)
+        self.queue.run_now(job_id)
+        return job_id
+
+    def next_batch(self) -> List[Dict[str, Any]]:
+        """Siguiente lote de críticas sin sintetizar, las más antiguas primero."""
+        db = self._session_factory()
+        try:
+            settled_before = datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+            critiques = self._unseen(db, self._state(db)).filter(
+                Critique.timestamp <= settled_before
+            ).order_by(Critique.timestamp, Critique.id).limit(self.max_batch).all()
+            return [
+                {
+                    'id': c.id,
+                    'story_id': c.story_id,
+                    'critique_text': c.critique_text,
+                    'score': c.score,
+                    'timestamp': c.timestamp.isoformat(),
+                }
+                for c in critiques
+            ]
+        finally:
+            db.close()
+
+    def mark_synthesized(self, batch: List[Dict[str, Any]]):
+        """Avanza la marca de agua hasta la última crítica del lote."""
+        if not batch:
+            return
+        last = batch[-1]
+        db = self._session_factory()
+        try:
+            state = self._state(db)
+            candidate = (datetime.fromisoformat(last['timestamp']), last['id'])
+            if not state["last_timestamp"] or candidate > (
+                datetime.fromisoformat(state["last_timestamp"]), state["last_id"]
+            ):
+                state["last_timestamp"] = last['timestamp']
+                state["last_id"] = last['id']
+            state["runs"] += 1
+            state["critiques_synthesized"] += len(batch)
+            state["last_run_at"] = datetime.utcnow().isoformat()
+            self._save_state(db, state)
+        finally:
+            db.close()
+
+    def status(self) -> Dict[str, Any]:
+        """Marca de agua, contadores y críticas pendientes."""
+        db = self._session_factory()
+        try:
+            state = self._state(db)
+            pending = self._unseen(db, state).count()
+        finally:
+            db.close()
+        return {
+            **state,
+            "pending_critiques": pending,
+            "critiques_until_next_synthesis": max(0, self.min_critiques - pending),
+            "min_critiques": self.min_critiques,
+            "debounce_seconds": self.debounce_seconds,
+            "max_batch": self.max_batch,
+        }
+
+
+# Instancia singleton
+synthesis_scheduler = SynthesisScheduler()
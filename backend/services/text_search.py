@@ -0,0 +1,151 @@
+# Búsqueda de texto completo sobre los cuentos (SQLite FTS5 + BM25, o
+# tsvector + ts_rank_cd con el índice GIN ix_stories_fts en PostgreSQL)
+# No necesita red: sirve para el buscador de la biblioteca y como respaldo
+# léxico de RAG cuando el embedding del tema falla o tarda demasiado.
+
+import re
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from models.database_sqlite import STORIES_TSVECTOR
+
+# Pesos BM25 por columna (story_id, title, content): el título pesa más
+BM25_WEIGHTS = (0.0, 3.0, 1.0)
+
+# Palabras vacías frecuentes que solo añaden ruido a la búsqueda
+_STOPWORDS = {
+    "el", "la", "los", "las", "un", "una", "unos", "unas", "de", "del", "al", "y", "o",
+    "en", "con", "por", "para", "que", "se", "su", "sus", "lo", "le", "les", "es", "a",
+    "sobre", "como", "muy", "mas", "más", "sin",
+}
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(query: str, prefix: bool = False) -> Optional[str]:
+    """
+    Convierte texto libre en una expresión MATCH de FTS5 segura: cada palabra
+    entre comillas y unidas con OR. Con prefix=True la última admite prefijos
+    (búsqueda mientras se escribe). None si no queda ninguna palabra útil.
+    """
+    words = [w for w in _WORD.findall(query.lower()) if w not in _STOPWORDS and len(w) > 1]
+    if not words:
+        return None
+    words = list(dict.fromkeys(words))[:16]
+    terms = [f'"{w}"' for w in words]
+    if prefix:
+        terms[-1] += "*"
+    return " OR ".join(terms)
+
+
+def _bm25() -> str:
+    return f"bm25(stories_fts, {', '.join(str(w) for w in BM25_WEIGHTS)})"
+
+
+def _is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def build_tsquery(query: str, prefix: bool = False) -> Optional[str]:
+    """Equivalente de build_match_query para to_tsquery('spanish', ...): 'w1 | w2:*'."""
+    words = [w for w in _WORD.findall(query.lower()) if w not in _STOPWORDS and len(w) > 1]
+    if not words:
+        return None
+    terms = list(dict.fromkeys(words))[:16]
+    if prefix:
+        terms[-1] += ":*"
+    return " | ".join(terms)
+
+
+def _pg_lexical_rank(
+    db: Session, query: str, limit: int, allowed_ids: Optional[Collection[str]]
+) -> List[Tuple[str, float]]:
+    tsquery = build_tsquery(query)
+    if tsquery is None:
+        return []
+    params: Dict[str, Any] = {"q": tsquery, "limit": limit}
+    restrict = ""
+    if allowed_ids is not None:
+        restrict = "AND id = ANY(:ids) "
+        params["ids"] = list(allowed_ids)
+    # Savepoint: un fallo no deja abortada la transacción de la petición
+    with db.begin_nested():
+        rows = db.execute(text(
+            f"SELECT id, ts_rank_cd({STORIES_TSVECTOR}, q) AS rank "
+            "FROM stories, to_tsquery('spanish', :q) q "
+            f"WHERE {STORIES_TSVECTOR} @@ q {restrict}ORDER BY rank DESC LIMIT :limit"
+        ), params).all()
+    return [(story_id, float(rank)) for story_id, rank in rows]
+
+
+def lexical_rank(
+    db: Session,
+    query: str,
+    limit: int,
+    allowed_ids: Optional[Collection[str]] = None,
+) -> List[Tuple[str, float]]:
+    """
+    Cuentos que contienen las palabras de la consulta, de más a menos
+    relevante: [(story_id, relevancia BM25 positiva)].
+    """
+    match = build_match_query(query)
+    if match is None or limit <= 0 or (allowed_ids is not None and not allowed_ids):
+        return []
+    try:
+        if _is_postgres(db):
+            return _pg_lexical_rank(db, query, limit, allowed_ids)
+        # Los candidatos se filtran en la propia consulta: el LIMIT ya cuenta solo candidatos
+        statement = text(
+            f"SELECT story_id, {_bm25()} AS rank FROM stories_fts WHERE stories_fts MATCH :match "
+            + ("AND story_id IN :ids " if allowed_ids is not None else "")
+            + "ORDER BY rank LIMIT :limit"
+        )
+        params: Dict[str, Any] = {"match": match, "limit": limit}
+        if allowed_ids is not None:
+            statement = statement.bindparams(bindparam("ids", expanding=True))
+            params["ids"] = list(allowed_ids)
+        rows = db.execute(statement, params).all()
+    except Exception as e:
+        print(f"[TextSearch] ⚠️ Búsqueda de texto completo no disponible: {e}")
+        return []
+    # bm25() devuelve valores negativos (menor = mejor)
+    return [(story_id, -rank) for story_id, rank in rows]
+
+
+def search_stories(db: Session, query: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+    """Buscador de la biblioteca: cuentos con título, extracto resaltado y relevancia."""
+    if _is_postgres(db):
+        tsquery = build_tsquery(query, prefix=True)
+        if tsquery is None:
+            return []
+        rows = db.execute(text(
+            f"SELECT s.id AS story_id, s.title, s.is_seed, s.created_at, "
+            f"ts_rank_cd({STORIES_TSVECTOR}, q) AS score, "
+            "ts_headline('spanish', s.content, q, "
+            "'StartSel=«, StopSel=», MaxWords=24, MinWords=8, FragmentDelimiter=…') AS snippet "
+            "FROM stories s, to_tsquery('spanish', :q) q "
+            f"WHERE {STORIES_TSVECTOR} @@ q "
+            "ORDER BY score DESC LIMIT :limit OFFSET :offset"
+        ), {"q": tsquery, "limit": limit, "offset": offset}).mappings().all()
+    else:
+        match = build_match_query(query, prefix=True)
+        if match is None:
+            return []
+        rows = db.execute(text(
+            f"SELECT stories_fts.story_id, s.title, s.is_seed, s.created_at, -{_bm25()} AS score, "
+            "snippet(stories_fts, 2, '«', '»', '…', 24) AS snippet "
+            "FROM stories_fts JOIN stories s ON s.id = stories_fts.story_id "
+            "WHERE stories_fts MATCH :match ORDER BY score DESC LIMIT :limit OFFSET :offset"
+        ), {"match": match, "limit": limit, "offset": offset}).mappings().all()
+    return [
+        {
+            "id": row["story_id"],
+            "title": row["title"],
+            "snippet": row["snippet"],
+            "score": float(row["score"]),
+            "is_seed": bool(row["is_seed"]),
+            "created_at": row["created_at"],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,747 @@
+# Índices vectoriales en memoria para búsqueda semántica (RAG)
+# Sustituye el bucle Python de similitud coseno por álgebra vectorial con NumPy
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Normaliza (L2) cada fila de la matriz. Las filas nulas se dejan a cero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Posiciones de los k mayores scores, ordenadas de mayor a menor."""
+    k = min(k, scores.shape[0])
+    if k < scores.shape[0]:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(scores.shape[0])
+    return top[np.argsort(-scores[top])]
+
+
+class VectorIndex(ABC):
+    """
+    Interfaz común de los índices vectoriales de RAG.
+
+    Todas las implementaciones trabajan con similitud coseno sobre vectores
+    normalizados. Los índices en memoria pueden persistirse en un único
+    fichero .npz; los de pgvector ya viven en la BD.
+    """
+
+    index_type = "base"
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def __contains__(self, item_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def ids(self) -> List[str]:
+        """IDs indexados (copia)."""
+
+    @abstractmethod
+    def vector(self, item_id: str) -> Optional[np.ndarray]:
+        """Vector normalizado de un ID (None si no está indexado)."""
+
+    @abstractmethod
+    def build(self, ids: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        ...
+
+    @abstractmethod
+    def add(self, item_id: str, vector: Sequence[float]) -> bool:
+        ...
+
+    @abstractmethod
+    def remove(self, item_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def search(
+        self,
+        query: Sequence[float],
+        k: int,
+        min_similarity: float = -1.0,
+        allowed_ids: Optional[Collection[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        ...
+
+    @abstractmethod
+    def save(self, path: Path) -> None:
+        ...
+
+    @classmethod
+    def load(cls, path: Path) -> "VectorIndex":
+        """Carga un índice persistido, instanciando la clase que lo guardó."""
+        with np.load(path, allow_pickle=False) as data:
+            index_type = str(data["index_type"])
+            index_cls = {c.index_type: c for c in (FlatVectorIndex, IVFFlatIndex)}.get(index_type)
+            if index_cls is None:
+                raise ValueError(f"Tipo de índice desconocido: {index_type}")
+            index = index_cls.__new__(index_cls)
+            index._restore(data)
+        return index
+
+
+class FlatVectorIndex(VectorIndex):
+    """
+    Índice exacto (fuerza bruta) residente en memoria.
+
+    Guarda los embeddings normalizados en una matriz float32 contigua y los
+    IDs en una lista paralela, de forma que la similitud coseno contra todo
+    el corpus se reduce a un único producto matriz-vector.
+    """
+
+    index_type = "flat"
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+        self._lock = threading.RLock()
+        # _buffer reserva capacidad extra; _matrix es la vista de filas ocupadas
+        self._buffer = np.empty((0, dim or 0), dtype=np.float32)
+        self._matrix = self._buffer
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self.build_seconds = 0.0
+        self.built_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._positions
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._ids)
+
+    def vector(self, item_id: str) -> Optional[np.ndarray]:
+        """Copia del vector normalizado de un ID (None si no está indexado)."""
+        with self._lock:
+            pos = self._positions.get(item_id)
+            return None if pos is None else self._matrix[pos].copy()
+
+    def vectors(self) -> np.ndarray:
+        """Copia de la matriz de vectores normalizados (filas ocupadas)."""
+        with self._lock:
+            return self._matrix.copy()
+
+    def build(self, ids: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Reconstruye el índice completo a partir de IDs y vectores."""
+        start = time.perf_counter()
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or len(ids) != matrix.shape[0]:
+            matrix = np.empty((0, self.dim or 0), dtype=np.float32)
+            ids = []
+
+        with self._lock:
+            if len(ids) > 0:
+                self.dim = matrix.shape[1]
+            self._buffer = np.ascontiguousarray(normalize_rows(matrix))
+            self._matrix = self._buffer
+            self._ids = list(ids)
+            self._positions = {item_id: pos for pos, item_id in enumerate(self._ids)}
+            self._on_build()
+            self.build_seconds = time.perf_counter() - start
+            self.built_at = datetime.utcnow()
+
+    def _on_build(self) -> None:
+        """Hook para que las subclases preparen sus estructuras tras build()."""
+
+    def _on_add(self, pos: int, row: np.ndarray) -> None:
+        """Hook llamado tras escribir una fila (nueva o reemplazada)."""
+
+    def _on_move(self, src: int, dst: int) -> None:
+        """Hook llamado cuando una fila se mueve de posición al eliminar."""
+
+    def add(self, item_id: str, vector: Sequence[float]) -> bool:
+        """Inserta (o reemplaza) un vector. Retorna False si la dimensión no encaja."""
+        row = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            if self.dim is None or len(self._ids) == 0:
+                self.dim = row.shape[1]
+                if self._buffer.shape[1] != self.dim:
+                    self._buffer = np.empty((0, self.dim), dtype=np.float32)
+                    self._matrix = self._buffer
+            if row.shape[1] != self.dim:
+                return False
+
+            row = normalize_rows(row)
+            pos = self._positions.get(item_id)
+            if pos is not None:
+                self._matrix[pos] = row[0]
+                self._on_add(pos, row[0])
+                return True
+
+            size = len(self._ids)
+            if size == self._buffer.shape[0]:
+                # Crecimiento geométrico: inserciones O(1) amortizadas
+                grown = np.empty((max(16, size * 2), self.dim), dtype=np.float32)
+                grown[:size] = self._buffer[:size]
+                self._buffer = grown
+            self._buffer[size] = row[0]
+            self._matrix = self._buffer[:size + 1]
+            self._positions[item_id] = size
+            self._ids.append(item_id)
+            self._on_add(size, row[0])
+            return True
+
+    def remove(self, item_id: str) -> bool:
+        """Elimina un vector del índice (intercambiándolo con el último)."""
+        with self._lock:
+            pos = self._positions.pop(item_id, None)
+            if pos is None:
+                return False
+            last = len(self._ids) - 1
+            if pos != last:
+                self._matrix[pos] = self._matrix[last]
+                moved_id = self._ids[last]
+                self._ids[pos] = moved_id
+                self._positions[moved_id] = pos
+                self._on_move(last, pos)
+            self._ids.pop()
+            self._matrix = self._buffer[:last]
+            return True
+
+    def _prepare_query(self, query: Sequence[float]) -> Optional[np.ndarray]:
+        q = np.asarray(query, dtype=np.float32).ravel()
+        norm = np.linalg.norm(q)
+        if norm == 0 or len(self._ids) == 0 or q.shape[0] != self.dim:
+            return None
+        return q / norm
+
+    def _allowed_rows(self, allowed_ids: Collection[str]) -> np.ndarray:
+        rows = [self._positions[i] for i in allowed_ids if i in self._positions]
+        return np.asarray(sorted(rows), dtype=np.intp)
+
+    def _score_rows(
+        self,
+        q: np.ndarray,
+        rows: Optional[np.ndarray],
+        k: int,
+        min_similarity: float,
+    ) -> List[Tuple[str, float]]:
+        """Producto matriz-vector sobre las filas indicadas (o todas) y top-k."""
+        if rows is None:
+            scores = self._matrix @ q
+            row_ids = np.arange(scores.shape[0])
+        else:
+            if rows.shape[0] == 0:
+                return []
+            scores = self._matrix[rows] @ q
+            row_ids = rows
+
+        top = _top_k(scores, k)
+        return [
+            (self._ids[row_ids[i]], float(scores[i]))
+            for i in top
+            if scores[i] >= min_similarity
+        ]
+
+    def search(
+        self,
+        query: Sequence[float],
+        k: int,
+        min_similarity: float = -1.0,
+        allowed_ids: Optional[Collection[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        Retorna hasta k pares (id, similitud) ordenados de mayor a menor similitud.
+        Si se indica allowed_ids, solo se calculan similitudes para esas filas.
+        """
+        if k <= 0:
+            return []
+        with self._lock:
+            q = self._prepare_query(query)
+            if q is None:
+                return []
+            rows = self._allowed_rows(allowed_ids) if allowed_ids is not None else None
+            return self._score_rows(q, rows, k, min_similarity)
+
+    def stats(self) -> Dict:
+        """Métricas del índice para endpoints de diagnóstico."""
+        with self._lock:
+            return {
+                "type": self.index_type,
+                "size": len(self._ids),
+                "dimension": self.dim,
+                "memory_bytes": int(self._buffer.nbytes),
+                "build_seconds": round(self.build_seconds, 4),
+                "built_at": self.built_at.isoformat() if self.built_at else None,
+            }
+
+    def _payload(self) -> Dict[str, np.ndarray]:
+        return {
+            "index_type": np.array(self.index_type),
+            "ids": np.array(self._ids, dtype=str),
+            "matrix": self._matrix,
+            "dim": np.array(self.dim or 0),
+            "build_seconds": np.array(self.build_seconds),
+            "built_at": np.array(self.built_at.isoformat() if self.built_at else ""),
+        }
+
+    def save(self, path: Path) -> None:
+        """Persiste el índice de forma atómica (fichero temporal + rename)."""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with self._lock:
+            payload = self._payload()
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **payload)
+        os.replace(tmp_path, path)
+
+    def _restore(self, data) -> None:
+        self._lock = threading.RLock()
+        self._buffer = np.ascontiguousarray(data["matrix"], dtype=np.float32)
+        self._matrix = self._buffer
+        self._ids = [str(i) for i in data["ids"]]
+        self._positions = {item_id: pos for pos, item_id in enumerate(self._ids)}
+        self.dim = int(data["dim"]) or None
+        self.build_seconds = float(data["build_seconds"])
+        built_at = str(data["built_at"])
+        self.built_at = datetime.fromisoformat(built_at) if built_at else None
+
+
+class IVFFlatIndex(FlatVectorIndex):
+    """
+    Índice aproximado IVF-Flat (inverted file).
+
+    Un k-means esférico agrupa los vectores en nlist listas; cada consulta
+    solo puntúa las filas de las nprobe listas cuyos centroides son más
+    similares, reduciendo el coste de O(N·d) a O((nlist + N·nprobe/nlist)·d).
+
+    Tras entrenar, las filas se reordenan por lista para que cada lista sea
+    un bloque contiguo de la matriz (sin copias al sondear). Las inserciones
+    posteriores van a una cola que se filtra por asignación, y los borrados
+    dentro de los bloques se marcan como lápidas hasta el siguiente reentreno.
+    """
+
+    index_type = "ivf_flat"
+
+    def __init__(
+        self,
+        dim: Optional[int] = None,
+        nlist: int = 0,
+        nprobe: int = 8,
+        train_iterations: int = 10,
+        seed: int = 0,
+    ):
+        super().__init__(dim)
+        self.nlist = nlist  # 0 = automático (≈ sqrt(N))
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.seed = seed
+        self.trained_size = 0
+        self._centroids = np.empty((0, dim or 0), dtype=np.float32)
+        self._assign_buffer = np.empty(0, dtype=np.int32)
+        self._dead_buffer = np.empty(0, dtype=bool)
+        self._offsets = np.zeros(1, dtype=np.int64)  # inicio de cada lista en la zona ordenada
+        self._sorted_end = 0  # filas [0, _sorted_end) agrupadas por lista
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return [self._ids[pos] for pos in sorted(self._positions.values())]
+
+    def vectors(self) -> np.ndarray:
+        with self._lock:
+            return self._matrix[sorted(self._positions.values())].copy()
+
+    @property
+    def _assign(self) -> np.ndarray:
+        return self._assign_buffer[:len(self._ids)]
+
+    @property
+    def _dead(self) -> np.ndarray:
+        return self._dead_buffer[:len(self._ids)]
+
+    def _train(self, vectors: np.ndarray, nlist: int) -> np.ndarray:
+        """K-means esférico sobre una muestra de los vectores normalizados."""
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(vectors.shape[0], nlist * 64)
+        sample = vectors[rng.choice(vectors.shape[0], sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.train_iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(assign, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = counts == 0
+            if empty.any():
+                # Reinicializar listas vacías con puntos aleatorios
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize_rows(sums).astype(np.float32)
+
+        return centroids
+
+    def _assign_rows(self, rows: np.ndarray, batch: int = 4096) -> np.ndarray:
+        out = np.empty(rows.shape[0], dtype=np.int32)
+        for start in range(0, rows.shape[0], batch):
+            chunk = rows[start:start + batch]
+            out[start:start + batch] = np.argmax(chunk @ self._centroids.T, axis=1)
+        return out
+
+    def _on_build(self) -> None:
+        n = len(self._ids)
+        if n == 0:
+            self._centroids = np.empty((0, self.dim or 0), dtype=np.float32)
+            self._assign_buffer = np.empty(0, dtype=np.int32)
+            self._dead_buffer = np.empty(0, dtype=bool)
+            self._offsets = np.zeros(1, dtype=np.int64)
+            self._sorted_end = 0
+            self.trained_size = 0
+            return
+        nlist = self.nlist or int(round(np.sqrt(n)))
+        nlist = max(1, min(nlist, n))
+        self._centroids = self._train(self._matrix, nlist)
+        assign = self._assign_rows(self._matrix)
+
+        # Reordenar filas para que cada lista ocupe un bloque contiguo
+        order = np.argsort(assign, kind="stable")
+        self._buffer = np.ascontiguousarray(self._matrix[order])
+        self._matrix = self._buffer
+        self._ids = [self._ids[i] for i in order]
+        self._positions = {item_id: pos for pos, item_id in enumerate(self._ids)}
+        self._assign_buffer = assign[order]
+        self._dead_buffer = np.zeros(n, dtype=bool)
+        self._offsets = np.searchsorted(self._assign_buffer, np.arange(nlist + 1)).astype(np.int64)
+        self._sorted_end = n
+        self.trained_size = n
+
+    def add(self, item_id: str, vector: Sequence[float]) -> bool:
+        with self._lock:
+            pos = self._positions.get(item_id)
+            if pos is not None and pos < self._sorted_end:
+                # Reemplazo dentro de un bloque: lápida y reinserción en la cola
+                self.remove(item_id)
+            return super().add(item_id, vector)
+
+    def _on_add(self, pos: int, row: np.ndarray) -> None:
+        if self._centroids.shape[0] == 0 or self._centroids.shape[1] != row.shape[0]:
+            # Aún sin entrenar: una única lista con el primer vector
+            self._centroids = row.reshape(1, -1).astype(np.float32)
+        if pos >= self._assign_buffer.shape[0]:
+            capacity = max(16, self._buffer.shape[0])
+            grown = np.empty(capacity, dtype=np.int32)
+            grown[:self._assign_buffer.shape[0]] = self._assign_buffer
+            self._assign_buffer = grown
+            grown_dead = np.zeros(capacity, dtype=bool)
+            grown_dead[:self._dead_buffer.shape[0]] = self._dead_buffer
+            self._dead_buffer = grown_dead
+        self._assign_buffer[pos] = int(np.argmax(self._centroids @ row))
+        self._dead_buffer[pos] = False
+
+    def _on_move(self, src: int, dst: int) -> None:
+        self._assign_buffer[dst] = self._assign_buffer[src]
+        self._dead_buffer[dst] = self._dead_buffer[src]
+
+    def remove(self, item_id: str) -> bool:
+        with self._lock:
+            pos = self._positions.get(item_id)
+            if pos is None:
+                return False
+            if pos >= self._sorted_end:
+                # En la cola se puede compactar moviendo la última fila
+                return super().remove(item_id)
+            del self._positions[item_id]
+            self._dead_buffer[pos] = True
+            return True
+
+    def _probed_rows(self, probes: np.ndarray) -> Tuple[List[slice], np.ndarray]:
+        """Bloques contiguos de las listas sondeadas + filas de la cola que les pertenecen."""
+        blocks = [
+            slice(int(self._offsets[c]), int(self._offsets[c + 1]))
+            for c in probes
+            if c + 1 < self._offsets.shape[0] and self._offsets[c + 1] > self._offsets[c]
+        ]
+        tail = self._assign[self._sorted_end:]
+        tail_rows = self._sorted_end + np.flatnonzero(np.isin(tail, probes))
+        return blocks, tail_rows
+
+    def _score_probed(
+        self,
+        q: np.ndarray,
+        blocks: List[slice],
+        tail_rows: np.ndarray,
+        k: int,
+        min_similarity: float,
+    ) -> List[Tuple[str, float]]:
+        parts_scores, parts_rows = [], []
+        for block in blocks:
+            parts_scores.append(self._matrix[block] @ q)
+            parts_rows.append(np.arange(block.start, block.stop))
+        if tail_rows.shape[0]:
+            parts_scores.append(self._matrix[tail_rows] @ q)
+            parts_rows.append(tail_rows)
+        if not parts_scores:
+            return []
+
+        scores = np.concatenate(parts_scores)
+        rows = np.concatenate(parts_rows)
+        scores[self._dead[rows]] = -np.inf
+        top = _top_k(scores, k)
+        return [
+            (self._ids[rows[i]], float(scores[i]))
+            for i in top
+            if scores[i] >= min_similarity
+        ]
+
+    def _allowed_rows(self, allowed_ids: Collection[str]) -> np.ndarray:
+        rows = super()._allowed_rows(allowed_ids)
+        return rows[~self._dead[rows]] if rows.shape[0] else rows
+
+    def search(
+        self,
+        query: Sequence[float],
+        k: int,
+        min_similarity: float = -1.0,
+        allowed_ids: Optional[Collection[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        if k <= 0:
+            return []
+        with self._lock:
+            q = self._prepare_query(query)
+            if q is None:
+                return []
+
+            nprobe = min(self.nprobe, self._centroids.shape[0])
+            probes = _top_k(self._centroids @ q, nprobe)
+            blocks, tail_rows = self._probed_rows(probes)
+
+            if allowed_ids is None:
+                return self._score_probed(q, blocks, tail_rows, k, min_similarity)
+
+            allowed_rows = self._allowed_rows(allowed_ids)
+            probed_rows = np.concatenate(
+                [np.arange(b.start, b.stop) for b in blocks] + [tail_rows]
+            ) if blocks else tail_rows
+            rows = np.intersect1d(probed_rows, allowed_rows)
+            results = self._score_rows(q, rows, k, min_similarity)
+            if len(results) < k and rows.shape[0] < allowed_rows.shape[0]:
+                # Filtro muy selectivo: los candidatos permitidos caben en un
+                # escaneo exacto, así que no se pierden resultados por el sondeo
+                results = self._score_rows(q, allowed_rows, k, min_similarity)
+            return results
+
+    def needs_retrain(self) -> bool:
+        """True si el corpus ha doblado su tamaño o acumula muchas lápidas."""
+        with self._lock:
+            dead = int(self._dead.sum())
+        return len(self) > 2 * max(self.trained_size, 1) or dead > 0.1 * max(self.trained_size, 1)
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                "size": len(self),
+                "nlist": int(self._centroids.shape[0]),
+                "nprobe": self.nprobe,
+                "trained_size": self.trained_size,
+                "unsorted_tail": len(self._ids) - self._sorted_end,
+                "tombstones": int(self._dead.sum()),
+            })
+        return stats
+
+    def _payload(self) -> Dict[str, np.ndarray]:
+        payload = super()._payload()
+        payload.update({
+            "centroids": self._centroids,
+            "assign": self._assign,
+            "dead": self._dead,
+            "offsets": self._offsets,
+            "sorted_end": np.array(self._sorted_end),
+            "nlist": np.array(self.nlist),
+            "nprobe": np.array(self.nprobe),
+            "train_iterations": np.array(self.train_iterations),
+            "seed": np.array(self.seed),
+            "trained_size": np.array(self.trained_size),
+        })
+        return payload
+
+    def _restore(self, data) -> None:
+        super()._restore(data)
+        self._centroids = np.ascontiguousarray(data["centroids"], dtype=np.float32)
+        self._assign_buffer = np.array(data["assign"], dtype=np.int32)
+        self._dead_buffer = np.array(data["dead"], dtype=bool)
+        self._offsets = np.array(data["offsets"], dtype=np.int64)
+        self._sorted_end = int(data["sorted_end"])
+        self.nlist = int(data["nlist"])
+        self.nprobe = int(data["nprobe"])
+        self.train_iterations = int(data["train_iterations"])
+        self.seed = int(data["seed"])
+        self.trained_size = int(data["trained_size"])
+        self._positions = {
+            item_id: pos
+            for pos, item_id in enumerate(self._ids)
+            if not self._dead_buffer[pos]
+        }
+
+
+
+class ChunkVectorIndex(FlatVectorIndex):
+    """
+    Índice exacto multi-vector: cada cuento aporta varios fragmentos con IDs
+    "<story_id>#<n>" y la búsqueda agrega sus similitudes por cuento.
+
+    Un array de códigos de grupo paralelo a la matriz permite agregar con
+    NumPy (ordenación por grupo y reduceat) sin bucles Python por fila.
+    """
+
+    index_type = "chunk_flat"
+    SEPARATOR = "#"
+
+    def __init__(self, dim: Optional[int] = None):
+        super().__init__(dim)
+        self._codes_buffer = np.empty(0, dtype=np.int32)
+        self._group_names: List[str] = []
+        self._group_codes: Dict[str, int] = {}
+        self._group_sizes: Dict[str, int] = {}
+
+    @classmethod
+    def item_id(cls, group: str, chunk_index: int) -> str:
+        return f"{group}{cls.SEPARATOR}{chunk_index}"
+
+    @classmethod
+    def split_item_id(cls, item_id: str) -> Tuple[str, int]:
+        group, _, chunk_index = item_id.rpartition(cls.SEPARATOR)
+        return group, int(chunk_index)
+
+    def _code(self, group: str) -> int:
+        code = self._group_codes.get(group)
+        if code is None:
+            code = len(self._group_names)
+            self._group_codes[group] = code
+            self._group_names.append(group)
+        return code
+
+    def groups(self) -> List[str]:
+        """Cuentos con al menos un fragmento indexado."""
+        with self._lock:
+            return list(self._group_sizes)
+
+    def has_group(self, group: str) -> bool:
+        return group in self._group_sizes
+
+    def _on_build(self) -> None:
+        self._group_names, self._group_codes, self._group_sizes = [], {}, {}
+        self._codes_buffer = np.empty(self._buffer.shape[0], dtype=np.int32)
+        for pos, item_id in enumerate(self._ids):
+            group = self.split_item_id(item_id)[0]
+            self._codes_buffer[pos] = self._code(group)
+            self._group_sizes[group] = self._group_sizes.get(group, 0) + 1
+
+    def _on_add(self, pos: int, row: np.ndarray) -> None:
+        if pos >= self._codes_buffer.shape[0]:
+            grown = np.empty(max(16, self._buffer.shape[0]), dtype=np.int32)
+            grown[:self._codes_buffer.shape[0]] = self._codes_buffer
+            self._codes_buffer = grown
+        self._codes_buffer[pos] = self._code(self.split_item_id(self._ids[pos])[0])
+
+    def _on_move(self, src: int, dst: int) -> None:
+        self._codes_buffer[dst] = self._codes_buffer[src]
+
+    def add(self, item_id: str, vector: Sequence[float]) -> bool:
+        with self._lock:
+            is_new = item_id not in self._positions
+            added = super().add(item_id, vector)
+            if added and is_new:
+                group = self.split_item_id(item_id)[0]
+                self._group_sizes[group] = self._group_sizes.get(group, 0) + 1
+            return added
+
+    def remove(self, item_id: str) -> bool:
+        with self._lock:
+            removed = super().remove(item_id)
+            if removed:
+                group = self.split_item_id(item_id)[0]
+                self._group_sizes[group] -= 1
+                if self._group_sizes[group] == 0:
+                    del self._group_sizes[group]
+            return removed
+
+    def replace_group(self, group: str, vectors: Sequence[Sequence[float]]) -> int:
+        """Sustituye todos los fragmentos de un cuento. Retorna los añadidos."""
+        with self._lock:
+            code = self._group_codes.get(group)
+            if code is not None and group in self._group_sizes:
+                rows = np.flatnonzero(self._codes_buffer[:len(self._ids)] == code)
+                for item_id in [self._ids[row] for row in rows]:
+                    self.remove(item_id)
+            return sum(int(self.add(self.item_id(group, n), vector)) for n, vector in enumerate(vectors))
+
+    def search_groups(
+        self,
+        query: Sequence[float],
+        k: int,
+        min_similarity: float = -1.0,
+        allowed_groups: Optional[Collection[str]] = None,
+        aggregate: str = "max",
+        top_n: int = 2,
+    ) -> List[Tuple[str, float, int]]:
+        """
+        Retorna hasta k tuplas (cuento, similitud agregada, fragmento más similar).
+        aggregate="max" usa el mejor fragmento; "mean_top" la media de los
+        top_n mejores fragmentos de cada cuento.
+        """
+        if k <= 0:
+            return []
+        with self._lock:
+            q = self._prepare_query(query)
+            if q is None:
+                return []
+            codes = self._codes_buffer[:len(self._ids)]
+            if allowed_groups is not None:
+                allowed_codes = [self._group_codes[g] for g in allowed_groups if g in self._group_codes]
+                rows = np.flatnonzero(np.isin(codes, allowed_codes))
+                if rows.shape[0] == 0:
+                    return []
+                scores = self._matrix[rows] @ q
+                codes = codes[rows]
+            else:
+                rows = np.arange(len(self._ids))
+                scores = self._matrix @ q
+
+            # Orden por cuento y, dentro de cada uno, de mayor a menor similitud
+            order = np.lexsort((-scores, codes))
+            scores, codes, rows = scores[order], codes[order], rows[order]
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            if aggregate == "mean_top":
+                sizes = np.diff(np.r_[starts, codes.shape[0]])
+                rank = np.arange(codes.shape[0]) - np.repeat(starts, sizes)
+                keep = rank < max(1, top_n)
+                totals = np.add.reduceat(np.where(keep, scores, 0.0), starts)
+                aggregated = totals / np.add.reduceat(keep.astype(np.float32), starts)
+            else:
+                aggregated = scores[starts]
+
+            results = []
+            for i in _top_k(aggregated, k):
+                if aggregated[i] < min_similarity:
+                    continue
+                group, chunk_index = self.split_item_id(self._ids[rows[starts[i]]])
+                results.append((group, float(aggregated[i]), chunk_index))
+            return results
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats["stories"] = len(self._group_sizes)
+        return stats
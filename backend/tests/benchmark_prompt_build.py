@@ -0,0 +1,70 @@
+"""
+Benchmark de la construcción del prompt de cuentos: sin plantilla (la guía de
+estilo se recorre en cada llamada) vs plantilla precompilada.
+
+Ejecutar desde backend:
+    python tests/benchmark_prompt_build.py --calls 2000
+"""
+import sys
+import os
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from models.schemas import StoryPromptInput
+from services.prompt_service import PromptService
+
+EJEMPLOS = [{
+    "rank": 1, "score": 9, "similarity": 0.82, "title": "La nube que no quería llover",
+    "fragment": "Plic, plic, plic... La nube Nilo apretaba los ojos.", "techniques": ["Onomatopeyas"],
+}]
+
+
+def medir(service, inputs, calls, compilar_siempre):
+    """Retorna ms por llamada."""
+    async def run():
+        for i in range(calls):
+            if compilar_siempre:
+                service._template = None  # Comportamiento anterior: reconstruir todo
+            await service.build_story_prompt(inputs[i % len(inputs)], apply_lessons=False, similar_stories=EJEMPLOS)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        asyncio.run(run())
+    return (time.perf_counter() - inicio) * 1000 / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000, help="Llamadas por escenario")
+    args = parser.parse_args()
+
+    service = PromptService()
+    service.load_style_guide()
+    inputs = [
+        StoryPromptInput(personaje="Lira", contexto_opcional="Un día de lluvia", emocion_objetivo="calma"),
+        StoryPromptInput(personaje="Cucu", personajes_secundarios=["Nilo"], lugar="El río"),
+    ]
+
+    # Las dos variantes deben producir exactamente el mismo prompt
+    with contextlib.redirect_stdout(io.StringIO()):
+        compilado = asyncio.run(service.build_story_prompt(inputs[0], apply_lessons=False, similar_stories=EJEMPLOS))
+        service._template = None
+        sin_plantilla = asyncio.run(service.build_story_prompt(inputs[0], apply_lessons=False, similar_stories=EJEMPLOS))
+    assert compilado == sin_plantilla
+
+    antes = medir(service, inputs, args.calls, compilar_siempre=True)
+    despues = medir(service, inputs, args.calls, compilar_siempre=False)
+    print(f"Prompt de {len(compilado)} caracteres · plantilla {service.template_version}")
+    print(f"  Sin plantilla:       {antes * 1000:8.1f} µs/llamada")
+    print(f"  Plantilla compilada: {despues * 1000:8.1f} µs/llamada  ({antes / despues:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
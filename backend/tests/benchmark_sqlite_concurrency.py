@@ -0,0 +1,124 @@
+"""
+Prueba de carga de SQLite: lectores y escritores concurrentes con el perfil
+"default" (rollback journal) frente a "production" (WAL + PRAGMAs).
+Cada lector hace la consulta de la biblioteca y lee un cuento; cada escritor
+guarda cuentos con su crítica (como la generación y las críticas en background).
+Mide operaciones por segundo, latencia p95 y errores "database is locked".
+
+Ejecutar desde backend:
+    python tests/benchmark_sqlite_concurrency.py --readers 8 --writers 2 --seconds 10
+"""
+import sys
+import os
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, Critique, Story, create_db_engine
+
+
+def preparar(url, cuentos):
+    engine = create_db_engine(url, profile="default")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    for i in range(cuentos):
+        story = Story(title=f"Cuento {i}", content="Había una vez una nube. " * 80)
+        session.add(story)
+        session.flush()
+        session.add(Critique(story_id=story.id, critique_text="{}", score=7.5))
+    session.commit()
+    session.close()
+    engine.dispose()
+
+
+def trabajador(session_factory, operacion, fin, resultados):
+    latencias, errores = [], 0
+    while time.perf_counter() < fin:
+        session = session_factory()
+        inicio = time.perf_counter()
+        try:
+            operacion(session)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        except OperationalError as e:
+            session.rollback()
+            if "locked" not in str(e):
+                raise
+            errores += 1
+        finally:
+            session.close()
+    resultados.append((latencias, errores))
+
+
+def leer(session):
+    rows = session.query(Story.id, Story.title, Story.created_at).order_by(
+        Story.created_at.desc(), Story.id.desc()
+    ).limit(12).all()
+    session.query(Story.content).filter(Story.id == rows[0].id).one()
+
+
+def escribir(session):
+    story = Story(id=str(uuid.uuid4()), title="Nuevo", content="Érase una vez un dragón. " * 80)
+    session.add(story)
+    session.flush()
+    session.add(Critique(story_id=story.id, critique_text="{}", score=8.0))
+    session.commit()
+
+
+def medir(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'carga.db')}"
+        preparar(url, args.stories)
+        engine = create_db_engine(url, profile=profile, pool_size=args.readers + args.writers)
+        session_factory = sessionmaker(bind=engine)
+        fin = time.perf_counter() + args.seconds
+        lecturas, escrituras = [], []
+        hilos = [
+            threading.Thread(target=trabajador, args=(session_factory, leer, fin, lecturas))
+            for _ in range(args.readers)
+        ] + [
+            threading.Thread(target=trabajador, args=(session_factory, escribir, fin, escrituras))
+            for _ in range(args.writers)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        engine.dispose()
+
+    def resumen(nombre, resultados):
+        latencias = [ms for lat, _ in resultados for ms in lat]
+        errores = sum(err for _, err in resultados)
+        p95 = statistics.quantiles(latencias, n=20)[-1] if len(latencias) >= 20 else float("nan")
+        print(f"  {nombre:<10} {len(latencias) / args.seconds:>9.0f} ops/s   "
+              f"p95 {p95:>7.1f} ms   bloqueos {errores}")
+
+    print(f"Perfil {profile}:")
+    resumen("lecturas", lecturas)
+    resumen("escrituras", escrituras)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8, help="Hilos lectores")
+    parser.add_argument("--writers", type=int, default=2, help="Hilos escritores")
+    parser.add_argument("--seconds", type=float, default=10, help="Duración de cada prueba")
+    parser.add_argument("--stories", type=int, default=2000, help="Cuentos iniciales en la BD")
+    args = parser.parse_args()
+
+    print(f"📊 {args.readers} lectores + {args.writers} escritores durante {args.seconds:.0f}s "
+          f"sobre {args.stories} cuentos\n")
+    for profile in ("default", "production"):
+        medir(profile, args)
+
+
+if __name__ == "__main__":
+    main()
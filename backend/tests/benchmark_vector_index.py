@@ -0,0 +1,85 @@
+"""
+Benchmark del índice vectorial de RAG: fuerza bruta vs IVF-Flat.
+Mide latencia por consulta y recall@k del índice aproximado frente al exacto.
+
+Ejecutar desde backend:
+    python tests/benchmark_vector_index.py --stories 20000 --dim 3072 --nprobe 8
+"""
+import sys
+import os
+import argparse
+import time
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+import numpy as np
+from services.vector_index import FlatVectorIndex, IVFFlatIndex
+
+
+def generar_datos(n, dim, temas, seed, ruido=0.6):
+    """Embeddings sintéticos agrupados por 'temas' con ruido gaussiano."""
+    rng = np.random.default_rng(seed)
+    centros = rng.normal(size=(temas, dim)).astype(np.float32)
+    etiquetas = rng.integers(0, temas, size=n)
+    ruido = rng.normal(scale=ruido, size=(n, dim)).astype(np.float32)
+    return centros[etiquetas] + ruido
+
+
+def medir(index, consultas, k):
+    """Retorna (resultados, ms por consulta)."""
+    inicio = time.perf_counter()
+    resultados = [index.search(q, k) for q in consultas]
+    ms = (time.perf_counter() - inicio) * 1000 / len(consultas)
+    return resultados, ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stories", type=int, default=20000, help="Número de cuentos indexados")
+    parser.add_argument("--dim", type=int, default=768, help="Dimensión de los embeddings (gemini-embedding-001: 3072)")
+    parser.add_argument("--themes", type=int, default=200, help="Número de temas (clusters) sintéticos")
+    parser.add_argument("--noise", type=float, default=0.6, help="Dispersión dentro de cada tema")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas de prueba")
+    parser.add_argument("--k", type=int, default=5, help="Top-k a recuperar")
+    parser.add_argument("--nlist", type=int, default=0, help="Listas IVF (0 = sqrt(N))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16], help="Listas sondeadas por consulta")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  BENCHMARK ÍNDICE VECTORIAL RAG")
+    print("=" * 60)
+    print(f"   Cuentos: {args.stories} | Dimensión: {args.dim} | k: {args.k}")
+
+    # Las consultas comparten temas con el corpus pero no están indexadas
+    datos = generar_datos(args.stories + args.queries, args.dim, args.themes, args.seed, args.noise)
+    vectores, consultas = datos[:args.stories], datos[args.stories:]
+    ids = [f"story-{i}" for i in range(args.stories)]
+
+    flat = FlatVectorIndex()
+    flat.build(ids, vectores)
+    exactos, ms_flat = medir(flat, consultas, args.k)
+    print(f"\n🧮 Fuerza bruta: construcción {flat.build_seconds:.2f}s | {ms_flat:.2f} ms/consulta")
+
+    ivf = IVFFlatIndex(nlist=args.nlist)
+    ivf.build(ids, vectores)
+    print(f"🗂️  IVF-Flat: {ivf.stats()['nlist']} listas | entrenamiento {ivf.build_seconds:.2f}s")
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        aproximados, ms_ivf = medir(ivf, consultas, args.k)
+        aciertos = sum(
+            len({i for i, _ in exacto} & {i for i, _ in aprox})
+            for exacto, aprox in zip(exactos, aproximados)
+        )
+        recall = aciertos / (args.k * len(consultas))
+        print(f"   nprobe={nprobe:<3} recall@{args.k}={recall:.3f} | {ms_ivf:.2f} ms/consulta "
+              f"(x{ms_flat / ms_ivf:.1f} vs fuerza bruta)")
+
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
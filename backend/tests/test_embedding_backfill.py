@@ -0,0 +1,138 @@
+"""
+Tests del backfill de embeddings en lotes con checkpoints.
+Ejecutar desde backend: pytest tests/test_embedding_backfill.py
+"""
+import sys
+import os
+import asyncio
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, Story
+from services.embedding_backfill import EmbeddingBackfill
+
+
+class FakeGemini:
+    """Cuenta las peticiones batch y falla las que contienen un texto marcado."""
+
+    def __init__(self):
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_embeddings(self, texts):
+        self.calls.append(list(texts))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if "falla" in texts:
+            return None
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def _setup(tmp_path, contents):
+    engine = create_engine(f"sqlite:///{tmp_path / 'backfill.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    for i, content in enumerate(contents):
+        db.add(Story(id=f"s{i:02d}", title=f"Cuento {i}", content=content))
+    db.commit()
+    db.close()
+    return factory
+
+
+def _embedded(factory):
+    db = factory()
+    try:
+        return sorted(row.id for row in db.query(Story.id).filter(Story.embedding_blob.isnot(None)))
+    finally:
+        db.close()
+
+
+def test_lotes_concurrencia_y_reanudacion(tmp_path):
+    """Un texto por cuento, varios por petición, y la segunda ejecución sigue desde el checkpoint"""
+    factory = _setup(tmp_path, [f"texto {i}" for i in range(7)])
+    gemini = FakeGemini()
+    indexed = []
+    backfill = EmbeddingBackfill(gemini, factory, batch_size=2, concurrency=2,
+                                 add_to_index=lambda story_id, *a: indexed.append(story_id))
+
+    first = asyncio.run(backfill.run(limit=4))
+    assert first["processed"] == 4 and first["cursor"] == "s03" and not first["finished_at"]
+    assert gemini.max_in_flight == 2 and [len(c) for c in gemini.calls] == [2, 2]
+
+    second = asyncio.run(backfill.run())
+    assert second["processed"] == 7 and second["embedded"] == 7 and second["finished_at"]
+    assert [len(c) for c in gemini.calls] == [2, 2, 2, 1]  # No repite los ya procesados
+    assert _embedded(factory) == [f"s{i:02d}" for i in range(7)]
+    assert indexed == [f"s{i:02d}" for i in range(7)]
+
+
+def test_lote_fallido_no_bloquea_y_se_reintenta(tmp_path):
+    """Un lote que falla queda anotado y la siguiente ejecución completa lo vuelve a intentar"""
+    factory = _setup(tmp_path, ["a", "falla", "b", "c"])
+    gemini = FakeGemini()
+    backfill = EmbeddingBackfill(gemini, factory, batch_size=2, concurrency=1, add_to_index=lambda *a: None)
+
+    state = asyncio.run(backfill.run())
+    assert state["failed"] == ["s00", "s01"] and state["embedded"] == 2
+    assert _embedded(factory) == ["s02", "s03"]
+
+    db = factory()
+    db.query(Story).filter(Story.id == "s01").update({"content": "ya no"})
+    db.commit()
+    db.close()
+    retry = asyncio.run(backfill.run())
+    assert retry["total"] == 2 and retry["failed"] == []
+    assert _embedded(factory) == ["s00", "s01", "s02", "s03"]
+
+
+def test_cuento_largo_se_fragmenta_por_parrafos_en_la_misma_peticion(tmp_path):
+    """Texto completo y fragmentos viajan juntos y los fragmentos quedan en story_chunks"""
+    from models.database_sqlite import StoryChunk
+    from services.story_chunks import split_into_chunks
+
+    paragraphs = [("Párrafo %d. " % i) * 40 for i in range(3)]
+    long_story = "\n\n".join(paragraphs)
+    assert split_into_chunks(long_story, max_chars=600, min_chars=100) == [p.strip() for p in paragraphs]
+    assert split_into_chunks("Uno.\nDos.\n\nTres.", max_chars=600, min_chars=100) == ["Uno.\nDos.\nTres."]
+
+    factory = _setup(tmp_path, ["\n\n".join(p * 3 for p in paragraphs), "breve"])
+    gemini = FakeGemini()
+    state = asyncio.run(EmbeddingBackfill(gemini, factory, batch_size=2, concurrency=1,
+                                          add_to_index=lambda *a: None).run())
+    assert state["embedded"] == 2 and len(gemini.calls) == 1
+
+    db = factory()
+    chunks = db.query(StoryChunk).order_by(StoryChunk.story_id, StoryChunk.chunk_index).all()
+    db.close()
+    assert [c.story_id for c in chunks].count("s00") > 1 and [c.story_id for c in chunks].count("s01") == 1
+
+
+def test_consultas_y_checkpoints_fuera_del_event_loop(tmp_path):
+    """Con el job en el event loop de la API, las sesiones síncronas se abren desde hilos"""
+    import threading
+
+    factory = _setup(tmp_path, [f"texto {i}" for i in range(3)])
+    threads = []
+
+    def tracked_factory():
+        threads.append(threading.get_ident())
+        return factory()
+
+    backfill = EmbeddingBackfill(FakeGemini(), tracked_factory, batch_size=2, concurrency=1,
+                                 add_to_index=lambda *a: threads.append(threading.get_ident()))
+
+    async def run():
+        state = await backfill.run()
+        return state, threading.get_ident()
+
+    state, loop_thread = asyncio.run(run())
+    assert state["embedded"] == 3 and state["finished_at"]
+    assert len(threads) >= 10 and loop_thread not in threads
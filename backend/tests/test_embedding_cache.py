@@ -0,0 +1,79 @@
+"""
+Tests del cache de embeddings de temas (LRU en memoria + tabla en la BD).
+Ejecutar desde backend: pytest tests/test_embedding_cache.py
+"""
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, ThemeEmbedding
+from services.embedding_cache import ThemeEmbeddingCache, normalize_theme
+
+
+def _session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def test_lru_expulsa_por_entradas_y_bytes():
+    """Se expulsa el tema menos usado al superar entradas o bytes"""
+    cache = ThemeEmbeddingCache("modelo", max_entries=2)
+    cache.put("uno", [1.0, 0.0])
+    cache.put("dos", [0.0, 1.0])
+    assert cache.get("uno") is not None  # 'dos' pasa a ser el menos usado
+    cache.put("tres", [1.0, 1.0])
+    assert "dos" not in cache and "uno" in cache
+    assert cache.evictions == 1
+
+    small = ThemeEmbeddingCache("modelo", max_bytes=4 * 4)
+    small.put("a", [1.0, 2.0])
+    small.put("b", [3.0, 4.0, 5.0])
+    assert len(small) == 1 and small.stats()["bytes"] == 12
+
+
+def test_persistente_entre_instancias_y_por_modelo(tmp_path):
+    """Un tema guardado por un worker lo reutiliza otro sin llamar a Gemini"""
+    factory = _session_factory(tmp_path)
+    first = ThemeEmbeddingCache("modelo-a", session_factory=factory)
+    first.put("  El Bosque  Encantado ", [0.5, 0.25])
+
+    second = ThemeEmbeddingCache("modelo-a", session_factory=factory)
+    assert second.get("el bosque encantado").tolist() == [0.5, 0.25]
+    assert second.get("el bosque encantado") is not None
+    stats = second.stats()
+    assert (stats["disk_hits"], stats["hits"], stats["misses"]) == (1, 1, 0)
+    assert stats["persisted_entries"] == 1
+
+    other_model = ThemeEmbeddingCache("modelo-b", session_factory=factory)
+    assert other_model.get("el bosque encantado") is None
+    assert other_model.misses == 1
+
+
+def test_ttl_caduca_memoria_y_bd(tmp_path):
+    """Las entradas más antiguas que el TTL no se devuelven"""
+    factory = _session_factory(tmp_path)
+    cache = ThemeEmbeddingCache("modelo", ttl_seconds=1, session_factory=factory)
+    cache.put("dragones", [1.0])
+    cache._entries["dragones"] = (cache._entries["dragones"][0], time.time() - 5)
+
+    db = factory()
+    db.query(ThemeEmbedding).update({"created_at": datetime.utcnow() - timedelta(seconds=5)})
+    db.commit()
+    db.close()
+
+    assert cache.get("dragones") is None
+    assert cache.expirations == 2
+    assert cache.stats()["persisted_entries"] == 0
+
+
+def test_normalize_theme():
+    """Mayúsculas y espacios no generan claves distintas"""
+    assert normalize_theme("  Un   Gato\tValiente ") == "un gato valiente"
@@ -0,0 +1,73 @@
+"""
+Tests del almacenamiento binario de embeddings y su migración desde JSON.
+Ejecutar desde backend: pytest tests/test_embeddings.py
+"""
+import sys
+import os
+import json
+import sqlite3
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+import numpy as np
+from sqlalchemy import create_engine
+from models.database_sqlite import Base
+from models.migrations import MIGRATIONS, run_migrations
+from models.embeddings import encode_embedding, decode_embedding, embedding_columns
+
+
+def test_roundtrip_float32_y_float16():
+    """El vector se recupera igual (float32) o con error acotado (float16)"""
+    vector = np.random.default_rng(0).normal(size=3072).tolist()
+
+    blob = encode_embedding(vector)
+    assert len(blob) == 3072 * 4
+    assert np.allclose(decode_embedding(blob, 3072), vector, atol=1e-6)
+
+    half = encode_embedding(vector, "float16")
+    assert len(half) == 3072 * 2
+    assert np.allclose(decode_embedding(half, 3072, "float16"), vector, atol=1e-2)
+
+
+def test_blob_vacio_o_truncado_se_ignora():
+    """Un BLOB vacío o con dimensión distinta no produce vector"""
+    assert decode_embedding(None) is None
+    assert decode_embedding(b"") is None
+    assert decode_embedding(encode_embedding([1.0, 2.0]), dim=3) is None
+    assert embedding_columns(None)["embedding_blob"] is None
+
+
+def test_migracion_convierte_json_a_blob(tmp_path):
+    """Las filas con embedding JSON pasan a BLOB y se vacía la columna JSON"""
+    db_path = tmp_path / "legacy.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+
+    conn = sqlite3.connect(db_path)
+    for i in range(5):
+        conn.execute(
+            "INSERT INTO stories (id, title, content, is_seed, created_at, embedding_json) "
+            "VALUES (?, ?, ?, 0, CURRENT_TIMESTAMP, ?)",
+            (f"s{i}", f"s{i}", "texto", json.dumps([float(i), 1.0, 0.5])),
+        )
+    conn.execute(
+        "INSERT INTO stories (id, title, content, is_seed, created_at, embedding_json) "
+        "VALUES ('roto', 'roto', 'texto', 0, CURRENT_TIMESTAMP, 'no-json')"
+    )
+    conn.commit()
+
+    blob_migration = [m for m in MIGRATIONS if m.name == "embeddings_json_to_blob"]
+    assert run_migrations(engine, blob_migration, batch_size=2) == [(6, "embeddings_json_to_blob")]
+
+    rows = dict(
+        (row[0], row[1:])
+        for row in conn.execute("SELECT id, embedding_blob, embedding_dim, embedding_dtype, embedding_json FROM stories")
+    )
+    conn.close()
+
+    blob, dim, dtype, legacy = rows["s3"]
+    assert dim == 3 and dtype == "float32" and legacy is None
+    assert decode_embedding(blob, dim, dtype).tolist() == [3.0, 1.0, 0.5]
+    assert rows["roto"] == (None, None, None, None)
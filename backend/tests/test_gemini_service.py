@@ -0,0 +1,195 @@
+"""
+Tests del servicio Gemini con un cliente falso (sin red): concurrencia y cache de contexto.
+Ejecutar desde backend: pytest tests/test_gemini_service.py
+"""
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from services.gemini_service import GeminiService
+
+
+class FakeAsyncModels:
+    """Imita client.aio.models registrando cuántas llamadas hay en vuelo."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _call(self, result):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return result
+
+    async def generate_content(self, model, contents):
+        return await self._call(SimpleNamespace(text='{"title": "T", "content": "C"}'))
+
+    async def embed_content(self, model, contents):
+        return await self._call(SimpleNamespace(embeddings=[SimpleNamespace(values=[0.1, 0.2])]))
+
+
+def _service(max_concurrency):
+    service = GeminiService(max_concurrency=max_concurrency)
+    service._configured = True
+    service.client = SimpleNamespace(aio=SimpleNamespace(models=FakeAsyncModels()))
+    return service
+
+
+def test_limite_de_concurrencia():
+    """Nunca hay más llamadas en vuelo que el límite configurado"""
+    service = _service(max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(
+            *[service.generate_story("prompt") for _ in range(5)],
+            *[service.generate_embedding("tema") for _ in range(3)],
+        )
+
+    results = asyncio.run(run())
+    assert results[0] == {"title": "T", "content": "C"}
+    assert results[-1] == [0.1, 0.2]
+    assert service.client.aio.models.max_in_flight == 2
+
+
+def test_event_loop_sigue_respondiendo():
+    """Mientras Gemini responde, otras corrutinas siguen ejecutándose"""
+    service = _service(max_concurrency=1)
+    ticks = []
+
+    async def heartbeat():
+        for _ in range(3):
+            ticks.append(asyncio.get_running_loop().time())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(service.generate_story("prompt"), heartbeat())
+
+    asyncio.run(run())
+    assert len(ticks) == 3
+
+
+class FakeCachingClient:
+    """Cliente falso con caches.create y usage_metadata como el de Gemini."""
+
+    def __init__(self, fail_create=False, fail_cached_calls=0):
+        self.fail_create = fail_create
+        self.fail_cached_calls = fail_cached_calls
+        self.created = []
+        self.sent = []
+        self.aio = SimpleNamespace(
+            caches=SimpleNamespace(create=self._create),
+            models=SimpleNamespace(generate_content=self._generate_content),
+        )
+
+    async def _create(self, model, contents, config):
+        if self.fail_create:
+            raise RuntimeError("Cached content is too small")
+        self.created.append(contents)
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    async def _generate_content(self, model, contents, config=None):
+        cached = config.cached_content if config else None
+        if cached and self.fail_cached_calls:
+            self.fail_cached_calls -= 1
+            raise RuntimeError("CachedContent not found")
+        self.sent.append((contents, cached))
+        cached_tokens = 100 if cached else 0
+        usage = SimpleNamespace(prompt_token_count=cached_tokens + 20,
+                                cached_content_token_count=cached_tokens or None,
+                                candidates_token_count=50)
+        return SimpleNamespace(text='{"title": "T", "content": "C"}', usage_metadata=usage)
+
+
+def _caching_service(client):
+    service = GeminiService(max_concurrency=2, context_cache=True, context_cache_ttl=3600)
+    service._configured = True
+    service.client = client
+    return service
+
+
+def test_cache_de_contexto_se_crea_una_vez_y_solo_se_envia_el_resto():
+    """El prefijo se cachea una vez; después solo viaja la parte variable del prompt"""
+    client = FakeCachingClient()
+    service = _caching_service(client)
+    usages = [{}, {}]
+
+    async def run():
+        for usage in usages:
+            await service.generate_story("PREFIJO" + "resto", cache_prefix="PREFIJO", usage=usage)
+
+    asyncio.run(run())
+    assert client.created == ["PREFIJO"]
+    assert client.sent == [("resto", "cachedContents/1")] * 2
+    assert usages[0] == {"context_cache": "hit", "prompt_tokens": 120, "cached_tokens": 100,
+                         "uncached_tokens": 20, "output_tokens": 50}
+
+
+def test_cache_de_contexto_rechazada_envia_el_prompt_completo():
+    """Si la API no admite la cache se envía el prompt completo y no se reintenta enseguida"""
+    client = FakeCachingClient(fail_create=True)
+    service = _caching_service(client)
+    usage = {}
+
+    async def run():
+        await service.generate_story("PREFIJOresto", cache_prefix="PREFIJO", usage=usage)
+        return await service.generate_story("PREFIJOresto", cache_prefix="PREFIJO")
+
+    assert asyncio.run(run()) == {"title": "T", "content": "C"}
+    assert client.sent == [("PREFIJOresto", None)] * 2
+    assert usage["context_cache"] == "miss" and usage["cached_tokens"] == 0
+
+
+def test_handle_caducado_reintenta_sin_cache():
+    """Si Gemini ya no reconoce el handle se reintenta sin cache y se recrea en la siguiente"""
+    client = FakeCachingClient(fail_cached_calls=1)
+    service = _caching_service(client)
+
+    async def run():
+        first = await service.generate_story("PREFIJOresto", cache_prefix="PREFIJO")
+        await service.generate_story("PREFIJOresto", cache_prefix="PREFIJO")
+        return first
+
+    assert asyncio.run(run()) == {"title": "T", "content": "C"}
+    assert client.sent == [("PREFIJOresto", None), ("resto", "cachedContents/2")]
+
+
+def test_streaming_no_bloquea_el_event_loop():
+    """El stream síncrono del SDK se consume en un hilo: el event loop sigue atendiendo"""
+    import time
+
+    def slow_stream(model, contents):
+        for text in ("{", '"title": "T"', "}"):
+            time.sleep(0.05)  # Lectura bloqueante del cuerpo SSE
+            yield SimpleNamespace(text=text, usage_metadata=None)
+
+    service = GeminiService(max_concurrency=1, context_cache=False)
+    service._configured = True
+    service.client = SimpleNamespace(models=SimpleNamespace(generate_content_stream=slow_stream))
+    ticks = []
+
+    async def consume():
+        return [chunk async for chunk in service.generate_story_stream("prompt")]
+
+    async def heartbeat():
+        while True:
+            ticks.append(asyncio.get_running_loop().time())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        beat = asyncio.create_task(heartbeat())
+        chunks = await consume()
+        beat.cancel()
+        return chunks
+
+    assert asyncio.run(run()) == ["{", '"title": "T"', "}"]
+    # ~150 ms de stream: con el loop bloqueado apenas habría latidos
+    assert len(ticks) >= 8
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.04
@@ -0,0 +1,99 @@
+"""
+Tests de la orquestación de /stories/generate con Gemini simulado (sin red).
+Ejecutar desde backend: pytest tests/test_generate_story_timing.py
+"""
+import sys
+import os
+import asyncio
+import threading
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from fastapi import Response
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from models.database_sqlite import Base, Story
+from models.schemas import StoryGenerateInput
+import routers.stories as stories_router
+import services.rag_service as rag_module
+import services.jobs as jobs_module
+from services.job_queue import JobQueue
+from services.learning_service import learning_service
+
+DELAY = 0.2
+
+
+class FakeGemini:
+    """Cada llamada tarda DELAY segundos sin bloquear el event loop."""
+
+    def is_configured(self):
+        return True
+
+    async def generate_story(self, prompt, **kwargs):
+        await asyncio.sleep(DELAY)
+        return {"title": "El faro", "content": "Había una vez un faro."}
+
+    async def generate_embeddings(self, texts):
+        await asyncio.sleep(DELAY)
+        return [[0.1, 0.2, 0.3] for _ in texts]
+
+    async def generate_illustration_template(self, content, title):
+        await asyncio.sleep(DELAY)
+        return {"cuento_metadata": {"titulo": title}}
+
+
+def test_enriquecimiento_en_paralelo_y_server_timing(monkeypatch):
+    """Embedding y plantilla se solapan y los tiempos se exponen en Server-Timing"""
+    # Una sola conexión compartida: las llamadas síncronas se hacen desde hilos
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    db = session_factory()
+
+    service = rag_module.RAGService(index_path=None)
+
+    async def fake_theme_embedding(theme):
+        await asyncio.sleep(DELAY)
+        return [1.0, 0.0, 0.0]
+
+    service.get_theme_embedding = fake_theme_embedding
+    monkeypatch.setattr(rag_module, "rag_service", service)
+    monkeypatch.setattr(stories_router, "gemini_service", FakeGemini())
+    sync_threads = []
+
+    def active_lessons():
+        sync_threads.append(threading.get_ident())
+        return [{"lesson_id": 1}]
+
+    def increment(lesson_ids):
+        sync_threads.append(threading.get_ident())
+        return True
+
+    monkeypatch.setattr(learning_service, "get_active_lessons", active_lessons)
+    monkeypatch.setattr(learning_service, "increment_lesson_application", increment)
+    monkeypatch.setattr(jobs_module, "job_queue", JobQueue(session_factory))
+
+    response = Response()
+    result = asyncio.run(stories_router.generate_story(
+        StoryGenerateInput(theme="el mar", character_names=["Luna"]),
+        response,
+        db,
+    ))
+
+    assert result.title == "El faro"
+    assert db.query(Story).first().embedding_dim == 3
+    assert str(result.id) in service._index
+    assert jobs_module.job_queue.get(result.critique_job_id)["kind"] == "critique"
+    # Lecciones (ruta y prompt) y contador: E/S síncrona a la BD fuera del event loop
+    assert len(sync_threads) == 3 and threading.get_ident() not in sync_threads
+
+    timings = dict(
+        (part.split(";dur=")[0].strip(), float(part.split(";dur=")[1]))
+        for part in response.headers["Server-Timing"].split(",")
+    )
+    assert {"theme_embedding", "rag", "prompt", "story", "embedding", "illustration", "enrichment", "total"} <= set(timings)
+    # En serie serían 2 * DELAY; en paralelo, poco más de uno
+    assert timings["enrichment"] < 1.5 * DELAY * 1000
@@ -0,0 +1,153 @@
+"""
+Tests de la cola persistente de jobs y del worker.
+Ejecutar desde backend: pytest tests/test_job_queue.py
+"""
+import sys
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, Job
+from services.job_queue import JobQueue, JobWorker
+
+
+def _queue(tmp_path, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return JobQueue(sessionmaker(bind=engine), **kwargs)
+
+
+def test_dedupe_y_claim_exclusivo(tmp_path):
+    """Una dedupe_key activa no duplica jobs y cada job lo reclama un solo worker"""
+    queue = _queue(tmp_path)
+    first = queue.enqueue("critique", {"story_id": "s1"}, dedupe_key="critique:s1")
+    assert queue.enqueue("critique", {"story_id": "s1"}, dedupe_key="critique:s1") == first
+
+    job = queue.claim("worker-a")
+    assert job["id"] == first and job["attempts"] == 1
+    assert queue.claim("worker-b") is None
+    assert not queue.complete(first, "worker-b")
+    assert queue.complete(first, "worker-a", {"ok": True})
+    assert queue.get(first)["status"] == "succeeded"
+
+    # Terminado el anterior, la misma clave admite un job nuevo
+    assert queue.enqueue("critique", {"story_id": "s1"}, dedupe_key="critique:s1") != first
+
+
+def test_dedupe_fusiona_el_payload_en_el_job_pendiente(tmp_path):
+    """Un force_refresh que se deduplica sobre un job pendiente no se pierde"""
+    queue = _queue(tmp_path)
+    first = queue.enqueue("critique", {"story_id": "s1"}, dedupe_key="critique:s1")
+    assert queue.enqueue("critique", {"story_id": "s1", "force_refresh": True}, dedupe_key="critique:s1") == first
+    assert queue.enqueue("critique", {"story_id": "s1"}, dedupe_key="critique:s1") == first
+    assert queue.get(first)["payload"] == {"story_id": "s1", "force_refresh": True}
+
+    # Ya reclamado, el payload del job en curso no cambia
+    queue.claim("worker-a")
+    queue.enqueue("critique", {"story_id": "s1", "extra": 1}, dedupe_key="critique:s1")
+    assert "extra" not in queue.get(first)["payload"]
+
+
+def test_enqueue_reintenta_si_la_clave_en_conflicto_ya_no_existe(tmp_path):
+    """Tras un IntegrityError sin job activo que reutilizar, se reintenta el INSERT"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    conflicts = []
+
+    def flaky_factory():
+        db = factory()
+        commit = db.commit
+
+        def conflicting_commit():
+            if not conflicts:
+                # Otro proceso insertó la clave y la liberó antes de la relectura
+                conflicts.append(True)
+                raise IntegrityError("INSERT INTO jobs", {}, Exception("UNIQUE constraint failed"))
+            commit()
+
+        db.commit = conflicting_commit
+        return db
+
+    queue = JobQueue(flaky_factory)
+    job_id = queue.enqueue("critique", {"story_id": "s1"}, dedupe_key="critique:s1")
+    assert conflicts and queue.get(job_id)["status"] == "pending"
+
+
+def test_lease_caducado_se_retoma(tmp_path):
+    """Si un worker muere sin heartbeat, otro worker retoma el job"""
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue("critique", {})
+    assert queue.claim("worker-a", lease_seconds=60)["id"] == job_id
+    assert queue.heartbeat(job_id, "worker-a", lease_seconds=60)
+
+    db = queue._session_factory()
+    db.query(Job).update({"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    db.close()
+
+    retaken = queue.claim("worker-b")
+    assert retaken["id"] == job_id and retaken["attempts"] == 2
+    assert not queue.heartbeat(job_id, "worker-a")
+
+
+def test_backoff_exponencial_y_fallo_definitivo(tmp_path):
+    """Los fallos se reintentan con retraso creciente hasta agotar los intentos"""
+    queue = _queue(tmp_path, backoff_base=10, backoff_max=1000)
+    assert 8 <= queue.backoff_seconds(1) <= 12
+    assert 32 <= queue.backoff_seconds(3) <= 48
+
+    job_id = queue.enqueue("critique", {}, max_attempts=2)
+    job = queue.claim("w")
+    queue.fail(job_id, "w", "boom", job["attempts"], job["max_attempts"])
+    retry = queue.get(job_id)
+    assert retry["status"] == "pending" and retry["last_error"] == "boom"
+    assert retry["run_after"] > datetime.utcnow() + timedelta(seconds=5)
+    assert queue.claim("w") is None  # Aún no toca
+
+    db = queue._session_factory()
+    db.query(Job).update({"run_after": datetime.utcnow()})
+    db.commit()
+    db.close()
+    job = queue.claim("w")
+    queue.fail(job_id, "w", "boom otra vez", job["attempts"], job["max_attempts"])
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_worker_respeta_concurrencia_y_reintenta(tmp_path):
+    """El worker no supera su concurrencia y un handler que falla se reintenta"""
+    queue = _queue(tmp_path, backoff_base=0)
+    in_flight = {"now": 0, "max": 0}
+    calls = {"flaky": 0}
+
+    async def slow(payload):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.02)
+        in_flight["now"] -= 1
+        return {"n": payload["n"]}
+
+    async def flaky(payload):
+        calls["flaky"] += 1
+        if calls["flaky"] < 3:
+            raise RuntimeError("Gemini no disponible")
+        return {"ok": True}
+
+    ids = [queue.enqueue("slow", {"n": i}) for i in range(6)]
+    flaky_id = queue.enqueue("flaky", {})
+
+    worker = JobWorker(queue, {"slow": slow, "flaky": flaky}, concurrency=2, poll_interval=0)
+    asyncio.run(worker.drain())
+
+    assert in_flight["max"] == 2
+    assert all(queue.get(job_id)["status"] == "succeeded" for job_id in ids)
+    flaky_job = queue.get(flaky_id)
+    assert flaky_job["status"] == "succeeded" and flaky_job["attempts"] == 3
+    assert queue.stats()["slow"] == {"succeeded": 6}
@@ -0,0 +1,152 @@
+"""
+Tests del almacén de lecciones y perfil de estilo en la BD.
+Ejecutar desde backend: pytest tests/test_learning_service.py
+"""
+import sys
+import os
+import json
+import threading
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, StyleProfileVersion
+from services.learning_service import LearningService
+
+SYNTHESIS = {
+    "lessons_learned": [
+        {"insight": "Ritmo más pausado", "category": "pacing"},
+        {"insight": "Más diálogo", "category": "dialogue"},
+    ],
+    "style_adjustments": {"suggested_focus": "ritmo"},
+}
+
+
+def _setup(tmp_path, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'learning.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    kwargs.setdefault("reload_check_interval", 0)
+    return engine, factory, LearningService(factory, **kwargs)
+
+
+def _write_json(tmp_path):
+    history = [{
+        "lesson_id": 7, "insight": "Finales abiertos", "category": "narrative_structure",
+        "applied_count": 3, "status": "active", "origin_critique_ids": ["c1"],
+    }]
+    (tmp_path / "history.json").write_text(json.dumps(history), encoding="utf-8")
+    (tmp_path / "profile.json").write_text(json.dumps({"evolution_metrics": {}}), encoding="utf-8")
+    return tmp_path / "history.json", tmp_path / "profile.json"
+
+
+def test_importacion_unica_e_idempotente(tmp_path):
+    """Los JSON se importan una vez y repetir con force no duplica nada"""
+    _, _, service = _setup(tmp_path)
+    history_file, profile_file = _write_json(tmp_path)
+
+    result = service.import_legacy_json(history_file, profile_file)
+    assert result == {"skipped": False, "lessons": 1, "profile": True}
+    assert service.import_legacy_json(history_file, profile_file)["skipped"]
+    assert service.import_legacy_json(history_file, profile_file, force=True)["lessons"] == 0
+
+    lesson = service.load_learning_history()[0]
+    assert lesson["lesson_id"] == 7 and lesson["applied_count"] == 3
+    assert service.load_style_profile() == {"evolution_metrics": {}}
+
+
+def test_lecciones_indices_y_versiones_de_perfil(tmp_path):
+    """Las lecciones nuevas siguen la numeración y cada síntesis crea una versión del perfil"""
+    _, factory, service = _setup(tmp_path, max_profile_versions=2)
+    service.import_legacy_json(*_write_json(tmp_path))
+
+    assert service.add_lessons_to_history(SYNTHESIS, ["c2", "c3"])
+    assert [l["lesson_id"] for l in service.get_active_lessons()] == [7, 8, 9]
+    assert [l["insight"] for l in service.get_active_lessons("dialogue")] == ["Más diálogo"]
+    assert service.get_lessons(status="archived") == []
+
+    assert service.update_style_profile(SYNTHESIS)
+    assert service.update_style_profile(SYNTHESIS)
+    profile = service.load_style_profile()
+    assert profile["active_learning_focus"] == ["ritmo"]
+    assert profile["evolution_metrics"]["total_lessons_learned"] == 3
+
+    db = factory()
+    assert db.query(StyleProfileVersion).count() == 2  # Se podan las versiones antiguas
+    db.close()
+
+    stats = service.get_synthesis_statistics()
+    assert stats["lessons_by_category"] == {"narrative_structure": 1, "pacing": 1, "dialogue": 1}
+
+
+def test_contador_con_un_solo_update_y_sin_perdidas(tmp_path):
+    """Los incrementos concurrentes no se pierden y cada uno es un único UPDATE"""
+    engine, _, service = _setup(tmp_path)
+    service.add_lessons_to_history(SYNTHESIS, ["c1"])
+
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    assert service.increment_lesson_application([1, 2])
+    assert [s.split()[0] for s in statements] == ["UPDATE"]
+    assert "times_applied + ?" in statements[0]
+
+    other = LearningService(service._session_factory, reload_check_interval=0)
+    threads = [threading.Thread(target=s.increment_lesson_application, args=([1],))
+               for s in (service, other) * 10]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counts = {l["lesson_id"]: l["applied_count"] for l in other.load_learning_history()}
+    assert counts == {1: 21, 2: 1}
+
+
+def test_contador_no_invalida_la_cache_de_lecciones(tmp_path):
+    """Aplicar lecciones no cambia el token de recarga: get_active_lessons no relee la tabla"""
+    engine, _, service = _setup(tmp_path)
+    service.add_lessons_to_history(SYNTHESIS, ["c1"])
+    service.get_active_lessons()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    assert service.increment_lesson_application([1])
+    lessons = service.get_active_lessons()
+
+    assert not [s for s in statements if "ORDER BY lessons.lesson_number" in s]
+    assert {l["lesson_id"]: l["applied_count"] for l in lessons} == {1: 1, 2: 0}
+
+
+def test_rutas_de_aprendizaje_leen_fuera_del_event_loop(tmp_path, monkeypatch):
+    """Las rutas async de /learning consultan lecciones y perfil desde un hilo"""
+    import asyncio
+    from routers import learning as learning_router
+
+    _, _, service = _setup(tmp_path)
+    service.add_lessons_to_history(SYNTHESIS, ["c1"])
+    threads = []
+
+    def tracked(method):
+        def wrapper(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return method(*args, **kwargs)
+        return wrapper
+
+    for name in ("get_lessons", "get_synthesis_statistics", "load_learning_history", "load_style_profile"):
+        monkeypatch.setattr(service, name, tracked(getattr(service, name)))
+    monkeypatch.setattr(learning_router, "learning_service", service)
+
+    async def call_routes():
+        lessons = await learning_router.list_lessons(category=None, status_filter="active")
+        history = await learning_router.get_learning_history()
+        await learning_router.get_style_profile()
+        return lessons, history, threading.get_ident()
+
+    lessons, history, loop_thread = asyncio.run(call_routes())
+    assert lessons["total"] == 2 and history["total_lessons"] == 2
+    assert len(threads) == 4 and loop_thread not in threads
@@ -0,0 +1,79 @@
+"""
+Tests de las migraciones versionadas del esquema (tabla schema_version).
+Ejecutar desde backend: pytest tests/test_migrations.py
+"""
+import sys
+import os
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import create_engine, inspect, text
+from models.database_sqlite import Base
+from models.migrations import MIGRATIONS, Migration, current_version, pending_migrations, run_migrations
+
+
+def _legacy_engine(tmp_path):
+    """BD con el esquema de las primeras versiones (sin columnas ni índices nuevos)."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE stories (id VARCHAR(36) PRIMARY KEY, title VARCHAR(255), content TEXT NOT NULL, "
+            "version INTEGER, is_seed BOOLEAN, embedding_json JSON, illustration_template JSON, "
+            "created_at DATETIME NOT NULL)"
+        ))
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR, hashed_password VARCHAR)"))
+        conn.execute(text("CREATE TABLE lessons (id VARCHAR(36) PRIMARY KEY, lesson_text TEXT)"))
+        conn.execute(text(
+            "INSERT INTO stories (id, title, content, created_at, embedding_json) "
+            "VALUES ('a', 'a', 'texto', '2025-01-01 00:00:00', '[1.0, 0.0]')"
+        ))
+    return engine
+
+
+def test_bd_antigua_se_migra_en_orden_y_una_sola_vez(tmp_path):
+    """Las migraciones pendientes se aplican y quedan registradas en schema_version"""
+    engine = _legacy_engine(tmp_path)
+
+    applied = run_migrations(engine)
+    assert [version for version, _ in applied] == [m.version for m in MIGRATIONS]
+    assert current_version(engine) == MIGRATIONS[-1].version
+
+    inspector = inspect(engine)
+    assert "email" in {c["name"] for c in inspector.get_columns("users")}
+    assert "ix_stories_created_at_id" in {i["name"] for i in inspector.get_indexes("stories")}
+    assert not inspector.has_table("lessons")  # Tabla antigua vacía: create_all la recreará
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT embedding_dim, embedding_json FROM stories")).one()
+    assert row == (2, None)
+
+    assert run_migrations(engine) == []
+    Base.metadata.create_all(bind=engine)
+
+
+def test_bd_nueva_se_marca_al_dia_sin_ejecutar_nada(tmp_path):
+    """Sin tabla stories no hay nada que migrar: create_all crea el esquema actual"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'nueva.db'}")
+    assert run_migrations(engine) == []
+    assert pending_migrations(engine) == []
+    assert not inspect(engine).has_table("stories")
+
+
+def test_migracion_fallida_detiene_y_se_reintenta(tmp_path):
+    """Una migración con error no se registra y las siguientes esperan al próximo arranque"""
+    engine = _legacy_engine(tmp_path)
+    calls = []
+
+    def failing(conn):
+        raise RuntimeError("fallo")
+
+    migrations = [
+        Migration(1, "falla", failing),
+        Migration(2, "despues", lambda conn: calls.append(2)),
+    ]
+    assert run_migrations(engine, migrations) == []
+    assert calls == [] and current_version(engine) == 0
+
+    migrations[0] = Migration(1, "falla", lambda conn: None)
+    assert run_migrations(engine, migrations) == [(1, "falla"), (2, "despues")]
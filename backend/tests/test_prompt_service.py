@@ -0,0 +1,69 @@
+"""
+Tests de la plantilla precompilada del prompt de cuentos.
+Ejecutar desde backend: pytest tests/test_prompt_service.py
+"""
+import sys
+import os
+import asyncio
+import json
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+import services.prompt_service as prompt_module
+from models.schemas import StoryPromptInput
+from services.prompt_service import PromptService
+
+INPUTS = StoryPromptInput(personaje="Lira", contexto_opcional="Un día de lluvia", emocion_objetivo="calma")
+EJEMPLOS = [{"rank": 1, "score": 9, "similarity": 0.8, "title": "T", "fragment": "F", "techniques": ["x"]}]
+
+
+def _build(service, **kwargs):
+    return asyncio.run(service.build_story_prompt(INPUTS, apply_lessons=False, **kwargs))
+
+
+def test_plantilla_se_compila_una_vez_y_no_cambia_el_prompt(monkeypatch):
+    """La plantilla se reutiliza entre llamadas y el resultado es el mismo que sin ella"""
+    service = PromptService()
+    compilations = []
+    original = service._compile_template
+    monkeypatch.setattr(service, "_compile_template", lambda guide: compilations.append(1) or original(guide))
+
+    first = _build(service, similar_stories=EJEMPLOS)
+    second = _build(service, similar_stories=EJEMPLOS)
+    assert first == second and len(compilations) == 1
+
+    service._template = None
+    assert _build(service, similar_stories=EJEMPLOS) == first
+    assert "Contexto opcional: Un día de lluvia" in first
+    assert "Título: T" in first
+    assert first.index("Inputs del usuario:") < first.index("Título: T") < first.index("⭐ INSTRUCCIÓN CLAVE:")
+    assert first.endswith("NO incluyas ningún texto o comentario fuera del objeto JSON.\n")
+
+
+def test_refresh_style_guide_recompila_con_nueva_version(tmp_path, monkeypatch):
+    """Cambiar la guía y llamar a refresh_style_guide produce otra versión de plantilla"""
+    guide_path = tmp_path / "style_guide.json"
+    guide_path.write_text(json.dumps({"guia_estilo_cuento": {"coleccion": "Primera"}}), encoding="utf-8")
+    monkeypatch.setattr(prompt_module, "STYLE_GUIDE_PATH", guide_path)
+
+    service = PromptService()
+    assert "Colección: Primera" in _build(service)
+    version = service.template_version
+
+    guide_path.write_text(json.dumps({"guia_estilo_cuento": {"coleccion": "Segunda"}}), encoding="utf-8")
+    assert "Colección: Primera" in _build(service)  # Sigue en cache hasta refrescar
+
+    service.refresh_style_guide()
+    assert "Colección: Segunda" in _build(service)
+    assert service.template_version != version
+
+
+def test_endpoint_prompt_devuelve_texto(monkeypatch):
+    """El endpoint /prompt espera la corrutina y devuelve el prompt como texto"""
+    from routers.stories import generate_story_prompt
+    from services.learning_service import learning_service
+    monkeypatch.setattr(learning_service, "get_active_lessons", lambda: [])
+    response = asyncio.run(generate_story_prompt(INPUTS))
+    assert isinstance(response.prompt, str) and "Personaje principal: Lira" in response.prompt
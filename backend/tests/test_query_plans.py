@@ -0,0 +1,107 @@
+"""
+Tests de los planes de consulta (EXPLAIN QUERY PLAN de SQLite) de las
+consultas frecuentes: ninguna debe recorrer una tabla entera ni ordenar en
+un B-tree temporal. Las consultas se capturan ejecutando el código real.
+Ejecutar desde backend: pytest tests/test_query_plans.py
+"""
+import sys
+import os
+import re
+from datetime import datetime, timedelta
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+import pytest
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, Critique, Story, delete_expired_tokens
+from routers.stories import _encode_cursor, get_stories, get_story_critiques
+from services.job_queue import JobQueue
+from services.rag_service import RAGService
+from services.synthesis_scheduler import SynthesisScheduler
+
+TABLES = {table.name for table in Base.metadata.sorted_tables}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def _captured(engine, run):
+    """Ejecuta run(session) y retorna las consultas (sql, parámetros) que lanzó."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "DELETE", "UPDATE")):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    db = sessionmaker(bind=engine)()
+    try:
+        run(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+        db.close()
+    assert statements
+    return statements
+
+
+def _assert_indexed(engine, statements):
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            plan = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+            for step in plan:
+                scanned = re.match(r"SCAN (\w+)$", step)
+                assert not (scanned and scanned.group(1) in TABLES), f"Recorrido completo: {step}\n{statement}"
+                assert "TEMP B-TREE" not in step, f"Ordenación sin índice: {step}\n{statement}"
+
+
+def test_criticas_de_un_cuento_y_ultima_por_cuento(engine):
+    """GET /stories/{id}/critiques y el pre-filtrado por score de RAG usan (story_id, timestamp)"""
+    db = sessionmaker(bind=engine)()
+    db.add(Story(id="x", title="x", content="texto"))
+    db.commit()
+    db.close()
+    service = RAGService(index_path=None)
+
+    _assert_indexed(engine, _captured(engine, lambda db: get_story_critiques("x", db)))
+    _assert_indexed(engine, _captured(engine, lambda db: service.get_latest_critique_scores(db, story_ids=["a", "b"])))
+    _assert_indexed(engine, _captured(engine, lambda db: service.get_latest_critique_scores(db, min_score=7)))
+
+
+def test_ultimas_criticas_y_marca_de_agua_de_sintesis(engine):
+    """Síntesis y estadísticas ordenan por timestamp; la marca de agua busca por (timestamp, id)"""
+    factory = sessionmaker(bind=engine)
+    scheduler = SynthesisScheduler(JobQueue(factory), factory, settle_seconds=0)
+    db = factory()
+    scheduler._save_state(db, {**scheduler._state(db), "last_timestamp": datetime.utcnow().isoformat(), "last_id": "a"})
+    db.close()
+
+    _assert_indexed(engine, _captured(engine, lambda db: db.scalars(
+        select(Critique).order_by(Critique.timestamp.desc()).limit(5)
+    ).all()))
+    _assert_indexed(engine, _captured(engine, lambda db: scheduler.next_batch()))
+    _assert_indexed(engine, _captured(engine, lambda db: scheduler.pending_count()))
+
+
+def test_biblioteca_paginada_con_y_sin_filtro_seed(engine):
+    """GET /api/stories recorre (created_at, id) o (is_seed, created_at, id) en orden"""
+    class Row:
+        created_at, id = datetime.utcnow() - timedelta(days=1), "z"
+
+    cursor = _encode_cursor(Row)
+    for is_seed in (None, True):
+        _assert_indexed(engine, _captured(engine, lambda db: get_stories(
+            is_seed=is_seed, limit=20, cursor=cursor, with_counts=is_seed is not None, db_session=db
+        )))
+
+
+def test_borrado_de_tokens_caducados(engine):
+    """delete_expired_tokens busca por expires_at"""
+    _assert_indexed(engine, _captured(engine, delete_expired_tokens))
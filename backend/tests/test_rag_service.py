@@ -0,0 +1,266 @@
+"""
+Tests del servicio RAG contra una base de datos SQLite en memoria.
+Ejecutar desde backend: pytest tests/test_rag_service.py
+"""
+import sys
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, Story, Critique, create_async_db_engine
+from models.embeddings import embedding_columns
+import services.rag_service as rag_module
+from services.rag_service import RAGService
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def _add_story(db, story_id, vector, scores):
+    db.add(Story(id=story_id, title=story_id, content=f"Contenido de {story_id}", **embedding_columns(vector)))
+    base = datetime(2026, 1, 1)
+    for offset, score in enumerate(scores):
+        db.add(Critique(
+            story_id=story_id,
+            critique_text="{}",
+            score=score,
+            timestamp=base + timedelta(minutes=offset),
+        ))
+    db.commit()
+
+
+def _service_with_theme(vector):
+    service = RAGService(index_path=None)
+
+    async def fake_theme_embedding(theme):
+        return vector
+
+    service.get_theme_embedding = fake_theme_embedding
+    return service
+
+
+def test_latest_critique_scores_usa_la_ultima_critica():
+    """Solo cuenta la crítica más reciente de cada cuento"""
+    db = _session()
+    _add_story(db, "a", [1, 0], [9, 4])   # última: 4
+    _add_story(db, "b", [0, 1], [3, 8])   # última: 8
+    _add_story(db, "c", [1, 1], [])
+
+    service = RAGService(index_path=None)
+    latest = service.get_latest_critique_scores(db, min_score=7)
+    assert set(latest) == {"b"}
+    assert latest["b"]["score"] == 8
+
+    all_latest = service.get_latest_critique_scores(db, story_ids=["a", "c"])
+    assert set(all_latest) == {"a"}
+    assert all_latest["a"]["score"] == 4
+
+
+def test_search_filtra_por_score_antes_de_la_similitud():
+    """Un cuento muy similar pero con score bajo no aparece en los resultados"""
+    db = _session()
+    _add_story(db, "parecido", [1, 0], [5])
+    _add_story(db, "bueno", [0.8, 0.6], [9])
+    _add_story(db, "lejano", [0, 1], [10])
+
+    service = _service_with_theme([1, 0])
+    service.build_index(db)
+    results = asyncio.run(service.search_similar_stories(
+        db, "tema", top_k=2, min_similarity=0.5, min_score=7
+    ))
+    assert [r["story_id"] for r in results] == ["bueno"]
+    assert results[0]["score"] == 9
+
+
+def test_search_sin_score_minimo_incluye_cuentos_sin_critica():
+    """Con min_score=0 los cuentos sin crítica participan con score 0"""
+    db = _session()
+    _add_story(db, "sin_critica", [1, 0], [])
+    _add_story(db, "criticado", [0.9, 0.1], [6])
+
+    service = _service_with_theme([1, 0])
+    service.build_index(db)
+    results = asyncio.run(service.search_similar_stories(
+        db, "tema", top_k=2, min_similarity=0.0, min_score=0
+    ))
+    assert [r["story_id"] for r in results] == ["sin_critica", "criticado"]
+    assert [r["score"] for r in results] == [0.0, 6]
+
+
+def test_indice_ivf_persistido_y_reconciliado(tmp_path):
+    """Por encima del umbral se usa IVF-Flat, se persiste y se reconcilia al recargar"""
+    db = _session()
+    for i in range(12):
+        _add_story(db, f"s{i}", [1.0, i / 10.0, (i % 3) / 5.0], [8])
+    index_path = tmp_path / "cuentacuentos.vectors.npz"
+
+    service = RAGService(index_path=str(index_path), ann_min_stories=10)
+    service.build_index(db)
+    assert service.index_stats()["type"] == "ivf_flat"
+    assert index_path.exists()
+
+    # Cambios hechos con el proceso parado: un cuento nuevo y uno borrado
+    _add_story(db, "nuevo", [0.0, 1.0, 0.0], [9])
+    db.query(Story).filter(Story.id == "s0").delete()
+    db.commit()
+
+    restarted = RAGService(index_path=str(index_path), ann_min_stories=10)
+    restarted.build_index(db)
+    assert "nuevo" in restarted._index
+    assert "s0" not in restarted._index
+    assert len(restarted._index) == 12
+
+
+def test_sync_recoge_embeddings_escritos_despues_por_otro_proceso():
+    """Un embedding rellenado más tarde (worker) entra al índice aunque el cuento sea antiguo"""
+    db = _session()
+    db.add(Story(id="antiguo", title="antiguo", content="...", created_at=datetime(2025, 1, 1)))
+    db.commit()
+    _add_story(db, "nuevo", [1, 0], [8])
+
+    service = RAGService(index_path=None)
+    service.build_index(db)
+    assert "antiguo" not in service._index
+
+    # El worker de jobs escribe el embedding del cuento antiguo
+    story = db.query(Story).filter(Story.id == "antiguo").one()
+    for column, value in embedding_columns([0, 1]).items():
+        setattr(story, column, value)
+    db.commit()
+
+    service.sync_index(db)
+    assert "antiguo" in service._index
+
+
+def test_sync_reemplaza_el_vector_de_un_cuento_re_embebido(tmp_path):
+    """Un embedding reescrito sustituye al indexado, también tras recargar el índice de disco"""
+    db = _session()
+    _add_story(db, "a", [1, 0], [8])
+    index_path = tmp_path / "cuentacuentos.vectors.npz"
+    service = RAGService(index_path=str(index_path))
+    service.build_index(db)
+
+    story = db.query(Story).filter(Story.id == "a").one()
+    for column, value in embedding_columns([0, 1]).items():
+        setattr(story, column, value)
+    db.commit()
+
+    service.sync_index(db)
+    assert list(service._index.vector("a")) == [0, 1]
+
+    # Con el proceso parado el índice guardado se queda con el vector antiguo
+    os.utime(index_path, (0, 0))
+    restarted = RAGService(index_path=str(index_path))
+    restarted.build_index(db)
+    assert list(restarted._index.vector("a")) == [0, 1]
+
+
+def test_reentreno_en_segundo_plano_no_pierde_cambios(monkeypatch):
+    """Lo añadido, re-embebido o borrado mientras se entrena el IVF llega al índice nuevo"""
+    db = _session()
+    for i in range(12):
+        _add_story(db, f"s{i}", [1.0, i / 10.0, (i % 3) / 5.0], [8])
+    service = RAGService(index_path=None, ann_min_stories=100)
+    service.build_index(db)
+    service._ann_min_stories = 10
+
+    class SlowIVF(rag_module.IVFFlatIndex):
+        def build(self, ids, vectors):
+            super().build(ids, vectors)
+            # Escrituras entre la copia de los vectores y el cambio de índice
+            service.add_to_index("nuevo", [0.0, 1.0, 0.0])
+            service.add_to_index("s1", [0.0, 0.0, 1.0])
+            service._index_remove("s2")
+
+    monkeypatch.setattr(rag_module, "IVFFlatIndex", SlowIVF)
+    service._maybe_upgrade_index()
+    service._rebuild_thread.join()
+
+    assert isinstance(service._index, SlowIVF)
+    assert "nuevo" in service._index and "s2" not in service._index
+    assert list(service._index.vector("s1")) == [0, 0, 1]
+    assert len(service._index) == 12
+
+
+def test_fragmentos_puntuan_por_cuento_y_devuelven_el_mejor_trozo():
+    """Un cuento largo gana por su párrafo más parecido, que se devuelve como fragmento"""
+    from models.database_sqlite import StoryChunk
+    from services.story_chunks import save_story_chunks
+
+    db = _session()
+    _add_story(db, "largo", [0, 1], [9])   # El vector completo no se parece al tema
+    _add_story(db, "corto", [0.6, 0.8], [9])
+    save_story_chunks(db, "largo", [("Inicio en el bosque", [0, 1]), ("Luego, el mar", [1, 0])])
+    db.commit()
+
+    service = _service_with_theme([1, 0])
+    service.build_index(db)
+    results = asyncio.run(service.search_similar_stories(
+        db, "el mar", top_k=2, min_similarity=0.5, min_score=0
+    ))
+    assert [r["story_id"] for r in results] == ["largo", "corto"]
+    assert results[0]["fragment"] == "Luego, el mar"
+    assert results[1]["fragment"] == "Contenido de corto"
+    assert db.query(StoryChunk).count() == 2
+
+
+def test_search_con_asyncsession(tmp_path):
+    """Con una AsyncSession (aiosqlite) la búsqueda da el mismo resultado que con una síncrona"""
+    url = f"sqlite:///{tmp_path / 'rag.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    _add_story(db, "parecido", [1, 0], [5])
+    _add_story(db, "bueno", [0.8, 0.6], [9])
+    db.close()
+
+    service = _service_with_theme([1, 0])
+
+    async def search():
+        async_engine = create_async_db_engine(url)
+        try:
+            async with async_sessionmaker(async_engine)() as session:
+                return await service.search_similar_stories(
+                    session, "tema", top_k=2, min_similarity=0.5, min_score=7
+                )
+        finally:
+            await async_engine.dispose()
+
+    results = asyncio.run(search())
+    assert [r["story_id"] for r in results] == ["bueno"]
+    assert results[0]["score"] == 9
+
+
+def test_rag_usa_el_gemini_service_del_proceso():
+    """Los embeddings de RAG pasan por el mismo límite de concurrencia que el resto de llamadas"""
+    from services.gemini_service import gemini_service
+
+    assert RAGService(index_path=None)._get_gemini_service() is gemini_service
+
+
+def test_session_factory_inyectada_llega_al_cache_de_temas(tmp_path):
+    """El cache persistente de embeddings de temas y build_index usan la BD inyectada"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'rag.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    _add_story(db, "a", [1, 0], [8])
+    db.close()
+
+    service = RAGService(index_path=None, session_factory=factory)
+    service.theme_cache.put("el mar", [0.5, 0.5])
+    service.build_index()
+    assert "a" in service._index
+
+    restarted = RAGService(index_path=None, session_factory=factory)
+    assert list(restarted.theme_cache.get("el mar")) == [0.5, 0.5]  # Leído de la tabla, no de memoria
@@ -0,0 +1,102 @@
+"""
+Tests del cache de respuestas de Gemini (crítica y plantilla de ilustraciones).
+Ejecutar desde backend: pytest tests/test_response_cache.py
+"""
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base
+from services.gemini_service import GeminiService
+from services.response_cache import GeminiResponseCache
+
+
+def _cache(tmp_path, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'responses.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return GeminiResponseCache(sessionmaker(bind=engine), **kwargs)
+
+
+class CountingModels:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content(self, model, contents):
+        self.calls += 1
+        return SimpleNamespace(text=f'{{"evaluation": {{"overall_score": {self.calls}}}}}')
+
+
+def test_critica_cacheada_por_contenido_y_force_refresh(tmp_path):
+    """El mismo cuento no vuelve a llamar a Gemini salvo con force_refresh"""
+    service = GeminiService(max_concurrency=2, response_cache=_cache(tmp_path))
+    service._configured = True
+    models = CountingModels()
+    service.client = SimpleNamespace(aio=SimpleNamespace(models=models))
+
+    async def run():
+        first = await service.generate_critique("Había una vez")
+        again = await service.generate_critique("Había una vez")
+        other = await service.generate_critique("Otro cuento")
+        refreshed = await service.generate_critique("Había una vez", force_refresh=True)
+        after = await service.generate_critique("Había una vez")
+        return first, again, other, refreshed, after
+
+    first, again, other, refreshed, after = asyncio.run(run())
+    assert models.calls == 3
+    assert first == again == {"evaluation": {"overall_score": 1}}
+    assert other["evaluation"]["overall_score"] == 2
+    assert refreshed == after == {"evaluation": {"overall_score": 3}}  # force_refresh sobrescribe la entrada
+    assert service.response_cache.stats()["by_kind"]["critique"]["entries"] == 2
+
+
+def test_expulsion_por_tamano_de_las_menos_usadas(tmp_path):
+    """Al superar max_bytes se borran las entradas usadas hace más tiempo"""
+    cache = _cache(tmp_path, max_bytes=60)
+    keys = [GeminiResponseCache.make_key("critique", "modelo", "1", f"cuento {i}") for i in range(3)]
+    cache.put(keys[0], "critique", "modelo", {"texto": "a" * 10})
+    cache.put(keys[1], "critique", "modelo", {"texto": "b" * 10})
+    assert cache.get(keys[0]) is not None  # keys[0] pasa a ser la más reciente
+    cache.put(keys[2], "critique", "modelo", {"texto": "c" * 10})
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+    assert cache.stats()["bytes"] <= 60 and cache.evictions == 1
+    assert keys[0] != GeminiResponseCache.make_key("critique", "modelo", "2", "cuento 0")
+
+
+def test_cache_se_consulta_fuera_del_event_loop_y_se_administra_en_cache(tmp_path, monkeypatch):
+    """get/put del cache corren en un hilo y GET/DELETE /api/cache/responses lo administran"""
+    import threading
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    import routers.cache as cache_router
+
+    cache = _cache(tmp_path)
+    threads = []
+    for name in ("get", "put"):
+        method = getattr(cache, name)
+        monkeypatch.setattr(cache, name, lambda *args, _m=method: threads.append(threading.get_ident()) or _m(*args))
+    service = GeminiService(max_concurrency=2, response_cache=cache)
+    service._configured = True
+    service.client = SimpleNamespace(aio=SimpleNamespace(models=CountingModels()))
+
+    async def run():
+        await service.generate_critique("Había una vez")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 2 and loop_thread not in threads
+
+    monkeypatch.setattr(cache_router, "gemini_service", service)
+    app = FastAPI()
+    app.include_router(cache_router.router, prefix="/api")
+    client = TestClient(app)
+    assert client.get("/api/cache/responses").json()["enabled"] is True
+    assert client.delete("/api/cache/responses").json() == {"removed": 1}
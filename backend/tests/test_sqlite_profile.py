@@ -0,0 +1,60 @@
+"""
+Tests del perfil de SQLite (PRAGMAs aplicados a cada conexión del pool).
+Ejecutar desde backend: pytest tests/test_sqlite_profile.py
+"""
+import sys
+import os
+import threading
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import text
+from models.database_sqlite import create_db_engine
+
+
+def _pragma(connection, name):
+    return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_perfil_production_activa_wal_en_cada_conexion(tmp_path):
+    """Todas las conexiones del pool salen con WAL, synchronous=NORMAL y busy_timeout"""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'prod.db'}", profile="production")
+    with engine.connect() as first, engine.connect() as second:
+        for connection in (first, second):
+            assert _pragma(connection, "journal_mode") == "wal"
+            assert _pragma(connection, "synchronous") == 1  # NORMAL
+            assert _pragma(connection, "busy_timeout") == 5000
+            assert _pragma(connection, "cache_size") < 0
+
+
+def test_perfil_default_mantiene_rollback_journal(tmp_path):
+    """El perfil default no cambia el modo de journal"""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'default.db'}", profile="default")
+    with engine.connect() as connection:
+        assert _pragma(connection, "journal_mode") == "delete"
+        assert _pragma(connection, "busy_timeout") == 5000
+
+
+def test_en_wal_los_lectores_no_esperan_al_escritor(tmp_path):
+    """Con una transacción de escritura abierta y sin confirmar, otra conexión sigue leyendo"""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'wal.db'}", profile="production")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE t (x INTEGER)"))
+        connection.execute(text("INSERT INTO t VALUES (1)"))
+
+    with engine.connect() as writer:
+        writer.execute(text("BEGIN EXCLUSIVE"))
+        writer.execute(text("INSERT INTO t VALUES (2)"))
+        result = {}
+
+        def read():
+            with engine.connect() as reader:
+                result["count"] = reader.execute(text("SELECT count(*) FROM t")).scalar()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join(timeout=2)
+        assert result == {"count": 1}  # Ve la última versión confirmada sin bloquearse
+        writer.execute(text("ROLLBACK"))
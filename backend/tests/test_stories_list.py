@@ -0,0 +1,119 @@
+"""
+Tests del listado paginado de cuentos (GET /api/stories) y de las consultas
+que no deben leer las columnas pesadas (embeddings, plantilla).
+Ejecutar desde backend: pytest tests/test_stories_list.py
+"""
+import sys
+import os
+import uuid
+from datetime import datetime, timedelta
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, Story, Critique, load_story, story_exists
+from models.embeddings import embedding_columns
+from routers.stories import get_stories, get_story_critiques
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+def _capture_statements(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def _page(db, cursor=None, limit=2, with_counts=False, is_seed=None):
+    return get_stories(is_seed=is_seed, limit=limit, cursor=cursor, with_counts=with_counts, db_session=db)
+
+
+def test_paginacion_keyset_recorre_todos_sin_repetir():
+    """Las páginas siguen el orden (created_at, id) descendente, también con fechas empatadas"""
+    _, db = _session()
+    base = datetime(2026, 1, 1)
+    ids = [str(uuid.uuid4()) for _ in range(5)]
+    for i in range(5):
+        # Dos cuentos por fecha para forzar el desempate por id
+        db.add(Story(id=ids[i], title=f"Cuento {i}", content="x" * 500,
+                     is_seed=(i == 0), created_at=base + timedelta(days=i // 2)))
+    db.add(Critique(story_id=ids[4], critique_text="{}", score=6, timestamp=base))
+    db.add(Critique(story_id=ids[4], critique_text="{}", score=9, timestamp=base + timedelta(hours=1)))
+    db.commit()
+
+    first = _page(db, with_counts=True)
+    assert (first.total, first.generated) == (5, 4)
+    seen, page = [], first
+    while True:
+        seen.extend(str(item.id) for item in page.items)
+        if page.next_cursor is None:
+            break
+        page = _page(db, cursor=page.next_cursor)
+        assert page.total is None
+    expected = sorted(range(5), key=lambda i: (i // 2, ids[i]), reverse=True)
+    assert seen == [ids[i] for i in expected]
+    assert [item.score for item in first.items] == [9, None]
+    assert len(first.items[0].excerpt) == 200
+
+
+def test_listado_no_lee_contenido_completo_ni_embeddings():
+    """La consulta de la lista solo proyecta las columnas ligeras"""
+    engine, db = _session()
+    db.add(Story(id=str(uuid.uuid4()), title="A", content="contenido", **embedding_columns([1.0, 0.0])))
+    db.commit()
+
+    statements = _capture_statements(engine)
+    page = _page(db)
+    assert [item.title for item in page.items] == ["A"]
+    story_selects = [s for s in statements if "FROM stories" in s]
+    assert story_selects
+    for statement in story_selects:
+        assert "embedding" not in statement
+        assert "illustration_template" not in statement
+        assert "stories.content AS" not in statement
+
+
+def test_cursor_invalido_devuelve_400():
+    """Un cursor manipulado no provoca un error 500"""
+    _, db = _session()
+    with pytest.raises(HTTPException) as error:
+        _page(db, cursor="no-es-un-cursor")
+    assert error.value.status_code == 400
+
+
+def test_consultas_de_existencia_y_detalle_no_leen_vectores():
+    """Las columnas pesadas solo se leen cuando se pide su grupo diferido"""
+    engine, db = _session()
+    story_id = str(uuid.uuid4())
+    db.add(Story(id=story_id, title="A", content="contenido",
+                 illustration_template={"scenes": []}, **embedding_columns([1.0, 0.0])))
+    db.add(Critique(story_id=story_id, critique_text="{}", score=8))
+    db.commit()
+    db.expunge_all()
+
+    statements = _capture_statements(engine)
+    assert story_exists(db, story_id)
+    assert not story_exists(db, "no-existe")
+    assert get_story_critiques(story_id, db_session=db)["story_title"] == "A"
+    story = load_story(db, story_id, "illustration")
+    assert story.illustration_template == {"scenes": []}
+    for statement in statements:
+        assert "embedding_blob" not in statement
+        assert "embedding_json" not in statement
+
+    db.expunge_all()
+    statements.clear()
+    story = load_story(db, story_id, "vectors")
+    assert story.embedding_blob is not None
+    assert len(statements) == 1
+    assert "illustration_template" not in statements[0]
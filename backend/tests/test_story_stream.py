@@ -0,0 +1,167 @@
+"""
+Tests de la generación de cuentos en streaming (parser incremental y SSE)
+y del enriquecimiento encolado al crear un cuento.
+Ejecutar desde backend: pytest tests/test_story_stream.py
+"""
+import sys
+import os
+import json
+import asyncio
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, Story, create_async_db_engine
+from models.schemas import StoryCreate
+import routers.stories as stories_router
+import services.rag_service as rag_module
+import services.jobs as jobs_module
+from services.job_queue import JobQueue
+from services.learning_service import learning_service
+from services.story_stream import StoryStreamParser
+
+STORY = {"title": "La **nube** \"Lila\"", "content": "Había una vez\nuna nube 😊 que \\ soñaba."}
+
+
+def _feed_all(parser, text, size):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+def test_parser_reconstruye_titulo_y_contenido_en_cualquier_corte():
+    """Trozos de cualquier tamaño producen el mismo título y contenido"""
+    raw = "```json\n" + json.dumps(STORY) + "\n```"  # ensure_ascii: emoji como par surrogate \\ud83d\\ude0a
+    for size in (1, 2, 3, 7, len(raw)):
+        parser = StoryStreamParser()
+        events = _feed_all(parser, raw, size)
+        titles = [text for kind, text in events if kind == "title"]
+        content = "".join(text for kind, text in events if kind == "content")
+        assert titles == [STORY["title"]]
+        assert content == STORY["content"]
+        assert parser.result() == STORY
+
+
+def test_parser_titulo_despues_del_contenido():
+    """El orden de las claves no importa"""
+    parser = StoryStreamParser()
+    parser.feed('{"content": "Érase una vez", ')
+    assert parser.result() is None
+    events = parser.feed('"title": "El sol"}')
+    assert events == [("title", "El sol")]
+    assert parser.result() == {"title": "El sol", "content": "Érase una vez"}
+
+
+class FakeStreamingGemini:
+    def is_configured(self):
+        return True
+
+    async def generate_story_stream(self, prompt, **kwargs):
+        raw = json.dumps(STORY, ensure_ascii=False)
+        for i in range(0, len(raw), 5):
+            await asyncio.sleep(0)
+            yield raw[i:i + 5]
+
+    def parse_story_json(self, text):
+        return None
+
+    async def generate_embeddings(self, texts):
+        return [[0.5, 0.5] for _ in texts]
+
+    async def generate_illustration_template(self, content, title):
+        return {"cuento_metadata": {"titulo": title}}
+
+    async def generate_critique(self, content, **kwargs):
+        return None
+
+
+def _parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_endpoint_stream_emite_titulo_tokens_y_enriquece(monkeypatch, tmp_path):
+    """El stream emite start/title/token/done, guarda el cuento y encola su enriquecimiento"""
+    # BD en fichero: el worker usa la cola desde hilos y cada uno necesita su conexión
+    engine = create_engine(f"sqlite:///{tmp_path / 'stream.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    async_engine = create_async_db_engine(f"sqlite:///{tmp_path / 'stream.db'}")
+
+    service = rag_module.RAGService(index_path=None)
+
+    async def fake_theme_embedding(theme):
+        return [1.0, 0.0]
+
+    service.get_theme_embedding = fake_theme_embedding
+    monkeypatch.setattr(rag_module, "rag_service", service)
+    fake_gemini = FakeStreamingGemini()
+    monkeypatch.setattr(stories_router, "gemini_service", fake_gemini)
+    monkeypatch.setattr(stories_router, "AsyncSessionLocal", async_sessionmaker(async_engine, expire_on_commit=False))
+    monkeypatch.setattr(jobs_module, "gemini_service", fake_gemini)
+    monkeypatch.setattr(jobs_module, "SessionLocal", session_factory)
+    monkeypatch.setattr(jobs_module, "job_queue", JobQueue(session_factory, backoff_base=0))
+    monkeypatch.setattr(learning_service, "get_active_lessons", lambda: [])
+
+    app = FastAPI()
+    app.include_router(stories_router.router, prefix="/api")
+    client = TestClient(app)
+
+    response = client.post("/api/stories/generate/stream", json={"theme": "las nubes"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = _parse_sse(response.text)
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "start" and kinds[-1] == "done"
+    assert kinds.index("title") < kinds.index("done")
+    assert kinds.count("token") > 1
+    assert dict(events)["title"]["title"] == 'La nube "Lila"'
+    assert "".join(data["text"] for kind, data in events if kind == "token") == STORY["content"]
+
+    done = events[-1][1]
+    db = session_factory()
+    story = db.query(Story).filter(Story.id == done["id"]).one()
+    assert story.content == STORY["content"]
+    assert story.embedding_blob is None
+    assert set(done["jobs"]) == {"embedding", "critique"}
+
+    # El worker de jobs enriquece el cuento
+    asyncio.run(jobs_module.create_worker(poll_interval=0).drain())
+    assert jobs_module.job_queue.get(done["jobs"]["embedding"])["status"] == "succeeded"
+    db.expire_all()
+    story = db.query(Story).filter(Story.id == done["id"]).one()
+    assert story.embedding_dim == 2
+    assert story.illustration_template["cuento_metadata"]["titulo"] == 'La nube "Lila"'
+    assert done["id"] in service._index
+
+
+def test_crear_cuento_encola_embedding_y_critica(monkeypatch, tmp_path):
+    """POST /api/stories encola el embedding (con plantilla) y la crítica del cuento nuevo"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'create.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    queue = JobQueue(sessionmaker(bind=engine))
+    monkeypatch.setattr(jobs_module, "job_queue", queue)
+    async_engine = create_async_db_engine(f"sqlite:///{tmp_path / 'create.db'}")
+
+    async def create():
+        async with async_sessionmaker(async_engine, expire_on_commit=False)() as db:
+            return await stories_router.create_story(StoryCreate(title="El río", content="Había una vez un río."), db)
+
+    result = asyncio.run(create())
+    asyncio.run(async_engine.dispose())
+
+    critique = queue.get(result.critique_job_id)
+    assert critique["kind"] == "critique" and critique["payload"] == {"story_id": str(result.id)}
+    embedding = queue.claim("worker", kinds=["embedding_backfill"])
+    assert embedding["payload"] == {"story_id": str(result.id), "illustration": True}
@@ -0,0 +1,189 @@
+"""
+Tests del planificador de síntesis de lecciones.
+Ejecutar desde backend: pytest tests/test_synthesis_scheduler.py
+"""
+import sys
+import os
+import uuid
+from datetime import datetime, timedelta
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, Critique, Job
+from services.job_queue import JobQueue
+from services.synthesis_scheduler import SynthesisScheduler
+
+
+def _setup(tmp_path, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'synthesis.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    queue = JobQueue(factory)
+    kwargs.setdefault("settle_seconds", 0)
+    return factory, queue, SynthesisScheduler(queue, factory, **kwargs)
+
+
+def _add_critiques(factory, n, start=None):
+    start = start or datetime.utcnow() - timedelta(minutes=10)
+    db = factory()
+    ids = []
+    for i in range(n):
+        critique = Critique(id=str(uuid.uuid4()), story_id="s", critique_text=f"c{i}", score=7,
+                            timestamp=start + timedelta(seconds=len(ids)))
+        db.add(critique)
+        ids.append(critique.id)
+    db.commit()
+    db.close()
+    return ids
+
+
+def test_avisos_se_agrupan_en_un_job(tmp_path):
+    """Varios avisos dentro de la ventana producen un único job diferido"""
+    factory, queue, scheduler = _setup(tmp_path, min_critiques=2, debounce_seconds=60)
+    _add_critiques(factory, 1)
+    assert scheduler.notify() is None  # Por debajo del mínimo
+
+    _add_critiques(factory, 3, start=datetime.utcnow() - timedelta(minutes=5))
+    job_ids = {scheduler.notify() for _ in range(3)}
+    assert len(job_ids) == 1
+    assert queue.claim("w") is None  # Aún dentro de la ventana de agrupación
+    assert queue.stats() == {"lesson_synthesis": {"pending": 1}}
+
+
+def test_solo_una_sintesis_en_curso(tmp_path):
+    """Un aviso durante la ejecución queda pendiente y no se reclama hasta que termina"""
+    factory, queue, scheduler = _setup(tmp_path, min_critiques=1, debounce_seconds=0)
+    _add_critiques(factory, 2)
+    first = scheduler.notify()
+    exclusive = ["lesson_synthesis"]
+    assert queue.claim("w1", exclusive_kinds=exclusive)["id"] == first
+
+    _add_critiques(factory, 1, start=datetime.utcnow() - timedelta(minutes=1))
+    second = scheduler.notify()
+    assert second != first
+    assert queue.claim("w2", exclusive_kinds=exclusive) is None
+
+    queue.complete(first, "w1")
+    assert queue.claim("w2", exclusive_kinds=exclusive)["id"] == second
+
+
+def test_marca_de_agua_solo_criticas_nuevas(tmp_path):
+    """Cada lote contiene solo críticas no sintetizadas, en orden y acotado"""
+    factory, _, scheduler = _setup(tmp_path, min_critiques=1, max_batch=3)
+    old_ids = _add_critiques(factory, 2)
+    scheduler.initialize()
+    assert scheduler.pending_count() == 0  # Las previas cuentan como sintetizadas
+
+    new_ids = _add_critiques(factory, 4, start=datetime.utcnow() - timedelta(minutes=5))
+    batch = scheduler.next_batch()
+    assert [c['id'] for c in batch] == new_ids[:3]
+    scheduler.mark_synthesized(batch)
+
+    batch = scheduler.next_batch()
+    assert [c['id'] for c in batch] == new_ids[3:]
+    scheduler.mark_synthesized(batch)
+    assert scheduler.next_batch() == []
+
+    status = scheduler.status()
+    assert status["runs"] == 2 and status["critiques_synthesized"] == 4
+    assert status["pending_critiques"] == 0
+    assert status["last_id"] == new_ids[-1] and status["last_id"] not in old_ids
+
+
+def test_criticas_recientes_esperan(tmp_path):
+    """Las críticas dentro del margen de asentamiento pasan a la siguiente ronda"""
+    factory, _, scheduler = _setup(tmp_path, settle_seconds=30)
+    _add_critiques(factory, 1)
+    recent = _add_critiques(factory, 1, start=datetime.utcnow())
+    assert recent[0] not in [c['id'] for c in scheduler.next_batch()]
+    assert scheduler.pending_count() == 2
+
+
+def test_sintesis_manual_reutiliza_y_adelanta_el_job_programado(tmp_path):
+    """POST /learning/synthesize usa el job exclusivo: no crea otro y lo ejecuta ya"""
+    factory, queue, scheduler = _setup(tmp_path, min_critiques=1, debounce_seconds=60)
+    _add_critiques(factory, 3)
+    scheduled = scheduler.notify()
+    assert queue.claim("w") is None  # Diferido por la ventana de agrupación
+
+    assert scheduler.request_now() == scheduled
+    assert queue.claim("w", exclusive_kinds=["lesson_synthesis"])["id"] == scheduled
+
+
+def test_endpoint_de_sintesis_pasa_por_el_planificador(tmp_path, monkeypatch):
+    """El endpoint espera al job y responde con su resultado sin leer críticas por su cuenta"""
+    import asyncio
+    from routers import learning as learning_router
+
+    factory, queue, scheduler = _setup(tmp_path, min_critiques=1, debounce_seconds=60)
+    _add_critiques(factory, 3)
+    monkeypatch.setattr(learning_router, "synthesis_scheduler", scheduler)
+    monkeypatch.setattr(learning_router, "job_queue", queue)
+    monkeypatch.setattr(learning_router, "JOBS_POLL_INTERVAL", 0.02)
+    monkeypatch.setattr(learning_router.gemini_service, "is_configured", lambda: True)
+
+    async def worker():
+        while (job := queue.claim("w", exclusive_kinds=["lesson_synthesis"])) is None:
+            await asyncio.sleep(0.01)
+        batch = scheduler.next_batch()
+        scheduler.mark_synthesized(batch)
+        queue.complete(job["id"], "w", {"lessons": 2, "critique_ids": [c["id"] for c in batch]})
+
+    async def run():
+        result, _ = await asyncio.gather(learning_router.synthesize_lessons(), worker())
+        return result
+
+    result = asyncio.run(run())
+    assert result["status"] == "success"
+    assert result["critiques_analyzed"] == 3 and result["lessons_extracted"] == 2
+    assert scheduler.pending_count() == 0
+
+
+def test_handlers_de_critica_y_sintesis_no_bloquean_el_event_loop(tmp_path, monkeypatch):
+    """Con el worker en el proceso de la API, la BD y el planificador se usan desde hilos"""
+    import asyncio
+    import threading
+    import services.jobs as jobs_module
+    from models.database_sqlite import Story
+    from services.learning_service import learning_service
+
+    factory, queue, scheduler = _setup(tmp_path, min_critiques=1, debounce_seconds=0)
+    db = factory()
+    db.add(Story(id="s", title="s", content="Había una vez."))
+    db.commit()
+    db.close()
+    threads = []
+
+    def tracked(fn):
+        def wrapper(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return fn(*args, **kwargs)
+        return wrapper
+
+    class FakeGemini:
+        async def generate_critique(self, content, **kwargs):
+            return {"evaluation": {"overall_score": 8}}
+
+        async def synthesize_lessons(self, critiques):
+            return {"lessons_learned": [{"insight": "Más diálogo", "category": "dialogue"}]}
+
+    for name in ("notify", "next_batch", "mark_synthesized"):
+        monkeypatch.setattr(scheduler, name, tracked(getattr(scheduler, name)))
+    monkeypatch.setattr(jobs_module, "synthesis_scheduler", scheduler)
+    monkeypatch.setattr(jobs_module, "SessionLocal", tracked(factory))
+    monkeypatch.setattr(jobs_module, "gemini_service", FakeGemini())
+    monkeypatch.setattr(learning_service, "add_lessons_to_history", tracked(lambda *args: True))
+    monkeypatch.setattr(learning_service, "update_style_profile", tracked(lambda *args: True))
+
+    async def run():
+        critique = await jobs_module.handle_critique({"story_id": "s"})
+        synthesis = await jobs_module.handle_lesson_synthesis({})
+        return critique, synthesis, threading.get_ident()
+
+    critique, synthesis, loop_thread = asyncio.run(run())
+    assert critique["score"] == 8 and synthesis["lessons"] == 1
+    assert len(threads) >= 7 and loop_thread not in threads
@@ -0,0 +1,138 @@
+"""
+Tests de la búsqueda de texto completo (FTS5) y de la búsqueda híbrida de RAG.
+Ejecutar desde backend: pytest tests/test_text_search.py
+"""
+import sys
+import os
+import asyncio
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models.database_sqlite import Base, Story, Critique
+from models.embeddings import embedding_columns
+from services.rag_service import RAGService
+from services.text_search import build_match_query, lexical_rank, search_stories
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def _add_story(db, story_id, title, content, vector=None, score=None):
+    columns = embedding_columns(vector) if vector is not None else {}
+    db.add(Story(id=story_id, title=title, content=content, **columns))
+    if score is not None:
+        db.add(Critique(story_id=story_id, critique_text="{}", score=score))
+    db.commit()
+
+
+def test_build_match_query_escapa_y_quita_palabras_vacias():
+    """Las palabras van entre comillas (sin sintaxis FTS5 del usuario) y sin stopwords"""
+    assert build_match_query('el dragón "Ñico" AND') == '"dragón" OR "ñico" OR "and"'
+    assert build_match_query("de la", prefix=True) is None
+    assert build_match_query("dragón vol", prefix=True) == '"dragón" OR "vol"*'
+
+
+def test_triggers_mantienen_fts_sincronizado():
+    """Insertar, editar y borrar cuentos actualiza el índice de texto completo"""
+    db = _session()
+    _add_story(db, "a", "El dragón Pipo", "Pipo vivía en una montaña.")
+    _add_story(db, "b", "La tortuga", "Una tortuga muy lenta.")
+    assert [r["id"] for r in search_stories(db, "dragon")] == ["a"]  # Sin tildes también
+
+    story = db.get(Story, "b")
+    story.content = "Una tortuga que soñaba con ser dragón."
+    db.commit()
+    assert {r["id"] for r in search_stories(db, "dragón")} == {"a", "b"}
+    # El título pesa más que el contenido
+    assert search_stories(db, "dragón")[0]["id"] == "a"
+
+    db.delete(db.get(Story, "a"))
+    db.commit()
+    results = search_stories(db, "drag")
+    assert [r["id"] for r in results] == ["b"]
+    assert "«dragón»" in results[0]["snippet"]
+    assert db.execute(text("SELECT count(*) FROM stories_fts")).scalar() == 1
+
+
+def test_lexical_rank_respeta_los_candidatos():
+    """Con allowed_ids solo se devuelven cuentos candidatos"""
+    db = _session()
+    _add_story(db, "a", "Luna", "La luna brillaba.")
+    _add_story(db, "b", "Luna llena", "Otra luna.")
+    assert {story_id for story_id, _ in lexical_rank(db, "luna", 5)} == {"a", "b"}
+    assert [story_id for story_id, _ in lexical_rank(db, "luna", 5, allowed_ids={"a"})] == ["a"]
+    assert lexical_rank(db, "luna", 5, allowed_ids=set()) == []
+
+    # El candidato es el peor de muchos resultados: el filtro va en la consulta, no después del LIMIT
+    for i in range(15):
+        _add_story(db, f"x{i}", "Luna", "Luna luna luna.")
+    _add_story(db, "z", "Otro", "Un cuento muy largo " * 20 + "con una luna.")
+    assert [story_id for story_id, _ in lexical_rank(db, "luna", 1, allowed_ids={"z"})] == ["z"]
+
+
+def test_rag_sin_embedding_usa_solo_busqueda_lexica():
+    """Si el embedding del tema falla, RAG devuelve los cuentos que coinciden por texto"""
+    db = _session()
+    _add_story(db, "pipo", "El dragón Pipo", "Pipo el dragón tenía miedo.", [1, 0], 9)
+    _add_story(db, "otro", "La tortuga", "Una tortuga lenta.", [0, 1], 9)
+
+    service = RAGService(index_path=None)
+
+    async def failing_theme_embedding(theme):
+        return None
+
+    service.get_theme_embedding = failing_theme_embedding
+    service.build_index(db)
+    results = asyncio.run(service.search_similar_stories(db, "Pipo", top_k=2, min_score=7))
+    assert [r["story_id"] for r in results] == ["pipo"]
+    assert results[0]["match"] == "lexical"
+
+
+def test_rrf_sube_coincidencias_exactas_de_nombre():
+    """Un nombre propio que los embeddings no capturan entra en el top por BM25"""
+    db = _session()
+    _add_story(db, "cercano", "Un bosque", "Animales del bosque.", [1, 0], 9)
+    _add_story(db, "medio", "Otro bosque", "Más animales.", [0.9, 0.436], 9)
+    _add_story(db, "pipo", "El dragón Pipo", "Pipo vivía solo.", [0.6, 0.8], 9)
+
+    service = RAGService(index_path=None)
+
+    async def fake_theme_embedding(theme):
+        return [1, 0]
+
+    service.get_theme_embedding = fake_theme_embedding
+    service.build_index(db)
+    results = asyncio.run(service.search_similar_stories(
+        db, "Pipo", top_k=2, min_similarity=0.5, min_score=7
+    ))
+    ids = [r["story_id"] for r in results]
+    assert ids[0] == "pipo"
+    assert results[0]["match"] == "hybrid"
+    assert ids[1] == "cercano"
+
+
+def test_hibrida_aplica_min_similarity_a_los_resultados_lexicos():
+    """Con embedding del tema, BM25 no cuela cuentos lejanos ni sin vector"""
+    db = _session()
+    _add_story(db, "cercano", "Un bosque", "Animales del bosque.", [1, 0], 9)
+    _add_story(db, "lejano", "El dragón Pipo", "Pipo vivía solo.", [0, 1], 9)
+    _add_story(db, "sin_vector", "Pipo otra vez", "Pipo y la luna.", None, 9)
+
+    service = RAGService(index_path=None)
+
+    async def fake_theme_embedding(theme):
+        return [1, 0]
+
+    service.get_theme_embedding = fake_theme_embedding
+    service.build_index(db)
+    results = asyncio.run(service.search_similar_stories(
+        db, "Pipo", top_k=3, min_similarity=0.5, min_score=7
+    ))
+    assert [r["story_id"] for r in results] == ["cercano"]
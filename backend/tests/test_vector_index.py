@@ -0,0 +1,191 @@
+"""
+Tests del índice vectorial en memoria usado por RAG.
+Ejecutar desde backend: pytest tests/test_vector_index.py
+"""
+import sys
+import os
+import inspect
+
+# Agregar el directorio backend al path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+import numpy as np
+import pytest
+from services.pgvector_index import PgChunkVectorIndex, PgVectorIndex
+from services.vector_index import VectorIndex, FlatVectorIndex, IVFFlatIndex, ChunkVectorIndex
+
+
+def _brute_force(ids, vectors, query, k):
+    """Referencia: similitud coseno calculada fila a fila."""
+    scored = []
+    for item_id, vec in zip(ids, vectors):
+        sim = float(np.dot(vec, query) / (np.linalg.norm(vec) * np.linalg.norm(query)))
+        scored.append((item_id, sim))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return scored[:k]
+
+
+def test_search_coincide_con_fuerza_bruta():
+    """El top-k del índice coincide con el cálculo coseno ingenuo"""
+    rng = np.random.default_rng(42)
+    vectors = rng.normal(size=(200, 64)).astype(np.float32)
+    ids = [f"story-{i}" for i in range(200)]
+    query = rng.normal(size=64)
+
+    index = FlatVectorIndex()
+    index.build(ids, vectors)
+
+    expected = _brute_force(ids, vectors, query, 5)
+    result = index.search(query, 5)
+
+    assert [r[0] for r in result] == [e[0] for e in expected]
+    for (_, got), (_, exp) in zip(result, expected):
+        assert abs(got - exp) < 1e-5
+
+
+def test_add_incremental_y_reemplazo():
+    """Las inserciones incrementales son visibles y un ID repetido se reemplaza"""
+    index = FlatVectorIndex()
+    index.build([], [])
+    for i in range(40):
+        vec = np.zeros(8)
+        vec[i % 8] = 1.0
+        assert index.add(f"s{i}", vec)
+
+    assert len(index) == 40
+    index.add("s0", [0, 0, 0, 0, 0, 0, 0, 1])
+    assert len(index) == 40
+    top = index.search([0, 0, 0, 0, 0, 0, 0, 1], 6)
+    assert "s0" in [item_id for item_id, _ in top]
+
+
+def test_remove_y_dimension_incorrecta():
+    """Eliminar mantiene la coherencia de IDs y se rechazan dimensiones distintas"""
+    index = FlatVectorIndex()
+    index.build(["a", "b", "c"], [[1, 0], [0, 1], [1, 1]])
+    assert index.remove("a")
+    assert not index.remove("a")
+    assert "a" not in index
+    assert index.search([1, 0], 1)[0][0] == "c"
+    assert not index.add("d", [1, 2, 3])
+    assert index.search([1, 2, 3], 1) == []
+
+
+def test_min_similarity_filtra_resultados():
+    """Los resultados por debajo de la similitud mínima se descartan"""
+    index = FlatVectorIndex()
+    index.build(["x", "y"], [[1, 0], [-1, 0]])
+    result = index.search([1, 0], 2, min_similarity=0.5)
+    assert result == [("x", 1.0)]
+
+
+def test_allowed_ids_restringe_candidatos():
+    """Con allowed_ids solo se puntúan las filas permitidas"""
+    index = FlatVectorIndex()
+    index.build(["a", "b", "c"], [[1, 0], [0.9, 0.1], [0, 1]])
+    result = index.search([1, 0], 2, allowed_ids={"b", "c", "desconocido"})
+    assert [item_id for item_id, _ in result] == ["b", "c"]
+    assert index.search([1, 0], 2, allowed_ids=set()) == []
+
+
+def _clustered(n, dim, clusters, seed=0):
+    """Datos sintéticos agrupados (parecidos a embeddings de temas)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(0, clusters, size=n)
+    return (centers[labels] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_ivf_recall_frente_a_fuerza_bruta():
+    """El IVF-Flat recupera casi todo el top-k exacto sondeando pocas listas"""
+    vectors = _clustered(3000, 32, 20)
+    ids = [f"s{i}" for i in range(3000)]
+    flat = FlatVectorIndex()
+    flat.build(ids, vectors)
+    ivf = IVFFlatIndex(nlist=40, nprobe=6)
+    ivf.build(ids, vectors)
+
+    queries = _clustered(50, 32, 20, seed=1)
+    hits = 0
+    for q in queries:
+        exact = {i for i, _ in flat.search(q, 10)}
+        approx = {i for i, _ in ivf.search(q, 10)}
+        hits += len(exact & approx)
+    assert hits / (10 * len(queries)) >= 0.9
+
+
+def test_ivf_add_remove_y_allowed_ids():
+    """Las inserciones y borrados mantienen las asignaciones a listas"""
+    vectors = _clustered(500, 16, 5)
+    ids = [f"s{i}" for i in range(500)]
+    ivf = IVFFlatIndex(nlist=10, nprobe=2)
+    ivf.build(ids, vectors)
+
+    ivf.add("nuevo", vectors[0])
+    assert ivf.search(vectors[0], 2)[0][1] > 0.999
+    assert ivf.remove("s0")
+    assert "s0" not in [i for i, _ in ivf.search(vectors[0], 5)]
+    assert len(ivf) == 500
+
+    # Reemplazar un vector ya agrupado lo mueve a la cola sin duplicarlo
+    ivf.add("s1", vectors[2])
+    assert len(ivf) == 500
+    assert set(ivf.ids()) == ({f"s{i}" for i in range(1, 500)} | {"nuevo"})
+    top = [i for i, _ in ivf.search(vectors[2], 3)]
+    assert "s1" in top and "s2" in top
+
+    # Un filtro muy selectivo nunca pierde resultados por el sondeo
+    result = ivf.search(vectors[0], 1, allowed_ids={"s499"})
+    assert result[0][0] == "s499"
+
+
+def test_save_y_load_conservan_el_indice(tmp_path):
+    """Un índice persistido se recarga con el mismo tipo y resultados"""
+    vectors = _clustered(400, 16, 4)
+    ids = [f"s{i}" for i in range(400)]
+    for index in (FlatVectorIndex(), IVFFlatIndex(nlist=8, nprobe=3)):
+        index.build(ids, vectors)
+        path = tmp_path / f"{index.index_type}.npz"
+        index.save(path)
+
+        loaded = VectorIndex.load(path)
+        assert type(loaded) is type(index)
+        assert len(loaded) == 400
+        assert loaded.search(vectors[7], 3) == index.search(vectors[7], 3)
+        loaded.add("extra", vectors[7])
+        assert "extra" in loaded
+        loaded.remove("s7")
+        loaded.save(path)
+        reloaded = VectorIndex.load(path)
+        assert "s7" not in reloaded and len(reloaded) == 400
+
+
+def test_chunks_agregan_por_cuento_max_y_media():
+    """La similitud de un cuento es la de su mejor fragmento o la media de los mejores"""
+    index = ChunkVectorIndex()
+    index.replace_group("a", [[1, 0], [0, 1], [0.6, 0.8]])
+    index.replace_group("b", [[0.9, 0.1], [0.9, 0.2]])
+
+    best = index.search_groups([1, 0], k=2)
+    assert [(g, c) for g, _, c in best] == [("a", 0), ("b", 0)]
+    assert best[0][1] == 1.0
+
+    mean = index.search_groups([1, 0], k=2, aggregate="mean_top", top_n=2)
+    assert [g for g, _, _ in mean] == ["b", "a"]  # a: (1.0 + 0.6) / 2 < b
+    assert index.search_groups([1, 0], k=5, allowed_groups={"b"})[0][0] == "b"
+
+    # Re-fragmentar un cuento sustituye todos sus fragmentos
+    index.replace_group("a", [[0, 1]])
+    assert len(index) == 3 and sorted(index.groups()) == ["a", "b"]
+    assert index.search_groups([0, 1], k=1)[0][:1] == ("a",)
+    index.remove(ChunkVectorIndex.item_id("a", 0))
+    assert index.groups() == ["b"]
+
+
+def test_interfaz_abstracta_implementada_por_todos_los_indices():
+    """VectorIndex es abstracta y cada índice (en memoria y pgvector) implementa toda la interfaz"""
+    with pytest.raises(TypeError):
+        VectorIndex()
+    for index_cls in (FlatVectorIndex, IVFFlatIndex, ChunkVectorIndex, PgVectorIndex, PgChunkVectorIndex):
+        assert not inspect.isabstract(index_cls), index_cls.__abstractmethods__
@@ -0,0 +1,32 @@
+# Worker de jobs en background (crítica, embeddings y síntesis de lecciones)
+# Uso (desde backend):  python worker.py
+# Con un worker separado, arrancar la API con JOBS_INPROCESS_WORKER=false.
+
+import asyncio
+import signal
+
+from models.database_sqlite import init_db
+from services.jobs import create_worker
+from services.learning_service import learning_service
+from services.synthesis_scheduler import synthesis_scheduler
+
+
+async def main():
+    init_db()
+    learning_service.import_legacy_json()
+    synthesis_scheduler.initialize()
+    worker = create_worker()
+    stop_event = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    await worker.run(stop_event)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
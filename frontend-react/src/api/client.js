@@ -139,15 +139,70 @@ export async function generateStory(data) {
   return result;
 }
 
-export async function getStories(limit = 20) {
+/**
+ * Genera un cuento en streaming (Server-Sent Events sobre POST).
+ * Llama a onTitle(title) y onToken(text) según llegan y resuelve con el cuento guardado.
+ */
+export async function generateStoryStream(data, { onTitle, onToken } = {}) {
+  console.log('[generateStoryStream] 🚀 Generando cuento en streaming con tema:', data.theme);
+  const base = getBaseUrl();
+  const res = await fetch(`${base}/api/stories/generate/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream', ...authHeaders() },
+    body: JSON.stringify(data),
+  });
+  console.log('[generateStoryStream] Response status:', res.status);
+  if (!res.ok) await handleResponse(res);
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let story = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      let payload = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) payload += line.slice(6);
+      }
+      const eventData = payload ? JSON.parse(payload) : {};
+      if (event === 'title') onTitle?.(eventData.title);
+      else if (event === 'token') onToken?.(eventData.text);
+      else if (event === 'done') story = eventData;
+      else if (event === 'error') {
+        console.error('[generateStoryStream] ❌ Error:', eventData.detail);
+        throw new Error(eventData.detail);
+      }
+    }
+  }
+
+  if (!story) throw new Error('La conexión se cerró antes de terminar el cuento.');
+  console.log('[generateStoryStream] ✅ Cuento generado:', story.title);
+  return story;
+}
+
+export async function getStories({ limit = 20, cursor = null, withCounts = false } = {}) {
   console.log('[getStories] 📚 Cargando cuentos guardados (limit:', limit + ')...');
   const base = getBaseUrl();
-  const res = await fetch(`${base}/api/stories?limit=${limit}`, {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (cursor) params.set('cursor', cursor);
+  if (withCounts) params.set('with_counts', 'true');
+  const res = await fetch(`${base}/api/stories?${params}`, {
     headers: authHeaders(),
   });
   console.log('[getStories] Response status:', res.status);
+  // { items, next_cursor, total, generated }: pasar next_cursor para la página siguiente
   const result = await handleResponse(res);
-  console.log('[getStories] ✅ Cuentos recibidos:', result.length, 'cuentos');
+  console.log('[getStories] ✅ Cuentos recibidos:', result.items.length, 'cuentos');
   return result;
 }
 
@@ -167,6 +222,16 @@ export async function getStoryCritiques(id) {
   return handleResponse(res);
 }
 
+// ─── Jobs (crítica, embeddings y síntesis en background) ───
+
+export async function getJob(jobId) {
+  const base = getBaseUrl();
+  const res = await fetch(`${base}/api/jobs/${jobId}`, {
+    headers: authHeaders(),
+  });
+  return handleResponse(res);
+}
+
 // ─── Characters ──────────────────────────────────────
 
 export async function getCharacters() {
@@ -248,10 +313,10 @@ export async function getLessons(category, statusFilter) {
   return handleResponse(res);
 }
 
-export async function synthesizeLessons(lastN = 5) {
+export async function synthesizeLessons() {
   const base = getBaseUrl();
   const res = await fetch(
-    `${base}/api/learning/synthesize?last_n_critiques=${lastN}`,
+    `${base}/api/learning/synthesize`,
     { method: 'POST', headers: authHeaders() }
   );
   return handleResponse(res);
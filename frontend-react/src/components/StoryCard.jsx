@@ -3,8 +3,9 @@ import { useNavigate } from 'react-router-dom'
 export default function StoryCard({ story }) {
   const navigate = useNavigate()
 
-  const preview =
-    story.content?.substring(0, 150) + (story.content?.length > 150 ? '...' : '')
+  // La biblioteca solo recibe un extracto; el detalle trae el contenido completo
+  const text = story.excerpt ?? story.content ?? ''
+  const preview = text.substring(0, 150) + (text.length > 150 ? '...' : '')
 
   const date = new Date(story.created_at).toLocaleDateString('es-ES', {
     year: 'numeric',
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react'
 import { Link } from 'react-router-dom'
-import { getCharacters, generateStory } from '../api/client'
+import { getCharacters, generateStoryStream } from '../api/client'
 import Spinner from '../components/Spinner'
 
 export default function Generator() {
@@ -49,14 +49,22 @@ export default function Generator() {
     setResult(null)
     setLoading(true)
     try {
-      const story = await generateStory({
-        theme,
-        character_names: selectedChars.length > 0 ? selectedChars : null,
-        moral_lesson: moralLesson || null,
-        target_age: targetAge ? parseInt(targetAge) : 6,
-        length,
-        special_elements: specialElements || null,
-      })
+      const story = await generateStoryStream(
+        {
+          theme,
+          character_names: selectedChars.length > 0 ? selectedChars : null,
+          moral_lesson: moralLesson || null,
+          target_age: targetAge ? parseInt(targetAge) : 6,
+          length,
+          special_elements: specialElements || null,
+        },
+        {
+          // Mostrar el cuento mientras se escribe
+          onTitle: (title) => setResult((prev) => ({ content: '', ...prev, title })),
+          onToken: (text) =>
+            setResult((prev) => ({ title: '', ...prev, content: (prev?.content || '') + text })),
+        },
+      )
       console.log('[Generator] ✅ Cuento generado exitosamente');
       setResult(story)
     } catch (err) {
@@ -164,7 +172,7 @@ export default function Generator() {
         </button>
       </form>
 
-      {loading && <Spinner text="Creando tu cuento mágico..." />}
+      {loading && !result && <Spinner text="Creando tu cuento mágico..." />}
 
       {error && (
         <div className="error">
@@ -177,12 +185,14 @@ export default function Generator() {
           <div className="result-content">
             <h3 className="story-title">{result.title}</h3>
             <div className="story-text">{result.content}</div>
-            <Link
-              to={`/cuentos/${result.id}`}
-              className="btn-primary btn-primary--spaced"
-            >
-              Ver en la biblioteca →
-            </Link>
+            {result.id && (
+              <Link
+                to={`/cuentos/${result.id}`}
+                className="btn-primary btn-primary--spaced"
+              >
+                Ver en la biblioteca →
+              </Link>
+            )}
           </div>
         </div>
       )}
@@ -64,7 +64,7 @@ export default function Learning() {
     setSynthesisResult(null)
     setError('')
     try {
-      const result = await synthesizeLessons(5)
+      const result = await synthesizeLessons()
       console.log('[Learning] ✅ Síntesis completada:', result);
       setSynthesisResult(result)
       loadData()
@@ -201,8 +201,9 @@ export default function Learning() {
 
       {synthesisResult && (
         <div className="success-message">
-          Síntesis completada: {synthesisResult.lessons_extracted} lecciones
-          extraídas de {synthesisResult.critiques_analyzed} críticas.
+          {synthesisResult.status === 'queued'
+            ? 'Síntesis en curso: las lecciones aparecerán al terminar.'
+            : `Síntesis completada: ${synthesisResult.lessons_extracted} lecciones extraídas de ${synthesisResult.critiques_analyzed} críticas.`}
         </div>
       )}
 
@@ -3,24 +3,26 @@ import { Link } from 'react-router-dom'
 import { getStories } from '../api/client'
 import StoryCard from '../components/StoryCard'
 import Spinner from '../components/Spinner'
-import Pagination from '../components/Pagination'
+
+const PAGE_SIZE = 12 // 12 cuentos por página
 
 export default function Library() {
   const [stories, setStories] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
+  const [counts, setCounts] = useState({ total: 0, generated: 0 })
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [error, setError] = useState('')
-  const [currentPage, setCurrentPage] = useState(1)
-  const itemsPerPage = 12 // 12 cuentos por página
 
   useEffect(() => {
     console.log('[Library] 📚 Cargando biblioteca de cuentos...');
-    getStories(50)
-      .then((data) => {
-        const sorted = [...data].sort(
-          (a, b) => new Date(b.created_at) - new Date(a.created_at)
-        )
-        setStories(sorted);
-        console.log('[Library] ✅ Biblioteca cargada:', sorted.length, 'cuentos');
+    // El backend devuelve los cuentos del más reciente al más antiguo
+    getStories({ limit: PAGE_SIZE, withCounts: true })
+      .then((page) => {
+        setStories(page.items);
+        setNextCursor(page.next_cursor);
+        setCounts({ total: page.total ?? page.items.length, generated: page.generated ?? 0 });
+        console.log('[Library] ✅ Biblioteca cargada:', page.items.length, 'de', page.total, 'cuentos');
       })
       .catch((err) => {
         console.error('[Library] ❌ Error:', err);
@@ -29,15 +31,19 @@ export default function Library() {
       .finally(() => setLoading(false))
   }, [])
 
-  // Calcular paginación
-  const totalPages = Math.ceil(stories.length / itemsPerPage)
-  const startIndex = (currentPage - 1) * itemsPerPage
-  const endIndex = startIndex + itemsPerPage
-  const paginatedStories = stories.slice(startIndex, endIndex)
-
-  const handlePageChange = (page) => {
-    setCurrentPage(page)
-    window.scrollTo({ top: 0, behavior: 'smooth' })
+  // Paginación por cursor: cada página continúa donde terminó la anterior
+  const handleLoadMore = () => {
+    setLoadingMore(true)
+    getStories({ limit: PAGE_SIZE, cursor: nextCursor })
+      .then((page) => {
+        setStories((prev) => [...prev, ...page.items])
+        setNextCursor(page.next_cursor)
+      })
+      .catch((err) => {
+        console.error('[Library] ❌ Error cargando más cuentos:', err);
+        setError(err.message);
+      })
+      .finally(() => setLoadingMore(false))
   }
 
   if (loading) return <Spinner text="Cargando cuentos..." />
@@ -56,7 +62,7 @@ export default function Library() {
   }
 
   const lastStory = stories[0]
-  const generatedCount = stories.filter((s) => !s.is_seed).length
+  const generatedCount = counts.generated
   const lastDate = lastStory
     ? new Date(lastStory.created_at).toLocaleDateString('es-ES', {
         day: 'numeric',
@@ -76,7 +82,7 @@ export default function Library() {
             <div className="library-summary-title">Tu colección</div>
             <div className="library-summary-details">
               <span className="library-detail">
-                <strong>{stories.length}</strong> {stories.length === 1 ? 'cuento' : 'cuentos'}
+                <strong>{counts.total}</strong> {counts.total === 1 ? 'cuento' : 'cuentos'}
               </span>
               {generatedCount > 0 && (
                 <span className="library-detail">
@@ -94,18 +100,23 @@ export default function Library() {
       </div>
 
       <div className="stories-list">
-        {paginatedStories.map((story) => (
+        {stories.map((story) => (
           <StoryCard key={story.id} story={story} />
         ))}
       </div>
 
-      <Pagination
-        currentPage={currentPage}
-        totalPages={totalPages}
-        onPageChange={handlePageChange}
-        totalItems={stories.length}
-        itemsPerPage={itemsPerPage}
-      />
+      <div className="pagination-container">
+        <div className="pagination-info">
+          Mostrando <strong>{stories.length}</strong> de <strong>{counts.total}</strong>
+        </div>
+        {nextCursor && (
+          <div className="pagination">
+            <button className="pagination-btn" onClick={handleLoadMore} disabled={loadingMore}>
+              {loadingMore ? 'Cargando...' : 'Cargar más cuentos ↓'}
+            </button>
+          </div>
+        )}
+      </div>
     </>
   )
 }